@@ -0,0 +1,158 @@
+"""Measure each stage of the camera pipeline without the camera.
+
+Frames come from a rendered plate, or a recording of the camera, at the
+robot camera's 1920x1280. Each stage is timed on its own and reported with
+its latency percentiles and throughput:
+
+- read: take a frame from the source
+- detect: find the fiducial markers
+- grid: locate the wells from the markers
+- drift: check that a cached calibration still holds
+- colors: measure all wells at once
+- colors by well: measure the wells one by one with the per-pixel loop
+- measure plate: read, check the calibration and measure all wells
+
+Results can be written as json and compared against an earlier run, which
+fails if a stage got slower than the tolerance allows, e.g. in CI:
+
+    python benchmarks/bench_camera.py --repeat 20 --json camera.json
+    python benchmarks/bench_camera.py --repeat 20 --baseline camera.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Callable, Dict, List
+
+from ot2util.camera import Camera, _gray
+from ot2util.capture import (
+    FrameSource,
+    ImageDirectorySource,
+    SyntheticPlateSource,
+    VideoSource,
+)
+
+
+def _time(stage: Callable[[], object], repeat: int) -> List[float]:
+    stage()  # Warm up
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies)
+    return {
+        "mean_ms": mean * 1e3,
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1e3,
+        "per_s": 1 / mean,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of each stage")
+    parser.add_argument("--video", help="Replay a recording instead of a rendering")
+    parser.add_argument("--images", help="Replay a directory of frames instead")
+    parser.add_argument(
+        "--marker-order",
+        type=int,
+        nargs=4,
+        help="Marker ids in the order wells are located from, "
+        "by default 0 to 3 for the rendering, detection order otherwise",
+    )
+    parser.add_argument(
+        "--by-well", type=int, default=2, help="Runs of the well by well stage"
+    )
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Compare against results of an earlier run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Fraction a stage may be slower than the baseline",
+    )
+    args = parser.parse_args()
+
+    source: FrameSource
+    marker_order = args.marker_order
+    if args.video:
+        source = VideoSource(args.video, loop=True)
+    elif args.images:
+        source = ImageDirectorySource(args.images, loop=True)
+    else:
+        source = SyntheticPlateSource()
+        marker_order = marker_order or [0, 1, 2, 3]
+
+    camera = Camera(source=source, marker_order=marker_order)
+    ret, frame = source.read()
+    calibration = camera.calibrate(frame)
+    corners, ids = Camera._detect_markers(_gray(frame))
+    if marker_order is not None:
+        corners = [dict(zip(ids, corners))[i] for i in marker_order]
+
+    def grid() -> None:
+        Camera._well_centers(*Camera._find_fiducial(corners))
+
+    def by_well() -> None:
+        for letter in "ABCDEFGH":
+            for column in range(1, 13):
+                coordinate = camera._convert_coordinate(f"{letter}{column}")
+                camera._get_color(
+                    frame, *calibration.geometry, coordinate  # type: ignore[misc]
+                )
+
+    stages: Dict[str, Callable[[], object]] = {
+        "read": lambda: source.read(frame),
+        "detect": lambda: Camera._detect_markers(_gray(frame)),
+        "grid": grid,
+        "drift": lambda: calibration.drifted(_gray(frame)),
+        "colors": lambda: Camera._colors_at(
+            frame, calibration.centers, calibration.radius
+        ),
+        "colors by well": by_well,
+        "measure plate": camera.measure_plate,
+    }
+    height, width = frame.shape[:2]
+    print(f"{width}x{height} frames from {type(source).__name__}")
+    results = {}
+    for name, stage in stages.items():
+        repeat = args.by_well if name == "colors by well" else args.repeat
+        result = _summary(_time(stage, repeat))
+        results[name] = result
+        print(
+            f"{name:15s} mean {result['mean_ms']:8.2f} ms  "
+            f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"{result['per_s']:8.1f}/s"
+        )
+    camera.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = [
+            name
+            for name, result in results.items()
+            if name in baseline
+            and result["p50_ms"] > baseline[name]["p50_ms"] * (1 + args.tolerance)
+        ]
+        for name in slower:
+            print(
+                f"{name} regressed: p50 {results[name]['p50_ms']:.2f} ms, "
+                f"baseline {baseline[name]['p50_ms']:.2f} ms"
+            )
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measure how quickly a released robot is handed to the next queued experiment.
+
+Hundreds of threads wait for a few robots, each holds its robot briefly
+and releases it. The dispatch latency is the time between a robot being
+released and the next experiment waking up with it:
+
+    python benchmarks/bench_dispatch.py --robots 4 --submissions 500
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+from ot2util.experiment import Robot
+from ot2util.scheduling import RobotDispatcher
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=4, help="Robots to share")
+    parser.add_argument(
+        "--submissions", type=int, default=500, help="Experiments waiting for a robot"
+    )
+    parser.add_argument(
+        "--hold", type=float, default=0.001, help="Seconds each experiment runs"
+    )
+    args = parser.parse_args()
+
+    robots = [Robot(run_local=True) for _ in range(args.robots)]
+    dispatcher = RobotDispatcher(robots)
+    released_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    lock = threading.Lock()
+    start = threading.Event()
+
+    def experiment() -> None:
+        start.wait()
+        robot = dispatcher.acquire()
+        acquired_at = time.perf_counter()
+        with lock:
+            if id(robot) in released_at:
+                latencies.append(acquired_at - released_at[id(robot)])
+        time.sleep(args.hold)
+        with lock:
+            released_at[id(robot)] = time.perf_counter()
+        dispatcher.release(robot)
+
+    threads = [threading.Thread(target=experiment) for _ in range(args.submissions)]
+    for thread in threads:
+        thread.start()
+    begin = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+
+    ideal = args.submissions * args.hold / args.robots
+    latencies.sort()
+    print(
+        f"{args.submissions} submissions on {args.robots} robots, "
+        f"{args.hold * 1e3:.1f} ms each"
+    )
+    print(
+        f"dispatch latency  mean {statistics.mean(latencies) * 1e6:8.1f} us  "
+        f"median {statistics.median(latencies) * 1e6:8.1f} us  "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:8.1f} us"
+    )
+    print(f"total {elapsed:6.3f} s, ideal {ideal:6.3f} s")
+
+
+if __name__ == "__main__":
+    main()
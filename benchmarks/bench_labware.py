@@ -0,0 +1,187 @@
+"""Measure how quickly wells and tips are handed out across a fleet of robots.
+
+Each experiment picks a random robot, checks which consumables it has left,
+as the scheduler does before dispatching, and takes a well and a few tips.
+The stream is run twice, with the bitmap allocator and with plates walked
+by well name as labware used to be allocated. A second stream exercises
+what only the bitmaps support: several plates and racks per robot, some
+experiments cancelled and handing their labware back, and 8-channel steps
+taking whole columns:
+
+    python benchmarks/bench_labware.py --robots 64 --plates 4 --experiments 100000
+"""
+
+import argparse
+import random
+import time
+from typing import List, Optional, Set
+
+from ot2util.labware import TipRack, WellPlate
+
+
+def _next_location(cur_location: str) -> Optional[str]:
+    if cur_location == "init":
+        return "A1"
+    letter = cur_location[0]
+    number = cur_location[1:]
+    if number == "12":
+        number = "1"
+        letter = chr(ord(letter) + 1)
+    else:
+        number = str(int(number) + 1)
+    # A 96 well plate has rows A to H
+    if letter == "I":
+        return None
+    return letter + number
+
+
+class _NamedLabware:
+    """Hands out wells or tips by walking their names, skipping reserved ones."""
+
+    def __init__(self, reserved: Set[str]) -> None:
+        self.reserved = reserved
+        self.well: Optional[str] = "init"
+
+    def get_open_well(self) -> Optional[str]:
+        while True:
+            assert self.well is not None
+            self.well = _next_location(self.well)
+            if self.well is None or self.well not in self.reserved:
+                return self.well
+
+    def get_tips(self, n: int) -> List[Optional[str]]:
+        return [self.get_open_well() for _ in range(n)]
+
+    def remaining(self) -> int:
+        count = 0
+        well = self.well
+        while well is not None:
+            well = _next_location(well)
+            count += well is not None and well not in self.reserved
+        return count
+
+    def reset(self) -> None:
+        self.well = "init"
+
+
+def _percentiles(latencies: List[float]) -> str:
+    latencies.sort()
+    return (
+        f"mean {sum(latencies) / len(latencies) * 1e6:6.2f} us  "
+        f"p50 {latencies[len(latencies) // 2] * 1e6:6.2f} us  "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:6.2f} us"
+    )
+
+
+def _schedule(
+    plates: List, tipracks: List, tips: int, experiments: int, seed: int
+) -> List[float]:
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(experiments):
+        robot = rng.randrange(len(plates))
+        plate, tiprack = plates[robot], tipracks[robot]
+        start = time.perf_counter()
+        if plate.remaining() < 1 or tiprack.remaining() < tips:
+            # Swap in a fresh plate and rack
+            plate.reset()
+            tiprack.reset()
+        plate.get_open_well()
+        tiprack.get_tips(tips)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _fleet(
+    plates: List[WellPlate],
+    tipracks: List[TipRack],
+    tips: int,
+    cancel: float,
+    experiments: int,
+    seed: int,
+) -> List[float]:
+    rng = random.Random(seed)
+    latencies = []
+    for i in range(experiments):
+        robot = rng.randrange(len(plates))
+        plate, tiprack = plates[robot], tipracks[robot]
+        start = time.perf_counter()
+        if plate.remaining() < 8 or tiprack.remaining() < 8:
+            plate.reset()
+            tiprack.reset()
+        if i % 100 == 0:
+            well = plate.allocate_column()
+            used = tiprack.allocate_column()
+        else:
+            well = plate.allocate()
+            used = tiprack.allocate(tips)
+        if rng.random() < cancel:
+            if well is not None:
+                plate.release(well)
+            if used is not None:
+                tiprack.release(used)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=64, help="Robots in the fleet")
+    parser.add_argument(
+        "--plates", type=int, default=4, help="Plates and racks per robot"
+    )
+    parser.add_argument(
+        "--experiments", type=int, default=100000, help="Experiments to allocate for"
+    )
+    parser.add_argument("--tips", type=int, default=3, help="Tips per experiment")
+    parser.add_argument(
+        "--reserved", type=int, default=24, help="Reserved wells on each plate"
+    )
+    parser.add_argument(
+        "--cancel", type=float, default=0.1, help="Fraction of experiments cancelled"
+    )
+    args = parser.parse_args()
+
+    # Reserve the first columns, e.g. for source colors
+    reserved = {"ABCDEFGH"[i % 8] + str(i // 8 + 1) for i in range(args.reserved)}
+    print(f"{args.experiments} experiments on {args.robots} robots")
+
+    latencies = _schedule(
+        [_NamedLabware(reserved) for _ in range(args.robots)],
+        [_NamedLabware(set()) for _ in range(args.robots)],
+        args.tips,
+        args.experiments,
+        seed=0,
+    )
+    print(f"by name  {_percentiles(latencies)}")
+
+    latencies = _schedule(
+        [WellPlate(reserved) for _ in range(args.robots)],
+        [TipRack() for _ in range(args.robots)],
+        args.tips,
+        args.experiments,
+        seed=0,
+    )
+    print(f"bitmap   {_percentiles(latencies)}")
+
+    slots = [str(slot) for slot in range(1, 2 * args.plates + 1)]
+    latencies = _fleet(
+        [
+            WellPlate(reserved, locations=slots[: args.plates])
+            for _ in range(args.robots)
+        ],
+        [TipRack(locations=slots[args.plates :]) for _ in range(args.robots)],
+        args.tips,
+        args.cancel,
+        args.experiments,
+        seed=0,
+    )
+    print(
+        f"{args.plates} plates and racks each, {args.cancel:.0%} cancelled, "
+        f"1% by column"
+    )
+    print(f"bitmap   {_percentiles(latencies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Measure the per-file latency of copying files to and from a robot.
+
+Compares reusing the SFTP channel of the open connection against opening a
+new ssh connection for every file, which is what forking :code:`scp` does.
+Runs against a local stand-in for the robot's ssh server:
+
+    python benchmarks/bench_transfer.py --files 50 --size 4096 --latency 0.005
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+from typing import Callable, List
+
+from sshd import LocalSSHServer
+
+from ot2util.config import ProtocolConfig
+from ot2util.experiment import Experiment, RobotConnection
+
+
+def _time_each(func: Callable[[int], None], n: int) -> List[float]:
+    times = []
+    for i in range(n):
+        start = time.perf_counter()
+        func(i)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _report(name: str, times: List[float]) -> None:
+    print(
+        f"{name:<28} mean {statistics.mean(times) * 1e3:8.2f} ms  "
+        f"median {statistics.median(times) * 1e3:8.2f} ms  "
+        f"total {sum(times):6.2f} s"
+    )
+
+
+def _stream_compressed(
+    conn: RobotConnection, compression: str, workdir: Path, experiment: Experiment
+) -> None:
+    conn.stream_compression = compression
+    conn._stream_transfer(experiment, workdir, workdir / "protocol.py")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50, help="Files to copy")
+    parser.add_argument("--size", type=int, default=4096, help="Bytes per file")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added per connection"
+    )
+    args = parser.parse_args()
+
+    # The stand-in server logs every connection the client closes
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    with LocalSSHServer(
+        latency=args.latency
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        local = Path(tmp) / "local"
+        remote = Path(tmp) / "remote"
+        local.mkdir()
+        for i in range(args.files):
+            (local / f"file-{i}.dat").write_bytes(b"x" * args.size)
+
+        def connect() -> RobotConnection:
+            return RobotConnection(
+                remote, server.host, server.port, server.key_filename, transfer="sftp"
+            )
+
+        conn = connect()
+        put_times = _time_each(
+            lambda i: conn.put(local / f"file-{i}.dat", remote / f"file-{i}.dat"),
+            args.files,
+        )
+        get_times = _time_each(
+            lambda i: conn.get(remote / f"file-{i}.dat", local / f"copy-{i}.dat"),
+            args.files,
+        )
+
+        def put_new_connection(i: int) -> None:
+            # Mimics scp: a new ssh handshake for every file
+            fresh = connect()
+            fresh.put(local / f"file-{i}.dat", remote / f"fresh-{i}.dat")
+            fresh.conn.close()
+
+        fresh_times = _time_each(put_new_connection, args.files)
+
+        # Pull a whole experiment workdir back with each result transfer
+        workdir = remote / "experiment"
+        workdir.mkdir()
+        for i in range(args.files):
+            (workdir / f"result-{i}.dat").write_bytes(os.urandom(args.size))
+        (workdir / "protocol.py").write_text("protocol")
+
+        results = {}
+        methods = {
+            "sftp get_dir": lambda e: conn._scp_transfer(e, workdir, remote_protocol),
+            "tar archive on remote": lambda e: conn._tar_transfer(
+                e, workdir, remote_protocol
+            ),
+            "tar stream (none)": lambda e: conn._stream_transfer(
+                e, workdir, remote_protocol
+            ),
+        }
+        for compression in ["gzip", "zstd"]:
+            methods[f"tar stream ({compression})"] = partial(
+                _stream_compressed, conn, compression, workdir
+            )
+        remote_protocol = workdir / "protocol.py"
+        for name, method in methods.items():
+            # The workdir on the robot is named after the experiment
+            output_dir = Path(tmp) / name.replace(" ", "-")
+            output_dir.mkdir()
+            experiment = Experiment(workdir.name, output_dir, ProtocolConfig())
+            start = time.perf_counter()
+            try:
+                method(experiment)
+            except ImportError as e:
+                print(f"Skipping {name}: {e}")
+                continue
+            results[name] = time.perf_counter() - start
+        conn.conn.close()
+
+        print(f"{args.files} files of {args.size} bytes, {args.latency}s latency")
+        _report("sftp put (shared channel)", put_times)
+        _report("sftp get (shared channel)", get_times)
+        _report("put (new connection)", fresh_times)
+        for name, elapsed in results.items():
+            print(f"{name:<28} total {elapsed:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
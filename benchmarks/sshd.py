@@ -0,0 +1,274 @@
+"""A local stand-in for the ssh server running on the OT2 raspberry pi.
+
+Serves shell commands, SFTP and port forwarding to localhost so that
+:class:`ot2util.experiment.RobotConnection` can be benchmarked without
+a robot. Any public key is accepted, use :meth:`LocalSSHServer.key_filename`
+to connect.
+
+Example
+-------
+>>> with LocalSSHServer() as server:
+...     conn = RobotConnection("/tmp/remote", server.host, server.port, server.key_filename)
+"""
+
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import paramiko
+
+
+class _LocalSFTPHandle(paramiko.SFTPHandle):
+    def stat(self) -> Any:
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class _LocalSFTPServer(paramiko.SFTPServerInterface):
+    def list_folder(self, path: str) -> Any:
+        try:
+            out = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(
+                    os.lstat(os.path.join(path, name))
+                )
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path: str) -> Any:
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path: str) -> Any:
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path: str, flags: int, attr: Any) -> Any:
+        try:
+            fd = os.open(path, flags | getattr(os, "O_BINARY", 0), 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        f = os.fdopen(fd, mode)
+        handle = _LocalSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path: str) -> Any:
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath: str, newpath: str) -> Any:
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path: str, attr: Any) -> Any:
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path: str) -> Any:
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path: str, attr: Any) -> Any:
+        return paramiko.SFTP_OK
+
+
+def _pump(src: Any, send: Any) -> None:
+    for chunk in iter(lambda: src.read1(32768), b""):
+        send(chunk)
+
+
+def _exec(channel: paramiko.Channel, command: str) -> None:
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    def feed_stdin() -> None:
+        assert proc.stdin is not None
+        try:
+            for chunk in iter(lambda: channel.recv(32768), b""):
+                proc.stdin.write(chunk)
+                proc.stdin.flush()
+            proc.stdin.close()
+        except (OSError, EOFError):
+            pass
+
+    threads = [
+        threading.Thread(target=feed_stdin, daemon=True),
+        threading.Thread(target=_pump, args=(proc.stdout, channel.sendall)),
+        threading.Thread(target=_pump, args=(proc.stderr, channel.sendall_stderr)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads[1:]:
+        thread.join()
+    channel.send_exit_status(proc.wait())
+    channel.close()
+
+
+def _forward(channel: paramiko.Channel, destination: Tuple[str, int]) -> None:
+    try:
+        sock = socket.create_connection(destination)
+    except OSError:
+        channel.close()
+        return
+
+    def to_channel() -> None:
+        _pump(sock.makefile("rb"), channel.sendall)
+        channel.shutdown_write()
+
+    thread = threading.Thread(target=to_channel, daemon=True)
+    thread.start()
+    for chunk in iter(lambda: channel.recv(32768), b""):
+        sock.sendall(chunk)
+    sock.shutdown(socket.SHUT_WR)
+    thread.join()
+    sock.close()
+    channel.close()
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self) -> None:
+        self.forwards: Dict[int, Tuple[str, int]] = {}
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "publickey"
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_direct_tcpip_request(
+        self, chanid: int, origin: Tuple[str, int], destination: Tuple[str, int]
+    ) -> int:
+        self.forwards[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(
+        self, channel: paramiko.Channel, command: bytes
+    ) -> bool:
+        threading.Thread(
+            target=_exec, args=(channel, command.decode()), daemon=True
+        ).start()
+        return True
+
+
+class LocalSSHServer:
+    """Minimal ssh server on localhost supporting exec and SFTP."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """Initialize the server, call :meth:`start` or use it as a context manager.
+
+        Parameters
+        ----------
+        latency : float, optional
+            Seconds to delay each accepted connection by, to mimic
+            connecting to the robot over WiFi, by default 0.
+        """
+        self.latency = latency
+        self.host = "127.0.0.1"
+        self._tmp = tempfile.TemporaryDirectory()
+        self.key_filename = str(Path(self._tmp.name) / "id_rsa")
+        paramiko.RSAKey.generate(2048).write_private_key_file(self.key_filename)
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, 0))
+        self.port: int = self._sock.getsockname()[1]
+        self._transports: List[paramiko.Transport] = []
+        self._thread: Optional[threading.Thread] = None
+        self.connections = 0
+
+    def start(self) -> None:
+        """Start accepting connections in a background thread."""
+        self._sock.listen(100)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            if self.latency:
+                threading.Event().wait(self.latency)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self._host_key)
+            transport.set_subsystem_handler(
+                "sftp", paramiko.SFTPServer, _LocalSFTPServer
+            )
+            server = _Server()
+            transport.start_server(server=server)
+            self._transports.append(transport)
+            threading.Thread(
+                target=self._accept_forwards, args=(transport, server), daemon=True
+            ).start()
+
+    def _accept_forwards(self, transport: paramiko.Transport, server: _Server) -> None:
+        # Port forwards are handed out by accept, sessions are handled by
+        # their exec and subsystem requests.
+        while transport.is_active():
+            channel = transport.accept(timeout=1)
+            if channel is None or channel.get_id() not in server.forwards:
+                continue
+            destination = server.forwards.pop(channel.get_id())
+            threading.Thread(
+                target=_forward, args=(channel, destination), daemon=True
+            ).start()
+
+    def stop(self) -> None:
+        """Close all connections and stop the server."""
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+        self._tmp.cleanup()
+
+    def __enter__(self) -> "LocalSSHServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
@@ -62,10 +62,13 @@ class GridSearch(Agent):
 
             # After running the experiment, read the experiment result file
             if not cfg.run_simulation:
-                # Find destination wells and measure their color
+                # Measure all wells from one frame, then look up the destinations
+                plate_rgb, plate_hsv = self.camera.measure_plate()
                 for destination_well in cfg.destination_wells:
-
-                    rgb, hsv = self.camera.measure_well_color(destination_well)
+                    row = ord(destination_well[0]) - ord("A")
+                    column = int(destination_well[1:]) - 1
+                    rgb = tuple(plate_rgb[row, column])
+                    hsv = tuple(plate_hsv[row, column])
                     # TODO: How should we end up storing this information?
                     # And how do we make it accessible to the agent?
                     print(
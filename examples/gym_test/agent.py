@@ -41,11 +41,14 @@ class GridSearch(Agent):
         for itr, colors in enumerate(itertools.combinations(sourcecolors, 3)):
             name = f"experiment-{itr:0{self.num_experiments}d}"
             self.workflow.action(name, colors, volumes)
-            if (itr + 1) % 2 == 0:
-                experiments = self.workflow.wait()
-                for experiment in experiments:
+            # Submit the next experiment as soon as any robot is done
+            if len(self.workflow.futures) >= len(self.workflow.robots):
+                for experiment in self.workflow.wait(min_count=1):
                     logger.info(experiment)
 
+        for experiment in self.workflow.as_completed():
+            logger.info(experiment)
+
 
 if __name__ == "__main__":
     args = parse_args()
@@ -0,0 +1,224 @@
+"""Archive the camera frames measurements were taken from.
+
+Frames are kept for auditing, but drawing overlays and encoding images
+does not belong on the measurement path. :meth:`FrameArchive.submit` only
+queues the raw frame with the measurement, a background thread draws the
+wells and markers and writes the image to the experiment's output
+directory. Frames are dropped when the queue is full.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from ot2util.config import PathLike
+
+if TYPE_CHECKING:
+    import cv2
+
+    from ot2util.camera import FiducialCalibration
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jpg", "png", "mjpeg")
+"""Image formats of a :class:`FrameArchive`, "mjpeg" appends the JPEG
+frames of an experiment to a single motion JPEG segment."""
+
+
+class ArchivedFrame(NamedTuple):
+    """A frame waiting to be written."""
+
+    frame: np.ndarray
+    """The raw frame as captured."""
+    output_dir: Path
+    """Output directory of the experiment."""
+    label: str
+    """What was measured, e.g. a well name or "plate"."""
+    measurement: Dict[str, Any]
+    """Json serializable measured values."""
+    calibration: Optional["FiducialCalibration"]
+    """Where the markers and wells are in the frame."""
+    timestamp: float
+    """When the measurement was taken, in seconds since the epoch."""
+
+
+def annotate(
+    frame: "cv2.Mat",
+    calibration: Optional["FiducialCalibration"],
+    measurement: Dict[str, Any],
+) -> "cv2.Mat":
+    """Draw the measured wells and markers on the frame the colors were measured in.
+
+    Parameters
+    ----------
+    frame : cv2.Mat
+        The raw frame.
+    calibration : Optional[FiducialCalibration]
+        Where the markers and wells are, nothing is drawn without it.
+    measurement : Dict[str, Any]
+        Measured values, an :code:`"rgb"` color of a single well is shown
+        next to the plate.
+
+    Returns
+    -------
+    cv2.Mat
+        The frame resized like for measuring colors, with overlays.
+    """
+    import cv2
+
+    height, width = frame.shape[:2]
+    img = cv2.resize(frame, (640, 480))
+    if calibration is not None:
+        # Markers were found in the raw frame, wells in the resized one
+        scale = np.array([640 / width, 480 / height])
+        for corners in calibration.corners:
+            points = (corners * scale).astype(np.int32).reshape(-1, 1, 2)
+            cv2.polylines(img, [points], True, (255, 0, 0), 1)
+        radius = int(calibration.radius)
+        for center in calibration.centers.reshape(-1, 2):
+            cv2.circle(img, tuple(int(c) for c in center), radius, (0, 255, 0), 1)
+    rgb = measurement.get("rgb")
+    if rgb is not None and np.ndim(rgb) == 1:
+        text = f"RGB: {tuple(rgb)}"
+        cv2.putText(img, text, (210, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2)
+        cv2.rectangle(img, (100, 50), (200, 150), tuple(int(c) for c in rgb), 10)
+    return img
+
+
+class FrameArchive:
+    """Write annotated frames to the output directories of experiments.
+
+    Each output directory gets a :code:`frames` directory holding the
+    images, or a :code:`frames.mjpeg` segment, and a :code:`frames.jsonl`
+    file with the measurement of each frame.
+    """
+
+    def __init__(
+        self, format: str = "jpg", max_queued: int = 16, quality: int = 90
+    ) -> None:
+        """Start the writer thread.
+
+        Parameters
+        ----------
+        format : str, optional
+            One of :obj:`FORMATS`, by default "jpg".
+        max_queued : int, optional
+            Frames waiting to be written, further frames are dropped,
+            by default 16.
+        quality : int, optional
+            JPEG quality from 0 to 100, by default 90.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown archive format: {format}")
+        self.format = format
+        self.quality = quality
+        self.dropped = 0
+        """Number of frames dropped because the queue was full."""
+        self._queue: "queue.Queue[Optional[ArchivedFrame]]" = queue.Queue(max_queued)
+        self._counts: Dict[Path, int] = {}
+        self._thread = threading.Thread(
+            target=self._write_frames, name="frame-archive", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        frame: "cv2.Mat",
+        output_dir: PathLike,
+        label: str,
+        measurement: Dict[str, Any],
+        calibration: Optional["FiducialCalibration"] = None,
+    ) -> bool:
+        """Queue a frame to be annotated and written.
+
+        The frame is copied, it may be a view into the ring buffer of a
+        :class:`FrameGrabber`.
+
+        Returns
+        -------
+        bool
+            False if the frame was dropped because the queue is full.
+        """
+        archived = ArchivedFrame(
+            np.array(frame),
+            Path(output_dir),
+            label,
+            measurement,
+            calibration,
+            time.time(),
+        )
+        try:
+            self._queue.put_nowait(archived)
+        except queue.Full:
+            self.dropped += 1
+            logger.debug(f"Archive queue full, dropped frame {label}")
+            return False
+        return True
+
+    def _write_frames(self) -> None:
+        while True:
+            archived = self._queue.get()
+            if archived is None:
+                return
+            try:
+                self._write(archived)
+            except Exception:
+                logger.exception(f"Failed to archive frame {archived.label}")
+
+    def _write(self, archived: ArchivedFrame) -> None:
+        import cv2
+
+        img = annotate(archived.frame, archived.calibration, archived.measurement)
+        extension = "png" if self.format == "png" else "jpg"
+        params = [] if extension == "png" else [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        ret, encoded = cv2.imencode(f".{extension}", img, params)
+        if not ret:
+            raise ValueError("Could not encode frame")
+
+        index = self._counts.get(archived.output_dir)
+        if index is None:
+            # Continue after the frames archived by an earlier run
+            index = self._count_archived(archived.output_dir)
+        self._counts[archived.output_dir] = index + 1
+        record = {
+            "index": index,
+            "label": archived.label,
+            "timestamp": archived.timestamp,
+            "measurement": archived.measurement,
+        }
+        archived.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.format == "mjpeg":
+            path = archived.output_dir / "frames.mjpeg"
+            record["offset"] = path.stat().st_size if path.exists() else 0
+            with open(path, "ab") as f:
+                f.write(encoded.tobytes())
+        else:
+            path = (
+                archived.output_dir
+                / "frames"
+                / f"{index:05d}-{archived.label}.{extension}"
+            )
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(encoded.tobytes())
+            record["file"] = str(path.relative_to(archived.output_dir))
+        with open(archived.output_dir / "frames.jsonl", "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def _count_archived(output_dir: Path) -> int:
+        path = output_dir / "frames.jsonl"
+        if not path.exists():
+            return 0
+        with open(path) as f:
+            return sum(1 for _ in f)
+
+    def close(self) -> None:
+        """Write the queued frames and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,148 @@
+"""Run several experiments within a single protocol run.
+
+Batched protocols import this module on the robot, so it should stay light.
+Each experiment of the batch is run with its own config file and writes
+its logs and returncode into its own workdir.
+"""
+
+import os
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from ot2util.config import CONFIG_ENV, BatchConfig, BatchEntryConfig
+
+BATCH_ENV = "OT2UTIL_BATCH"
+"""Environment variable holding the path of the batch config file."""
+RETURNCODE_FILE = "returncode"
+"""File each experiment of a batch writes its returncode to."""
+
+
+def read_returncode(workdir: Path, default: int = -1) -> int:
+    """Read the returncode an experiment of a batch wrote to its workdir.
+
+    Parameters
+    ----------
+    workdir : Path
+        Directory the experiment was run in.
+    default : int, optional
+        Returncode to use if the experiment never ran, by default -1.
+
+    Returns
+    -------
+    int
+        The returncode of the experiment.
+    """
+    path = workdir / RETURNCODE_FILE
+    if not path.exists():
+        return default
+    return int(path.read_text())
+
+
+class _BatchProtocolContext:
+    """Share loaded labware, instruments and modules between experiments.
+
+    Each experiment loads its own deck layout, loading into an occupied
+    slot or mount raises a deck conflict so repeated loads return the first
+    one. Tip racks of repeated instrument loads are added to the pipette,
+    experiments may use racks the earlier ones did not.
+    """
+
+    _LOAD_METHODS = {
+        # Method name: the argument, and its position, which is loaded into
+        "load_labware": ("location", 1),
+        "load_instrument": ("mount", 1),
+        "load_module": ("location", 1),
+    }
+
+    def __init__(self, protocol: Any) -> None:
+        self._protocol = protocol
+        self._loaded: Dict[str, Any] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._protocol, name)
+        if name not in self._LOAD_METHODS:
+            return attr
+        field, position = self._LOAD_METHODS[name]
+
+        def load(*args: Any, **kwargs: Any) -> Any:
+            location = _argument(args, kwargs, field, position)
+            if location is None:
+                # Modules like the thermocycler have a fixed location
+                location = _argument(args, kwargs, "module_name", 0)
+            key = repr((name, location))
+            if key not in self._loaded:
+                self._loaded[key] = attr(*args, **kwargs)
+            elif name == "load_instrument":
+                pipette = self._loaded[key]
+                tip_racks = _argument(args, kwargs, "tip_racks", 2) or []
+                new = [rack for rack in tip_racks if rack not in pipette.tip_racks]
+                if new:
+                    pipette.tip_racks = list(pipette.tip_racks) + new
+            return self._loaded[key]
+
+        return load
+
+
+def _argument(
+    args: Tuple[Any, ...], kwargs: Dict[str, Any], name: str, position: int
+) -> Any:
+    if name in kwargs:
+        return kwargs[name]
+    return args[position] if len(args) > position else None
+
+
+def _echo_command(message: Any) -> None:
+    # Simulations only print the runlog once the whole protocol has finished,
+    # so echo commands as they happen to keep per experiment logs.
+    if message["$"] == "before":
+        print(message["payload"].get("text", ""))
+
+
+def _run_experiment(
+    protocol: Any, run_func: Callable[[Any], None], entry: BatchEntryConfig
+) -> int:
+    os.environ[CONFIG_ENV] = str(entry.config)
+    with open(entry.workdir / "stdout.log", "w") as out, open(
+        entry.workdir / "stderr.log", "w"
+    ) as err, redirect_stdout(out), redirect_stderr(err):
+        unsubscribe = None
+        if protocol.is_simulating():
+            unsubscribe = protocol.broker.subscribe("command", _echo_command)
+        try:
+            run_func(protocol)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            if unsubscribe is not None:
+                unsubscribe()
+    return 0
+
+
+def run_batch(protocol: Any, run_func: Callable[[Any], None]) -> None:
+    """Run :obj:`run_func` once for each experiment of the batch.
+
+    The batch config is read from the path in the :code:`OT2UTIL_BATCH`
+    environment variable. The batch stops at the first failed experiment
+    so that the deck can be inspected, the remaining experiments will not
+    write a returncode.
+
+    Parameters
+    ----------
+    protocol : opentrons.protocol_api.ProtocolContext
+        The protocol context passed to the protocol run function.
+    run_func : Callable[[ProtocolContext], None]
+        The run function of a single experiment.
+    """
+    batch = BatchConfig.from_yaml(os.environ[BATCH_ENV])
+    protocol = _BatchProtocolContext(protocol)
+    for entry in batch.experiments:
+        entry.workdir.mkdir(parents=True, exist_ok=True)
+        returncode = _run_experiment(protocol, run_func, entry)
+        (entry.workdir / RETURNCODE_FILE).write_text(str(returncode))
+        if returncode != 0:
+            print(f"Experiment in {entry.workdir} failed", file=sys.stderr)
+            break
@@ -0,0 +1,485 @@
+"""Share the robots of one workflow between several agent processes.
+
+A :class:`RobotPool` belongs to a single process, two agents using the
+same robots would clash over their workdirs and labware state. The broker
+owns the pool and the robots, agents submit experiments to it over a
+socket on localhost with a :class:`BrokerClient`. Start it with::
+
+    python -m ot2util.broker -c workflow.yaml
+
+Robots are shared fairly: whenever a robot frees up, the next experiment
+is taken from the waiting client with the fewest running experiments
+relative to its weight. Each client can be limited to a number of running
+and queued experiments, see :class:`ClientQuotaConfig`.
+
+Messages use the frames of :mod:`ot2util.daemon` with json payloads.
+"""
+
+import argparse
+import itertools
+import json
+import socket
+import socketserver
+import threading
+from collections import deque
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional, Tuple
+
+from ot2util.config import ClientQuotaConfig
+from ot2util.daemon import REQUEST, recv_frame, send_frame
+
+if TYPE_CHECKING:
+    from ot2util.experiment import Experiment, RobotPool
+
+RESULT = b"d"
+"""Frame sent by the broker once a submitted experiment is done."""
+
+
+class BrokerError(RuntimeError):
+    """Raised by :class:`BrokerClient` for experiments which failed in the broker."""
+
+
+class QuotaExceededError(BrokerError):
+    """Raised for submissions beyond the quota of a client."""
+
+
+class ExperimentResult(NamedTuple):
+    """A finished experiment as seen by a :class:`BrokerClient`."""
+
+    name: str
+    """Name of the experiment, prefixed with the client name."""
+    returncode: int
+    """Exit code of the protocol."""
+    output_dir: Path
+    """Directory holding the logs and results of the experiment."""
+
+
+class _Submission(NamedTuple):
+    name: str
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    future: "Future[Experiment]"
+
+
+class Broker:
+    """Run experiments of several clients on a shared :class:`RobotPool`."""
+
+    def __init__(
+        self,
+        pool: "RobotPool",
+        quotas: Optional[Dict[str, ClientQuotaConfig]] = None,
+        default_quota: ClientQuotaConfig = ClientQuotaConfig(),
+        max_in_flight: Optional[int] = None,
+    ) -> None:
+        """Initialize the broker.
+
+        Parameters
+        ----------
+        pool : RobotPool
+            The pool running the experiments.
+        quotas : Optional[Dict[str, ClientQuotaConfig]], optional
+            Quota of each client, keyed by client name.
+        default_quota : ClientQuotaConfig, optional
+            Quota of clients not listed in :obj:`quotas`, unlimited by default.
+        max_in_flight : Optional[int], optional
+            Maximum number of experiments handed to :obj:`pool` at once, by
+            default the number of robots. Experiments beyond it wait in
+            the broker, where fair sharing applies.
+        """
+        self.pool = pool
+        self.quotas = quotas or {}
+        self.default_quota = default_quota
+        self.max_in_flight = max_in_flight or len(pool.robots)
+        self._queues: Dict[str, "deque[_Submission]"] = {}
+        self._running: Dict[str, int] = {}
+        self._last_served: Dict[str, int] = {}
+        self._turns = itertools.count()
+        self._in_flight = 0
+        self._dispatching = False
+        self._lock = threading.Lock()
+
+    def quota(self, client: str) -> ClientQuotaConfig:
+        """The quota of :obj:`client`."""
+        return self.quotas.get(client, self.default_quota)
+
+    def running(self, client: str) -> int:
+        """Number of experiments of :obj:`client` handed to the pool."""
+        return self._running.get(client, 0)
+
+    def submit(
+        self, client: str, name: str, *args: Any, **kwargs: Any
+    ) -> "Future[Experiment]":
+        """Queue an experiment of a client.
+
+        Parameters
+        ----------
+        client : str
+            Name of the submitting client, without "-". The experiment is
+            named :code:`<client>-<name>` so that clients can not clash.
+        name : str
+            Name of the experiment.
+        *args : Any
+            Arguments of the experiment, see :meth:`RobotPool.submit`.
+        **kwargs : Any
+            Keyword arguments of the experiment.
+
+        Returns
+        -------
+        Future[Experiment]
+            Resolves once the experiment has finished. Cancel it to remove
+            the experiment from the queue if it has not started yet.
+
+        Raises
+        ------
+        QuotaExceededError
+            If the client already has :obj:`ClientQuotaConfig.max_queued`
+            experiments waiting.
+        ValueError
+            If the client name contains "-".
+        """
+        _check_client(client)
+        quota = self.quota(client)
+        future: Future[Experiment] = Future()
+        submission = _Submission(f"{client}-{name}", args, kwargs, future)
+        with self._lock:
+            queue = self._queues.setdefault(client, deque())
+            if quota.max_queued is not None and len(queue) >= quota.max_queued:
+                raise QuotaExceededError(
+                    f"Client {client} already has {len(queue)} experiments queued"
+                )
+            queue.append(submission)
+        future.add_done_callback(partial(self._discard, client, submission))
+        self._dispatch()
+        return future
+
+    def _discard(self, client: str, submission: _Submission, future: Future) -> None:
+        if not future.cancelled():
+            return
+        with self._lock:
+            try:
+                self._queues[client].remove(submission)
+            except ValueError:
+                pass
+
+    def _next(self) -> Optional[Tuple[str, _Submission]]:
+        # Called with the lock held
+        candidates = []
+        for client, queue in self._queues.items():
+            max_running = self.quota(client).max_running
+            if queue and (max_running is None or self.running(client) < max_running):
+                candidates.append(client)
+        if not candidates:
+            return None
+        # The client using the smallest share of its weight goes first,
+        # ties go to the client which was served least recently.
+        client = min(
+            candidates,
+            key=lambda client: (
+                self.running(client) / self.quota(client).weight,
+                self._last_served.get(client, -1),
+            ),
+        )
+        self._last_served[client] = next(self._turns)
+        return client, self._queues[client].popleft()
+
+    def _dispatch(self) -> None:
+        # Results of the pool may be known already, e.g. from its journal,
+        # then its done callbacks run right away and dispatch again. Only
+        # one thread dispatches at a time, in a loop instead of recursing.
+        with self._lock:
+            if self._dispatching:
+                return
+            self._dispatching = True
+        while True:
+            started = []
+            with self._lock:
+                while self._in_flight < self.max_in_flight:
+                    selected = self._next()
+                    if selected is None:
+                        break
+                    client, submission = selected
+                    if not submission.future.set_running_or_notify_cancel():
+                        continue
+                    self._running[client] = self.running(client) + 1
+                    self._in_flight += 1
+                    started.append(selected)
+                if not started:
+                    self._dispatching = False
+                    return
+            # Done callbacks of the pool may run right away and take the lock
+            for client, submission in started:
+                try:
+                    pool_future = self.pool.submit(
+                        submission.name, *submission.args, **submission.kwargs
+                    )
+                except BaseException as e:
+                    submission.future.set_exception(e)
+                    self._done(client)
+                    continue
+                pool_future.add_done_callback(
+                    partial(self._finished, client, submission.future)
+                )
+
+    def _finished(
+        self, client: str, future: "Future[Experiment]", pool_future: Future
+    ) -> None:
+        from ot2util.experiment import _copy_future
+
+        try:
+            _copy_future(pool_future, future)
+        finally:
+            self._done(client)
+
+    def _done(self, client: str) -> None:
+        with self._lock:
+            self._running[client] -= 1
+            self._in_flight -= 1
+        self._dispatch()
+
+
+def _check_client(client: str) -> None:
+    # "a-b" submitting "c" and "a" submitting "b-c" would both run "a-b-c"
+    if "-" in client:
+        raise ValueError(f'Client names can not contain "-": {client}')
+
+
+def _invalid(request: Any) -> Optional[str]:
+    # Why a request can not be submitted, None if it can
+    if not isinstance(request, dict):
+        return "expected a json object"
+    fields = [("client", str, None), ("name", str, None), ("args", list, [])]
+    for field, kind, default in fields + [("kwargs", dict, {})]:
+        if not isinstance(request.get(field, default), kind):
+            return f"expected {field} to be a {kind.__name__}"
+    if "-" in request["client"]:
+        return 'client names can not contain "-"'
+    return None
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: "BrokerServer"
+
+    def handle(self) -> None:
+        lock = threading.Lock()
+        futures = []
+        try:
+            while True:
+                kind, payload = recv_frame(self.request)
+                if kind != REQUEST:
+                    raise ValueError(f"Expected a request frame, got {kind!r}")
+                future = self._submit(payload, lock)
+                if future is not None:
+                    futures.append(future)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            # Experiments of a disconnected client which have not started
+            # are dropped, the others finish for the robot's sake.
+            for future in futures:
+                future.cancel()
+
+    def _submit(
+        self, payload: bytes, lock: threading.Lock
+    ) -> Optional["Future[Experiment]"]:
+        try:
+            request = json.loads(payload)
+        except ValueError:
+            request = None
+
+        def reply(response: Dict[str, Any]) -> None:
+            response["id"] = request.get("id") if isinstance(request, dict) else None
+            try:
+                with lock:
+                    send_frame(self.request, RESULT, json.dumps(response).encode())
+            except OSError:
+                pass
+
+        def resolve(future: "Future[Experiment]") -> None:
+            if future.cancelled():
+                return
+            exception = future.exception()
+            if exception is not None:
+                reply({"error": str(exception)})
+                return
+            experiment = future.result()
+            reply(
+                {
+                    "name": experiment.name,
+                    "returncode": experiment.returncode,
+                    "output_dir": str(experiment.output_dir.resolve()),
+                }
+            )
+
+        error = _invalid(request)
+        if error is not None:
+            reply({"error": f"Malformed request: {error}"})
+            return None
+        try:
+            future = self.server.broker.submit(
+                request["client"],
+                request["name"],
+                *request.get("args", []),
+                **request.get("kwargs", {}),
+            )
+        except QuotaExceededError as e:
+            reply({"error": str(e), "quota": True})
+            return None
+        future.add_done_callback(resolve)
+        return future
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    """Accept submissions for a :class:`Broker` on localhost."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, broker: Broker, port: int = 0) -> None:
+        """Listen for clients, call :meth:`serve_forever` to serve them.
+
+        Parameters
+        ----------
+        broker : Broker
+            The broker running submitted experiments.
+        port : int, optional
+            Port on localhost to listen on, by default a free port, see
+            :obj:`port`.
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.broker = broker
+
+    @property
+    def port(self) -> int:
+        """The port the server listens on."""
+        port: int = self.server_address[1]
+        return port
+
+
+class BrokerClient:
+    """Submit experiments to a broker running on this machine."""
+
+    def __init__(self, client: str, port: int, host: str = "127.0.0.1") -> None:
+        """Connect to the broker.
+
+        Parameters
+        ----------
+        client : str
+            Name of this client, which selects its quota, without "-".
+        port : int
+            Port the broker listens on.
+        host : str, optional
+            Host the broker listens on, by default localhost.
+        """
+        _check_client(client)
+        self.client = client
+        self.sock = socket.create_connection((host, port))
+        self._futures: Dict[int, Future[ExperimentResult]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def __enter__(self) -> "BrokerClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Disconnect, experiments which have not started are dropped."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._reader.join()
+
+    def submit(
+        self, name: str, *args: Any, **kwargs: Any
+    ) -> "Future[ExperimentResult]":
+        """Submit an experiment, see :meth:`Broker.submit`.
+
+        The arguments need to be json serializable.
+
+        Returns
+        -------
+        Future[ExperimentResult]
+            Resolves once the experiment has finished, raises
+            :class:`QuotaExceededError` if the broker rejected it and
+            :class:`BrokerError` if it failed.
+        """
+        future: Future[ExperimentResult] = Future()
+        request = {
+            "client": self.client,
+            "name": name,
+            "args": list(args),
+            "kwargs": kwargs,
+        }
+        with self._lock:
+            request["id"] = next(self._ids)
+            self._futures[request["id"]] = future
+            send_frame(self.sock, REQUEST, json.dumps(request).encode())
+        return future
+
+    def _read(self) -> None:
+        try:
+            while True:
+                kind, payload = recv_frame(self.sock)
+                if kind != RESULT:
+                    raise ValueError(f"Unexpected frame {kind!r}")
+                response = json.loads(payload)
+                with self._lock:
+                    future = self._futures.pop(response.get("id"), None)
+                if future is None:
+                    # Not a reply to a request of this client
+                    continue
+                if "error" not in response:
+                    future.set_result(
+                        ExperimentResult(
+                            response["name"],
+                            response["returncode"],
+                            Path(response["output_dir"]),
+                        )
+                    )
+                elif response.get("quota"):
+                    future.set_exception(QuotaExceededError(response["error"]))
+                else:
+                    future.set_exception(BrokerError(response["error"]))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(BrokerError("Lost the connection to the broker"))
+
+
+def main() -> None:
+    """Share the robots of a color mixing workflow, see :class:`BrokerServer`."""
+    from ot2util.workflow import ColorMixingWorkflow, ColorMixingWorkflowConfig
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-c", "--config", type=Path, required=True, help="Workflow YAML config file"
+    )
+    parser.add_argument("--port", type=int, help="Overrides broker.port")
+    args = parser.parse_args()
+
+    config = ColorMixingWorkflowConfig.from_yaml(args.config)
+    config.output_dir.mkdir(exist_ok=True)
+    workflow = ColorMixingWorkflow(config)
+    broker = Broker(
+        workflow.robot_pool,
+        config.broker.quotas,
+        config.broker.default_quota,
+        config.broker.max_in_flight,
+    )
+    port = config.broker.port if args.port is None else args.port
+    with BrokerServer(broker, port) as server:
+        print(f"Listening on port {server.port}", flush=True)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Content-addressed caches for files generated while preparing experiments.
+"""
+
+import fnmatch
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from ot2util.config import PathLike
+
+
+def hash_strings(*parts: str) -> str:
+    """Compute a stable content hash over several strings.
+
+    Parameters
+    ----------
+    *parts : str
+        The strings to hash. Their order matters.
+
+    Returns
+    -------
+    str
+        Hex digest of the sha256 hash of the length-prefixed parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        # Length prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Hardlink :obj:`src` to :obj:`dst`, falling back to a copy.
+
+    A copy is made if the files live on different filesystems or
+    the filesystem does not support hardlinks.
+    """
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _atomic_write(path: Path, contents: str) -> None:
+    # Write to a temporary file in the same directory and rename it into
+    # place so concurrent readers never observe a partially written file.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ProtocolCache:
+    """Content-addressed store of generated protocol files with LRU eviction.
+
+    Protocol files are rendered from the same source code for every
+    experiment of a workflow, only the :code:`config.yaml` changes.
+    Files are stored under the hash of their inputs so that a cache hit
+    can copy the already formatted protocol into the experiment directory
+    instead of rendering it again. The modification time of a file
+    records when it was last used.
+    """
+
+    def __init__(self, cache_dir: PathLike, max_entries: int = 256) -> None:
+        """Initialize the cache.
+
+        Parameters
+        ----------
+        cache_dir : PathLike
+            Directory to store the cached protocol files in, created
+            if it does not exist.
+        max_entries : int, optional
+            Least recently used files are removed once more than this
+            many are cached, by default 256.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.py"
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the cached file for :obj:`key` or None if not cached."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key: str, source_code: str) -> Path:
+        """Store :obj:`source_code` under :obj:`key` and return its path."""
+        path = self._path(key)
+        _atomic_write(path, source_code)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: Path) -> None:
+        entries = []
+        for path in self.cache_dir.glob("*.py"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                # Evicted concurrently
+                continue
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.max_entries, 0)]:
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _copy_files(src: Path, dst: Path, excludes: Sequence[str] = ()) -> None:
+    # Copy rather than link, results may be modified after the run
+    for path in src.rglob("*"):
+        if not path.is_file():
+            continue
+        if any(fnmatch.fnmatch(path.name, pattern) for pattern in excludes):
+            continue
+        target = dst / path.relative_to(src)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+class ResultCache:
+    """Content-addressed store of simulation results with LRU eviction.
+
+    Simulating the same protocol with the same config always gives the
+    same results, so a repeated simulation restores the stored logs and
+    artifacts into the new output directory instead of running again.
+    Each entry is a directory named after the key, its modification time
+    records when it was last used.
+    """
+
+    def __init__(self, cache_dir: PathLike, max_bytes: int = 1 << 30) -> None:
+        """Initialize the cache.
+
+        Parameters
+        ----------
+        cache_dir : PathLike
+            Directory to store the cached results in, created if it
+            does not exist.
+        max_bytes : int, optional
+            Least recently used entries are removed once the cached
+            results take up more than this, by default 1 GiB.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups which were restored from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: str, output_dir: Path) -> bool:
+        """Restore the results stored under :obj:`key` into :obj:`output_dir`.
+
+        Returns
+        -------
+        bool
+            True if the results were cached, otherwise nothing is restored.
+        """
+        entry = self.cache_dir / key
+        with self._lock:
+            if not entry.is_dir():
+                self.misses += 1
+                return False
+            self.hits += 1
+            os.utime(entry)
+            _copy_files(entry, output_dir)
+        return True
+
+    def put(self, key: str, output_dir: Path, excludes: Sequence[str] = ()) -> None:
+        """Store the results in :obj:`output_dir` under :obj:`key`.
+
+        Parameters
+        ----------
+        key : str
+            Hash of the inputs of the simulation.
+        output_dir : Path
+            Directory the simulation wrote its results to.
+        excludes : Sequence[str], optional
+            Glob patterns of files to leave out, e.g. the inputs of the simulation.
+        """
+        tmp = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=f".{key}."))
+        try:
+            _copy_files(output_dir, tmp, excludes)
+            with self._lock:
+                # Directories can not be replaced atomically if they exist,
+                # an entry stored concurrently is just as good.
+                if not (self.cache_dir / key).exists():
+                    os.replace(tmp, self.cache_dir / key)
+                self._evict()
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for entry in self.cache_dir.iterdir():
+            if entry.is_dir() and not entry.name.startswith("."):
+                entries.append((entry.stat().st_mtime, _dir_size(entry), entry))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -2,14 +2,225 @@
 """
 
 import colorsys
-from typing import Tuple
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-import cv2
-import cv2.aruco
 import numpy as np
 
+from ot2util.archive import FrameArchive
+from ot2util.capture import DeviceSource, FrameGrabber, FrameSource
+from ot2util.config import PathLike
+
+if TYPE_CHECKING:
+    # OpenCV is imported where it is used to keep importing ot2util fast
+    import cv2
+
+logger = logging.getLogger(__name__)
+
 ColorRGB = Tuple[int, int, int]
 ColorHSV = Tuple[float, float, float]
+Geometry = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+"""Center of the bottom right and top left wells and the offsets between
+rows and columns, as returned by :meth:`Camera._find_fiducial`."""
+
+
+def _hsv_to_rgb(hsv: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized :func:`colorsys.hsv_to_rgb` over the last axis."""
+    h, s, v = np.moveaxis(hsv, -1, 0)
+    i = (h * 6.0).astype(int)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    gray = s == 0.0
+    r = np.where(gray, v, np.choose(i, [v, q, p, p, t, v]))
+    g = np.where(gray, v, np.choose(i, [t, v, v, q, p, p]))
+    b = np.where(gray, v, np.choose(i, [p, p, t, v, v, q]))
+    return r, g, b
+
+
+ARUCO_DICTIONARY = "DICT_4X4_250"
+"""Predefined ArUco dictionary of the fiducial markers."""
+
+
+@lru_cache(maxsize=None)
+def _aruco() -> Callable[[np.ndarray], Tuple[Any, Any, Any]]:
+    """Marker detection, created once with the API of the installed OpenCV."""
+    import cv2.aruco
+
+    dictionary = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, ARUCO_DICTIONARY))
+    if hasattr(cv2.aruco, "ArucoDetector"):
+        # OpenCV 4.7 and later
+        detector = cv2.aruco.ArucoDetector(dictionary, cv2.aruco.DetectorParameters())
+        return detector.detectMarkers  # type: ignore[no-any-return]
+    parameters = cv2.aruco.DetectorParameters_create()
+    return lambda gray: cv2.aruco.detectMarkers(gray, dictionary, parameters=parameters)
+
+
+def _gray(img: "cv2.Mat") -> np.ndarray:
+    import cv2
+
+    if len(img.shape) == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+
+def _correlation(a: np.ndarray, b: np.ndarray) -> float:
+    """Normalized cross-correlation of two patches of the same shape."""
+    a = a.astype(float) - a.mean()
+    b = b.astype(float) - b.mean()
+    norm = np.sqrt((a * a).sum() * (b * b).sum())
+    if norm == 0:
+        # Flat patches only match each other
+        return float(np.array_equal(a, b))
+    return float((a * b).sum() / norm)
+
+
+class FiducialCalibration:
+    """Where the fiducial markers and wells are in the frames of a fixed camera.
+
+    Found once by :meth:`Camera.calibrate` and reused for later frames as
+    long as the image patches around the markers still look the same.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        corners: np.ndarray,
+        geometry: Geometry,
+        patches: List[np.ndarray],
+        margin: int = 8,
+    ) -> None:
+        """Initialize the calibration, use :meth:`from_frame` to take the patches.
+
+        Parameters
+        ----------
+        ids : Sequence[int]
+            ArUco ids of the markers.
+        corners : np.ndarray
+            Corners of each marker, shape :code:`(markers, 4, 2)`.
+        geometry : Geometry
+            Well grid found from the markers.
+        patches : List[np.ndarray]
+            Grayscale image around each marker when it was calibrated.
+        margin : int, optional
+            Pixels around the markers included in the patches, by default 8.
+        """
+        self.ids = [int(i) for i in ids]
+        self.corners = np.asarray(corners, dtype=float).reshape(-1, 4, 2)
+        self.geometry = geometry
+        self.patches = patches
+        self.margin = margin
+        self.centers = Camera._well_centers(*geometry)
+        """Pixel coordinates of each well center, shape :code:`(8, 12, 2)`."""
+        self.radius = geometry[2][0] // 3
+        """Half the size of the square sampled around each well center."""
+
+    @classmethod
+    def from_frame(
+        cls,
+        gray: np.ndarray,
+        ids: Sequence[int],
+        corners: np.ndarray,
+        geometry: Geometry,
+        margin: int = 8,
+    ) -> "FiducialCalibration":
+        """Calibrate from a grayscale frame in which the markers were found."""
+        corners = np.asarray(corners, dtype=float).reshape(-1, 4, 2)
+        patches = [gray[box] for box in cls._boxes(corners, gray.shape, margin)]
+        return cls(ids, corners, geometry, patches, margin)
+
+    @staticmethod
+    def _boxes(
+        corners: np.ndarray, shape: Tuple[int, ...], margin: int
+    ) -> List[Tuple[slice, slice]]:
+        boxes = []
+        for marker in corners:
+            low = np.maximum(marker.min(axis=0).astype(int) - margin, 0)
+            high = marker.max(axis=0).astype(int) + margin + 1
+            boxes.append((slice(low[1], high[1]), slice(low[0], high[0])))
+        return boxes
+
+    def similarity(self, gray: np.ndarray) -> List[float]:
+        """Correlation of each marker patch with the same region of a frame."""
+        boxes = self._boxes(self.corners, gray.shape, self.margin)
+        scores = []
+        for box, patch in zip(boxes, self.patches):
+            current = gray[box]
+            if current.shape != patch.shape:
+                # The frame size changed
+                scores.append(-1.0)
+            else:
+                scores.append(_correlation(current, patch))
+        return scores
+
+    def drifted(self, gray: np.ndarray, threshold: float = 0.8) -> bool:
+        """Whether the markers moved since calibration.
+
+        A single marker hidden by the pipette head does not count as drift,
+        only if most of them changed the median correlation drops below
+        :obj:`threshold`.
+        """
+        return float(np.median(self.similarity(gray))) < threshold
+
+    def warp(self, homography: np.ndarray, gray: np.ndarray) -> "FiducialCalibration":
+        """Move the calibration along with the markers, e.g. after the camera was bumped.
+
+        Parameters
+        ----------
+        homography : np.ndarray
+            Maps pixel coordinates of the calibrated frame to the new frame.
+        gray : np.ndarray
+            Grayscale new frame, to take the marker patches from.
+        """
+        import cv2
+
+        def transform(points: np.ndarray) -> np.ndarray:
+            points = np.asarray(points, dtype=float).reshape(-1, 1, 2)
+            return cv2.perspectiveTransform(points, homography).reshape(-1, 2)
+
+        center_br, center_origin, diameter_x, diameter_y = self.geometry
+        origin, br, step_x, step_y = transform(
+            np.stack(
+                [
+                    center_origin,
+                    center_br,
+                    center_origin + diameter_x,
+                    center_origin + diameter_y,
+                ]
+            )
+        )
+        geometry = (br, origin, step_x - origin, step_y - origin)
+        corners = transform(self.corners).reshape(-1, 4, 2)
+        return self.from_frame(gray, self.ids, corners, geometry, self.margin)
+
+    def save(self, path: PathLike) -> None:
+        """Write the calibration to a numpy :code:`.npz` file."""
+        np.savez(
+            path,
+            ids=np.array(self.ids),
+            corners=self.corners,
+            geometry=np.stack(self.geometry),
+            margin=self.margin,
+            **{f"patch_{i}": patch for i, patch in enumerate(self.patches)},
+        )
+
+    @classmethod
+    def load(cls, path: PathLike) -> "FiducialCalibration":
+        """Read a calibration written by :meth:`save`."""
+        with np.load(path) as data:
+            ids = data["ids"].tolist()
+            geometry = tuple(data["geometry"])
+            patches = [data[f"patch_{i}"] for i in range(len(ids))]
+            return cls(
+                ids,
+                data["corners"],
+                geometry,  # type: ignore[arg-type]
+                patches,
+                int(data["margin"]),
+            )
 
 
 class Camera:
@@ -24,30 +235,88 @@ class Camera:
         y = int(well[1:]) - 1
         return x, y
 
-    def __init__(self, camera_id: int = 2) -> None:
+    def __init__(
+        self,
+        camera_id: int = 2,
+        calibration: Optional[FiducialCalibration] = None,
+        drift_threshold: float = 0.8,
+        buffered_frames: int = 0,
+        archive: Optional[FrameArchive] = None,
+        source: Optional[FrameSource] = None,
+        marker_order: Optional[Sequence[int]] = None,
+    ) -> None:
         """Initializes camera object with correct settings for the camera on top of the OT2.
 
         Parameters
         ----------
         camera_id : int, optional
             ID of the camera on top of the OT2, by default 2
+        calibration : Optional[FiducialCalibration], optional
+            Calibration of an earlier run, see :meth:`FiducialCalibration.load`.
+            By default the markers are found in the first frame measured.
+        drift_threshold : float, optional
+            Markers are found again once the median correlation of the
+            calibrated marker patches with a frame drops below it,
+            by default 0.8.
+        buffered_frames : int, optional
+            Capture frames on a background thread into a ring buffer of
+            this size and measure the latest one, see :class:`FrameGrabber`.
+            By default frames are read when measuring.
+        archive : Optional[FrameArchive], optional
+            Writes the frames measured in to the output directory passed
+            to the measurement, by default they are not kept.
+        source : Optional[FrameSource], optional
+            Where frames come from, e.g. a recording to replay, by default
+            the camera :obj:`camera_id`.
+        marker_order : Optional[Sequence[int]], optional
+            Ids of the 4 markers in the order the wells are located from,
+            by default the order they are detected in.
+        """
+        self.calibration = calibration
+        self.drift_threshold = drift_threshold
+        self.archive = archive
+        self.marker_order = marker_order
+
+        self.cap = source if source is not None else DeviceSource(camera_id)
+        self.grabber = (
+            FrameGrabber(self.cap, buffered_frames) if buffered_frames else None
+        )
+
+    def read(self) -> "cv2.Mat":
+        """A current frame, the latest one captured if frames are buffered.
+
+        Buffered frames are copied out of the ring buffer, the capture
+        thread may overwrite their slot while a frame is being measured.
         """
-        self.cap = cv2.VideoCapture(camera_id)
-        self.cap.set(3, 1920)
-        self.cap.set(4, 1280)
-        self.cap.set(5, 30)  # Set frame rate to 30 fps
-        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc("M", "J", "P", "G"))
-        self.cap.set(cv2.CAP_PROP_BRIGHTNESS, 40)  # Set brightness -64 - 64  0.0
-        self.cap.set(cv2.CAP_PROP_CONTRAST, 50)  # Set contrast -64 - 64  2.0
-        self.cap.set(cv2.CAP_PROP_EXPOSURE, 156)  # Set exposure 1.0 - 5000  156.0
-
-    def measure_well_color(self, destination_well: str) -> Tuple[ColorRGB, ColorHSV]:
+        while self.grabber is not None:
+            frame = self.grabber.latest_frame()
+            image = frame.image.copy()
+            # Copy again if the slot was overwritten while copying
+            if self.grabber.valid(frame):
+                return image
+        ret, frame = self.cap.read()
+        if not ret:
+            raise RuntimeError("Capture device returned no frame")
+        return frame
+
+    def close(self) -> None:
+        """Stop capturing and release the capture device."""
+        if self.grabber is not None:
+            self.grabber.close()
+        self.cap.release()
+
+    def measure_well_color(
+        self, destination_well: str, output_dir: Optional[PathLike] = None
+    ) -> Tuple[ColorRGB, ColorHSV]:
         """Measures the RGB values of the destination well. Gives RGB and HSV values
 
         Parameters
         ----------
         destination_well : str
             The coordinate string (e.g :code:`"A1"`) of the well we want to measure
+        output_dir : Optional[PathLike], optional
+            Output directory of the experiment to archive the frame in, if
+            the camera has an :obj:`archive`.
 
         Returns
         -------
@@ -58,33 +327,180 @@ class Camera:
         # Find target well
         coordinate = self._convert_coordinate(destination_well)
 
-        ret, frame = self.cap.read()
-        (
-            frame1,
-            center_br,
-            center_origin,
-            diameter_x,
-            diameter_y,
-        ) = self._find_draw_fiducial(frame)
-        frame2, rgb, hsv = self._get_color(
-            frame, center_br, center_origin, diameter_x, diameter_y, coordinate
+        frame = self.read()
+        calibration = self._calibrated(frame)
+        _, rgb, hsv = self._get_color(
+            frame, *calibration.geometry, coordinate  # type: ignore[misc]
         )
-        text = f"RGB: {rgb}"
-        frame2 = cv2.putText(
-            frame2, text, (210, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2
+        self._archive(
+            frame,
+            output_dir,
+            destination_well,
+            {"rgb": list(rgb), "hsv": list(hsv)},
         )
-        frame2 = cv2.rectangle(frame2, (100, 50), (200, 150), rgb, 10)
+        return rgb, hsv
 
-        # TODO: Originally the frames were saved,
-        # See commit https://github.com/braceal/ot2util/commit/b2346e42a3688917f94d27bd118d9d9dc1d45e8f
-        # For details on what was happening. I have removed it for now
-        # Can we get rid of the frame logic now? Is it good for logging?
+    def measure_plate(
+        self, output_dir: Optional[PathLike] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Measure the color of every well of the plate from a single frame.
 
+        Parameters
+        ----------
+        output_dir : Optional[PathLike], optional
+            Output directory of the experiment to archive the frame in, if
+            the camera has an :obj:`archive`.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            RGB integer values and HSV float values of each well as arrays
+            of shape :code:`(8, 12, 3)`, indexed by row and column, e.g.
+            :code:`rgb[0, 1]` is the color of well :code:`"A2"`. They match
+            the values returned by :meth:`measure_well_color`.
+        """
+        frame = self.read()
+        calibration = self._calibrated(frame)
+        rgb, hsv = Camera._colors_at(frame, calibration.centers, calibration.radius)
+        self._archive(
+            frame, output_dir, "plate", {"rgb": rgb.tolist(), "hsv": hsv.tolist()}
+        )
         return rgb, hsv
 
+    def _archive(
+        self,
+        frame: "cv2.Mat",
+        output_dir: Optional[PathLike],
+        label: str,
+        measurement: Dict[str, Any],
+    ) -> None:
+        if self.archive is not None and output_dir is not None:
+            self.archive.submit(frame, output_dir, label, measurement, self.calibration)
+
+    def calibrate(self, frame: Optional["cv2.Mat"] = None) -> FiducialCalibration:
+        """Find the markers and wells, and reuse them for later frames.
+
+        Parameters
+        ----------
+        frame : Optional[cv2.Mat], optional
+            Frame showing all markers, by default a new one is captured.
+
+        Returns
+        -------
+        FiducialCalibration
+            The new calibration, save it to skip this step in later runs.
+        """
+        if frame is None:
+            frame = self.read()
+        gray = _gray(frame)
+        corners, ids = self._detect_markers(gray)
+        if self.marker_order is not None:
+            found = dict(zip(ids, corners))
+            if not set(self.marker_order) <= set(found):
+                raise ValueError("No markers found")
+            ids = list(self.marker_order)
+            corners = [found[i] for i in ids]
+        geometry = self._find_fiducial(corners)
+        self.calibration = FiducialCalibration.from_frame(
+            gray, ids, np.array(corners), geometry
+        )
+        return self.calibration
+
+    def _calibrated(self, frame: "cv2.Mat") -> FiducialCalibration:
+        """The calibration of a frame, finding the markers again if they moved."""
+        import cv2
+
+        if self.calibration is None:
+            return self.calibrate(frame)
+        gray = _gray(frame)
+        if not self.calibration.drifted(gray, self.drift_threshold):
+            return self.calibration
+
+        corners, ids = self._detect_markers(gray)
+        if len(corners) == 4:
+            logger.info("Fiducial markers moved, calibrating again")
+            return self.calibrate(frame)
+        # Some markers are hidden, e.g. by the pipette head. Move the
+        # calibration along with the markers which are still visible.
+        known = {
+            i: marker
+            for i, marker in zip(self.calibration.ids, self.calibration.corners)
+        }
+        matched = [(known[i], marker) for i, marker in zip(ids, corners) if i in known]
+        if not matched:
+            raise ValueError("No markers found")
+        logger.info(f"Fiducial markers moved, following {len(matched)} of them")
+        source = np.concatenate([old for old, _ in matched]).reshape(-1, 1, 2)
+        target = np.concatenate([new for _, new in matched]).reshape(-1, 1, 2)
+        homography, _ = cv2.findHomography(source, target)
+        if homography is None:
+            raise ValueError("Markers found do not match the calibration")
+        self.calibration = self.calibration.warp(homography, gray)
+        return self.calibration
+
+    @staticmethod
+    def _detect_markers(gray: np.ndarray) -> Tuple[List[np.ndarray], List[int]]:
+        """Corners of each marker, shape :code:`(4, 2)`, and their ids."""
+        corners, ids, rejectedImgPoints = _aruco()(gray)
+        if ids is None:
+            return [], []
+        return [c.reshape(4, 2) for c in corners], ids.reshape(-1).tolist()
+
+    @staticmethod
+    def _well_centers(
+        center_br: np.ndarray,
+        center_origin: np.ndarray,
+        diameter_x: np.ndarray,
+        diameter_y: np.ndarray,
+    ) -> np.ndarray:
+        """Pixel coordinates of the center of each well, shape :code:`(8, 12, 2)`."""
+        # Same arithmetic as the per-well loops, broadcast over all wells
+        x = (7 - np.arange(8))[:, None, None]
+        y = np.arange(12)[None, :, None]
+        current = (center_origin + y * diameter_y + x * diameter_x).astype(int)
+        from_bottom = (center_br - (11 - y) * diameter_y - (7 - x) * diameter_x).astype(
+            int
+        )
+        cur_x = np.where(x[..., 0] > 4, from_bottom[..., 0], current[..., 0])
+        cur_y = np.where(y[..., 0] > 6, from_bottom[..., 1], current[..., 1])
+        return np.stack([cur_x, cur_y], axis=-1)
+
+    @staticmethod
+    def _colors_at(
+        img: "cv2.Mat", centers: np.ndarray, dis: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        import cv2
+
+        img = cv2.resize(img, (640, 480))
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+
+        start = (centers - dis).astype(int)
+        # dis is a whole number, so every well has a square of the same size.
+        # Gather them all with a single fancy index, shape (8, 12, size, size, 3)
+        offsets = np.arange(max(int(2 * dis), 0))
+        rows = start[..., 1, None, None] + offsets[:, None]
+        columns = start[..., 0, None, None] + offsets[None, :]
+        regions = hsv[rows, columns]
+        median = np.median(regions, axis=(2, 3))
+
+        # TODO: Why is h divided by 179 instead of 255?
+        hsv_values = median / np.array([179, 255, 255])
+        r, g, b = _hsv_to_rgb(hsv_values)
+        # Channels are in the same order as in measure_well_color
+        rgb_values = (np.stack([g, r, b], axis=-1) * 255).astype(int)
+        return rgb_values, hsv_values
+
     def _get_color(
-        self, img: cv2.Mat, center_br, center_origin, diameter_x, diameter_y, coordinate
-    ) -> Tuple[cv2.Mat, ColorRGB, ColorHSV]:
+        self,
+        img: "cv2.Mat",
+        center_br,
+        center_origin,
+        diameter_x,
+        diameter_y,
+        coordinate,
+    ) -> Tuple["cv2.Mat", ColorRGB, ColorHSV]:
+        import cv2
+
         h, s, v = [], [], []
         img = cv2.resize(img, (640, 480))
         # transform the colorspace to HSV
@@ -104,7 +520,6 @@ class Camera:
         l_offset = np.array([dis, dis])
         start = (cur - l_offset).astype(int)
         end = (cur + l_offset).astype(int)
-        cv2.circle(img, cur, int(dis), (0, 255, 0), 1)
         # Put HSV values in a list
         for i in range(int(start[0]), int(end[0])):
             for j in range(int(start[1]), int(end[1])):
@@ -119,19 +534,15 @@ class Camera:
         rgb = (int(g * 255), int(r * 255), int(b * 255))
         return img, rgb, hsv
 
-    def _find_draw_fiducial(self, img: cv2.Mat):
+    @staticmethod
+    def _find_fiducial(corners: List[np.ndarray]) -> Geometry:
+        """Locate the wells from the corners of the 4 markers around the plate.
+
+        Drawing the markers and wells is left to :func:`annotate`.
+        """
         # Made by hand. Should be calculated by calibration for better results
-        if len(img.shape) == 3:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = img
-        # Find markers
-        aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_250)
-        parameters = cv2.aruco.DetectorParameters_create()
-        corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(
-            gray, aruco_dict, parameters=parameters
-        )
-        img_markers = img.copy()
+        # Same layout as returned by cv2.aruco.detectMarkers
+        corners = [np.asarray(c).reshape(1, 4, 2) for c in corners]
 
         # For now we use 4 markers to find the locations for plate 1
         if len(corners) != 4:
@@ -147,36 +558,11 @@ class Camera:
         radius_y = diameter_y / 2
 
         origin = (c_side[2][0], c2[0][1]) + np.array([-1, -1])
-        cv2.circle(img_markers, origin, 1, (0, 255, 0), 1)
-        cv2.line(img_markers, c2[0], c1[1], 100, 2)
-
         origin_br = (c_side[1][0], c1[1][1]) + np.array([4, -2])
-        cv2.circle(img_markers, origin_br, 1, (0, 255, 0), 1)
 
         center_origin = origin + (radius_x + radius_y) * 0.9
         center_origin = center_origin.astype(int)
 
         center_br = origin_br - (radius_x + radius_y) * 0.9
 
-        for y in range(0, 12):
-            for x in range(0, 8):
-                current = center_origin + y * diameter_y + x * diameter_x
-                current = current.astype(int)
-                from_bottom = center_br - (11 - y) * diameter_y - (7 - x) * diameter_x
-                from_bottom = from_bottom.astype(int)
-                cur_y = from_bottom[1] if y > 6 else current[1]
-                cur_x = from_bottom[0] if x > 4 else current[0]
-                cur = (cur_x, cur_y)
-                cv2.circle(img_markers, cur, 1, (0, 255, 0), 1)
-
-        cv2.line(img_markers, c_side[1], c_side[2], 100, 2)
-        for cornerset in corners:
-            cornerset = cornerset[0].astype(int)
-            # Draw the markers
-            tl, tr, bl, br = cornerset[0], cornerset[1], cornerset[3], cornerset[2]
-            cv2.line(img_markers, tl, tr, 255, 1)
-            cv2.line(img_markers, tr, br, 255, 1)
-            cv2.line(img_markers, br, bl, 255, 1)
-            cv2.line(img_markers, bl, tl, 255, 1)
-
-        return img_markers, center_br, center_origin, diameter_x, diameter_y
+        return center_br, center_origin, diameter_x, diameter_y
@@ -0,0 +1,415 @@
+"""Capture camera frames from a device, or replay them without one.
+
+A :class:`FrameSource` has the reading interface of
+:code:`cv2.VideoCapture`. Besides the camera on the robot, frames can come
+from a video file, a directory of images or a rendered plate, so the
+measurement pipeline can be profiled and tested without hardware.
+
+Reading a capture device when a measurement is taken returns whatever the
+driver buffered, often several frames old, and blocks until it arrives. A
+:class:`FrameGrabber` keeps draining the device into a ring buffer of
+preallocated frames instead, so the latest frame is always at hand and
+several consumers can share one device.
+"""
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ot2util.config import PathLike
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSource:
+    """Where frames come from, read like a :code:`cv2.VideoCapture`."""
+
+    def __init__(self, fps: Optional[float] = None) -> None:
+        """Initialize the source.
+
+        Parameters
+        ----------
+        fps : Optional[float], optional
+            Deliver frames at most this fast, like a live camera would,
+            by default as fast as they are read.
+        """
+        self.fps = fps
+        self._next = 0.0
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Any]:
+        """The next frame, written into :obj:`image` if it has the right shape.
+
+        Returns
+        -------
+        Tuple[bool, Any]
+            Whether there was a frame, and the frame.
+        """
+        if self.fps:
+            now = time.monotonic()
+            if now < self._next:
+                time.sleep(self._next - now)
+            self._next = max(now, self._next) + 1 / self.fps
+        frame = self._read()
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def _read(self) -> Optional[np.ndarray]:
+        """The next frame, may be reused by the source, None when there are no more."""
+        raise NotImplementedError
+
+    def release(self) -> None:
+        """Close the source."""
+        return None
+
+
+class DeviceSource(FrameSource):
+    """The camera on top of the OT2."""
+
+    def __init__(self, camera_id: int = 2) -> None:
+        """Open the camera with the settings used for measuring colors.
+
+        Parameters
+        ----------
+        camera_id : int, optional
+            ID of the camera on top of the OT2, by default 2
+        """
+        import cv2
+
+        super().__init__()
+        self.cap = cv2.VideoCapture(camera_id)
+        self.cap.set(3, 1920)
+        self.cap.set(4, 1280)
+        self.cap.set(5, 30)  # Set frame rate to 30 fps
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc("M", "J", "P", "G"))
+        self.cap.set(cv2.CAP_PROP_BRIGHTNESS, 40)  # Set brightness -64 - 64  0.0
+        self.cap.set(cv2.CAP_PROP_CONTRAST, 50)  # Set contrast -64 - 64  2.0
+        self.cap.set(cv2.CAP_PROP_EXPOSURE, 156)  # Set exposure 1.0 - 5000  156.0
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Any]:
+        # The device paces itself and decodes straight into image
+        return self.cap.read(image)  # type: ignore[no-any-return]
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class VideoSource(FrameSource):
+    """Frames of a recorded video, e.g. a motion JPEG segment of the frame archive."""
+
+    def __init__(
+        self, path: PathLike, loop: bool = False, fps: Optional[float] = None
+    ) -> None:
+        """Open the video.
+
+        Parameters
+        ----------
+        path : PathLike
+            The video file.
+        loop : bool, optional
+            Start over at the end instead of running out of frames.
+        fps : Optional[float], optional
+            Deliver frames at most this fast, see :class:`FrameSource`.
+        """
+        import cv2
+
+        super().__init__(fps)
+        self.path = Path(path)
+        self.loop = loop
+        self.cap = cv2.VideoCapture(str(self.path))
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open video: {self.path}")
+
+    def _read(self) -> Optional[np.ndarray]:
+        import cv2
+
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """Images in a directory, in the order of their names."""
+
+    def __init__(
+        self,
+        path: PathLike,
+        patterns: Sequence[str] = ("*.jpg", "*.png"),
+        loop: bool = False,
+        fps: Optional[float] = None,
+    ) -> None:
+        """Find the images.
+
+        Parameters
+        ----------
+        path : PathLike
+            Directory holding the images, e.g. the :code:`frames` directory
+            of an archived experiment.
+        patterns : Sequence[str], optional
+            Glob patterns of the image files, by default JPEG and PNG files.
+        loop : bool, optional
+            Start over after the last image instead of running out of frames.
+        fps : Optional[float], optional
+            Deliver frames at most this fast, see :class:`FrameSource`.
+        """
+        super().__init__(fps)
+        self.paths = sorted(p for pattern in patterns for p in Path(path).glob(pattern))
+        if not self.paths:
+            raise ValueError(f"No images found in {path}")
+        self.loop = loop
+        self._index = 0
+
+    def _read(self) -> Optional[np.ndarray]:
+        import cv2
+
+        if self._index == len(self.paths):
+            if not self.loop:
+                return None
+            self._index = 0
+        path = self.paths[self._index]
+        self._index += 1
+        frame = cv2.imread(str(path))
+        if frame is None:
+            raise ValueError(f"Cannot read image: {path}")
+        return frame  # type: ignore[no-any-return]
+
+
+def _marker(marker_id: int, size: int) -> np.ndarray:
+    import cv2.aruco
+
+    from ot2util.camera import ARUCO_DICTIONARY
+
+    dictionary = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, ARUCO_DICTIONARY))
+    if hasattr(cv2.aruco, "generateImageMarker"):
+        # OpenCV 4.7 and later
+        return cv2.aruco.generateImageMarker(dictionary, marker_id, size)  # type: ignore
+    return cv2.aruco.drawMarker(dictionary, marker_id, size)  # type: ignore
+
+
+class SyntheticPlateSource(FrameSource):
+    """Rendered 1920x1280 frames of a plate with known well colors.
+
+    The fiducial markers are drawn turned by a quarter, as the camera on the
+    robot sees them. ArUco detection lists them from the bottom of the frame
+    to the top, they are laid out so that the wells found from them in that
+    order are where the colors are drawn.
+    """
+
+    # Left, top and size of each marker in detection order. Wells are found
+    # in these pixel coordinates but measured in the frame resized to 640x480.
+    _LAYOUT = [(20, 370, 100), (20, 200, 60), (20, 60, 100), (300, 10, 240)]
+
+    def __init__(
+        self,
+        colors: Optional[np.ndarray] = None,
+        noise: float = 0.0,
+        seed: int = 0,
+        fps: Optional[float] = None,
+    ) -> None:
+        """Render the plate.
+
+        Parameters
+        ----------
+        colors : Optional[np.ndarray], optional
+            BGR color of each well, shape :code:`(8, 12, 3)`, by default
+            random colors.
+        noise : float, optional
+            Standard deviation of gaussian noise added to each frame, by
+            default none and every frame is the same.
+        seed : int, optional
+            Seed of the random colors and noise.
+        fps : Optional[float], optional
+            Deliver frames at most this fast, see :class:`FrameSource`.
+        """
+        import cv2
+
+        from ot2util.camera import Camera
+
+        super().__init__(fps)
+        self.rng = np.random.default_rng(seed)
+        if colors is None:
+            colors = self.rng.integers(0, 256, (8, 12, 3))
+        self.colors = np.asarray(colors, dtype=np.uint8)
+        self.noise = noise
+
+        frame = np.full((1280, 1920, 3), 255, dtype=np.uint8)
+        corners = []
+        for marker_id, (x, y, size) in enumerate(self._LAYOUT):
+            marker = np.rot90(_marker(marker_id, size), -1)
+            frame[y : y + size, x : x + size] = marker[..., None]
+            end = size - 1
+            corners.append([[x + end, y], [x + end, y + end], [x, y + end], [x, y]])
+        self.corners = np.array(corners, dtype=float)
+        """Corners of the markers in detection order, shape :code:`(4, 4, 2)`."""
+        self.geometry = Camera._find_fiducial(list(self.corners))
+        """Wells found from the markers, see :meth:`Camera._find_fiducial`."""
+
+        # Disks covering the square measured around each well center
+        scale = np.array([1920 / 640, 1280 / 480])
+        radius = int(1.5 * (self.geometry[2][0] // 3) * scale.max())
+        centers = Camera._well_centers(*self.geometry) * scale
+        for row in range(8):
+            for column in range(12):
+                center = tuple(int(c) for c in centers[row, column])
+                color = tuple(int(c) for c in self.colors[row, column])
+                cv2.circle(frame, center, radius, color, -1)
+        self.frame = frame
+        """The rendered frame, without noise."""
+
+    def _read(self) -> Optional[np.ndarray]:
+        if not self.noise:
+            return self.frame
+        noise = self.rng.normal(0, self.noise, self.frame.shape)
+        return np.clip(self.frame + noise, 0, 255).astype(np.uint8)  # type: ignore
+
+
+class Frame(NamedTuple):
+    """A frame in the ring buffer of a :class:`FrameGrabber`."""
+
+    sequence: int
+    """Number of frames captured before this one."""
+    timestamp: float
+    """When the frame was captured, in :func:`time.monotonic` seconds."""
+    image: np.ndarray
+    """Read-only view into the ring buffer, see :meth:`FrameGrabber.valid`."""
+
+
+class FrameGrabber:
+    """Capture frames on a background thread into a ring buffer.
+
+    Frames are handed out as views into the buffer without copying. The
+    buffer slot of a frame is written again :obj:`size` frames later, copy
+    the image if it is needed for longer than that.
+    """
+
+    def __init__(self, cap: Any, size: int = 8) -> None:
+        """Start capturing.
+
+        Parameters
+        ----------
+        cap : Any
+            The capture device, e.g. a :code:`cv2.VideoCapture`. Only the
+            grabber may read from it once started.
+        size : int, optional
+            Number of frames in the ring buffer, by default 8.
+        """
+        if size < 2:
+            raise ValueError("The ring buffer needs at least 2 frames")
+        self.cap = cap
+        self.size = size
+        self._frames: List[np.ndarray] = []
+        self._timestamps = np.zeros(size)
+        # Sequence number of the last frame captured
+        self._sequence = -1
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._capture, name="frame-grabber", daemon=True
+        )
+        self._thread.start()
+
+    def _capture(self) -> None:
+        while not self._stopped.is_set():
+            slot = (self._sequence + 1) % self.size
+            if self._frames:
+                # Written in place, frames handed out never include this slot
+                ret, image = self.cap.read(self._frames[slot])
+            else:
+                ret, image = self.cap.read()
+            timestamp = time.monotonic()
+            if not ret:
+                logger.warning("Capture device returned no frame, stopping")
+                break
+            if not self._frames:
+                self._frames = [np.empty_like(image) for _ in range(self.size)]
+            if image is not self._frames[slot]:
+                # The device allocated a new frame instead
+                np.copyto(self._frames[slot], image)
+            with self._condition:
+                self._timestamps[slot] = timestamp
+                self._sequence += 1
+                self._condition.notify_all()
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+
+    def _frame(self, sequence: int) -> Frame:
+        slot = sequence % self.size
+        image = self._frames[slot].view()
+        image.flags.writeable = False
+        return Frame(sequence, float(self._timestamps[slot]), image)
+
+    def latest_frame(
+        self, newer_than: Optional[float] = None, timeout: Optional[float] = None
+    ) -> Frame:
+        """The most recent frame.
+
+        Parameters
+        ----------
+        newer_than : Optional[float], optional
+            Wait for a frame captured after this :func:`time.monotonic`
+            timestamp, e.g. one taken after the pipette moved away. By
+            default only waits for the first frame.
+        timeout : Optional[float], optional
+            Seconds to wait, by default no limit.
+
+        Raises
+        ------
+        TimeoutError
+            If no such frame was captured in time.
+        RuntimeError
+            If capturing stopped before such a frame was captured.
+        """
+
+        def ready() -> bool:
+            return self._sequence >= 0 and (
+                newer_than is None
+                or self._timestamps[self._sequence % self.size] > newer_than
+            )
+
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: ready() or self._stopped.is_set(), timeout
+            ):
+                raise TimeoutError("No new frame was captured in time")
+            if not ready():
+                raise RuntimeError("Capturing stopped")
+            return self._frame(self._sequence)
+
+    def frames_since(self, timestamp: float) -> List[Frame]:
+        """Frames still in the ring buffer captured after :obj:`timestamp`, oldest first."""
+        with self._condition:
+            first = max(self._sequence - self.size + 2, 0)
+            return [
+                self._frame(sequence)
+                for sequence in range(first, self._sequence + 1)
+                if self._timestamps[sequence % self.size] > timestamp
+            ]
+
+    def valid(self, frame: Frame) -> bool:
+        """Whether the buffer slot of a frame was not overwritten yet."""
+        with self._condition:
+            return frame.sequence > self._sequence - self.size + 1
+
+    def close(self) -> None:
+        """Stop capturing, frames handed out stay readable."""
+        self._stopped.set()
+        self._thread.join()
+
+    def __enter__(self) -> "FrameGrabber":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
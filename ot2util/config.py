@@ -1,17 +1,25 @@
 """Settings for specific configurations of OT2 machines and experiments."""
 import argparse
 import json
+import os
 from pathlib import Path
-from typing import List, Optional, Type, TypeVar, Union
+from typing import TYPE_CHECKING, Dict, List, Optional, Type, TypeVar, Union
 
 import yaml
-from opentrons.protocol_api import ProtocolContext
 from pydantic import BaseSettings as _BaseSettings
 
+if TYPE_CHECKING:
+    # Importing opentrons is slow, the protocol context is only needed for typing
+    from opentrons.protocol_api import ProtocolContext
+
 _T = TypeVar("_T")
 
 PathLike = Union[str, Path]
 
+CONFIG_ENV = "OT2UTIL_CONFIG"
+"""Environment variable holding the path of the config file to load
+inside a protocol, takes precedence over the bundled data."""
+
 
 class BaseSettings(_BaseSettings):
     """Allows any sub-class to inherit methods allowing for programatic description of protocols
@@ -50,12 +58,14 @@ class BaseSettings(_BaseSettings):
         return cls(**raw_data)  # type: ignore[call-arg]
 
     @classmethod
-    def get_config(cls: Type[_T], protocol: ProtocolContext) -> _T:
+    def get_config(cls: Type[_T], protocol: "ProtocolContext") -> _T:
         """Load configuration file when running an opentrons protocol."""
         # https://github.com/Opentrons/opentrons/blob/edge/api/src/opentrons/util/entrypoint_util.py#L59
         # protocol.bundled_data["config.yaml"] will contain the raw bytes of the config file
         # TODO: There is a bug in the opentrons code which does not pass this parameter
         #       correctly during opentrons_execute commands.
+        if CONFIG_ENV in os.environ:
+            return cls.from_yaml(os.environ[CONFIG_ENV])  # type: ignore
         if "config.yaml" in protocol.bundled_data:
             return cls.from_bytes(protocol.bundled_data["config.yaml"])  # type: ignore
         # As a quick fix, we hard code a path to write config files to.
@@ -95,6 +105,19 @@ class RobotConnectionConfig(BaseSettings):
     tar_transfer: bool = False
     """Compress files for transfering from remote to local,
     slow operation, avoid if possible."""
+    transfer: str = "scp"
+    """How to copy files to and from the robot, either "scp" to run a new
+    scp process for each file or "sftp" to reuse the open ssh connection."""
+    stream_transfer: bool = False
+    """Stream a tar archive of the results over the ssh connection and extract
+    it while it arrives, without writing intermediate files. Takes precedence
+    over :obj:`tar_transfer`."""
+    stream_compression: str = "none"
+    """Compression used by :obj:`stream_transfer`, one of "none", "gzip" or
+    "zstd" (requires zstd on the robot and the zstandard package locally)."""
+    sync_transfer: bool = False
+    """Only transfer result files which are new or changed compared to the
+    local copy, using a manifest of file sizes and modification times."""
 
 
 class MetaDataConfig(BaseSettings):
@@ -113,6 +136,22 @@ class ProtocolConfig(BaseSettings):
     """Workdir for the experiment running on remote."""
 
 
+class BatchEntryConfig(BaseSettings):
+    """A single experiment of a batch."""
+
+    config: Path
+    """Path to the experiment configuration file."""
+    workdir: Path
+    """Directory to write the experiment logs and results to."""
+
+
+class BatchConfig(BaseSettings):
+    """Experiments to run one after another within a single protocol run."""
+
+    experiments: List[BatchEntryConfig] = []
+    """The experiments to run in order."""
+
+
 class RobotConfig(BaseSettings):
     """Configuration for using a robot."""
 
@@ -131,6 +170,60 @@ class OpentronsRobotConfig(RobotConfig):
     """Whether or not to run a simulation or an actual experiment"""
     run_local: bool = False
     """Whether or not to run the local in simulated mode"""
+    protocol_cache_dir: Optional[Path] = None
+    """Directory to cache generated protocol files in, keyed by a hash of
+    their source code. None renders every protocol from scratch."""
+    protocol_cache_size: int = 256
+    """Number of protocol files to keep in :obj:`protocol_cache_dir`, the
+    least recently used files are removed first."""
+    stream_logs: bool = False
+    """Whether to write stdout.log and stderr.log while the protocol is
+    running instead of once it exits, and report echoed commands to
+    :meth:`Robot.on_command` as they arrive. Not supported by batches."""
+    daemon_port: Optional[int] = None
+    """Port of an :mod:`ot2util.daemon` running on the robot. If set, remote
+    experiments are run by the daemon instead of a new opentrons_execute
+    process, and their logs are streamed. Batches do not use the daemon."""
+    simulation_workers: int = 0
+    """Number of worker processes simulating local runs with the opentrons API
+    imported once, shared by robots with the same setting and stopped by
+    :func:`ot2util.simulation.close_simulation_pools`, or when the interpreter
+    exits. 0 starts a new opentrons_simulate process for each experiment."""
+    result_cache_dir: Optional[Path] = None
+    """Directory to cache the results of local simulations in, keyed by a
+    hash of the protocol and its config. Repeated simulations restore the
+    cached logs and artifacts instead of running. None disables the cache."""
+    result_cache_size: int = 1 << 30
+    """Bytes of results to keep in :obj:`result_cache_dir`, the least
+    recently used results are removed first."""
+
+
+class ClientQuotaConfig(BaseSettings):
+    """Limits of a client sharing robots through :mod:`ot2util.broker`."""
+
+    max_running: Optional[int] = None
+    """Maximum number of experiments of the client running at once,
+    unbounded if None."""
+    max_queued: Optional[int] = None
+    """Maximum number of experiments of the client waiting to run,
+    further submissions are rejected. Unbounded if None."""
+    weight: float = 1.0
+    """Share of the robots the client gets while others are waiting, relative
+    to the weights of the other clients."""
+
+
+class BrokerConfig(BaseSettings):
+    """Configuration for sharing the robots of a workflow between processes."""
+
+    port: int = 8766
+    """Port on localhost to accept submissions on, 0 picks a free port."""
+    max_in_flight: Optional[int] = None
+    """Maximum number of experiments handed to the robots at once, by default
+    the number of robots. Raise it to overlap result transfers with runs."""
+    default_quota: ClientQuotaConfig = ClientQuotaConfig()
+    """Quota of clients not listed in :obj:`quotas`."""
+    quotas: Dict[str, ClientQuotaConfig] = {}
+    """Quota of each client, keyed by client name."""
 
 
 class WorkflowConfig(BaseSettings):
@@ -140,6 +233,35 @@ class WorkflowConfig(BaseSettings):
     """Robots available to run experiments on. Connect to one or many."""
     output_dir: Path = Path()
     """Local directory to pull results into from the remote experiments"""
+    batch_size: int = 1
+    """Maximum number of experiments to run within a single protocol run,
+    a value of 1 disables batching."""
+    batch_window: float = 10.0
+    """Seconds to wait for a batch to fill up before launching it anyway."""
+    max_queued: Optional[int] = None
+    """Maximum number of experiments waiting for a robot, unbounded if None."""
+    queue_overflow: str = "block"
+    """What to do with a submission when the queue is full, one of "block",
+    "reject" or "drop_lowest"."""
+    journal: Optional[Path] = None
+    """Journal file recording submissions, labware allocations and completions
+    so that the workflow can be resumed after a crash. None disables it."""
+    resume: bool = False
+    """Whether to resume from :obj:`journal`, restoring the labware state,
+    rerunning interrupted experiments and skipping completed ones.
+    Otherwise an existing journal is overwritten."""
+    deduplicate: bool = False
+    """Whether to reuse the results of equivalent experiments which ran or
+    are running instead of running an experiment again."""
+    dedup_store: Optional[Path] = None
+    """File storing successful experiments to deduplicate against across
+    workflows, by default they are only kept in memory."""
+    dedup_tolerances: Dict[str, float] = {}
+    """Absolute tolerance of numeric experiment arguments within which
+    experiments are equivalent, e.g. :code:`{"source_volumes": 0.5}`.
+    Other arguments need to be equal."""
+    broker: BrokerConfig = BrokerConfig()
+    """Settings of the broker sharing the robots, see :mod:`ot2util.broker`."""
 
 
 def parse_args() -> argparse.Namespace:
@@ -0,0 +1,267 @@
+"""Run protocols on the robot without starting a new python process each time.
+
+Starting :code:`opentrons_execute` imports the opentrons API from scratch,
+which takes a long time on the raspberry pi of the robot. The daemon
+imports it once and then runs each submitted protocol in a process forked
+from itself, streaming back its output and exit code. Start it on the
+robot with::
+
+    python3 -m ot2util.daemon --port 8765
+
+and set :obj:`OpentronsRobotConfig.daemon_port` to run experiments through
+it, the port is forwarded over the ssh connection. The daemon only accepts
+connections from localhost and runs one protocol at a time.
+
+Messages in both directions are frames of a one byte kind, a four byte
+big endian length and the payload.
+"""
+
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from ot2util.logs import LogWriter, pump_streams
+
+REQUEST = b"r"
+"""Frame sent by the client holding the json encoded submission."""
+STDOUT = b"o"
+"""Frame holding a chunk of the standard output of the protocol."""
+STDERR = b"e"
+"""Frame holding a chunk of the standard error of the protocol."""
+EXIT = b"x"
+"""Last frame of a run, holding the exit code of the protocol."""
+
+_HEADER = struct.Struct(">cI")
+
+
+def send_frame(sock: Any, kind: bytes, payload: bytes) -> None:
+    """Send a frame over a socket or a paramiko channel."""
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock: Any, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a frame")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: Any) -> Tuple[bytes, bytes]:
+    """Receive a frame sent by :func:`send_frame`, returns its kind and payload."""
+    kind, size = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return kind, _recv_exact(sock, size)
+
+
+class _FrameWriter:
+    """Forward output to the client, keeps going if the client disconnects
+    so that a protocol moving the robot is never interrupted."""
+
+    def __init__(self, sock: Any, kind: bytes, lock: threading.Lock) -> None:
+        self.sock = sock
+        self.kind = kind
+        self.lock = lock
+        self.connected = True
+
+    def write(self, data: bytes) -> None:
+        if not self.connected:
+            return
+        try:
+            with self.lock:
+                send_frame(self.sock, self.kind, data)
+        except OSError:
+            self.connected = False
+
+
+def run_protocol(protocol: Path, simulate: bool) -> int:
+    """Run a protocol file printing its run log like the opentrons command line.
+
+    Parameters
+    ----------
+    protocol : Path
+        The protocol file.
+    simulate : bool
+        Whether to simulate the protocol, like :code:`opentrons_simulate`,
+        or execute it, like :code:`opentrons_execute`.
+
+    Returns
+    -------
+    int
+        0 if the protocol finished, 1 if it raised.
+    """
+    with open(protocol) as f:
+        try:
+            if simulate:
+                from opentrons.simulate import format_runlog
+                from opentrons.simulate import simulate as simulate_protocol
+
+                runlog, _ = simulate_protocol(f, protocol.name)
+                print(format_runlog(runlog))
+            else:
+                from opentrons.execute import execute, make_runlog_cb
+
+                execute(f, protocol.name, emit_runlog=make_runlog_cb())
+        except Exception:
+            traceback.print_exc()
+            return 1
+    return 0
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _run_child(request: Dict[str, Any], stdout: int, stderr: int) -> None:
+    # Runs in the forked process, never returns
+    code = 1
+    try:
+        os.dup2(stdout, 1)
+        os.dup2(stderr, 2)
+        # Line buffered so that the run log of executed protocols is live
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        os.environ.update(request.get("env", {}))
+        code = run_protocol(Path(request["protocol"]), request.get("simulate", False))
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def _handle(conn: socket.socket, server: socket.socket) -> None:
+    kind, payload = recv_frame(conn)
+    if kind != REQUEST:
+        raise ValueError(f"Expected a request frame, got {kind!r}")
+    request = json.loads(payload)
+
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        server.close()
+        conn.close()
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(request, out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+
+    lock = threading.Lock()
+    stdout = _FrameWriter(conn, STDOUT, lock)
+    with os.fdopen(out_r, "rb", 0) as out, os.fdopen(err_r, "rb", 0) as err:
+        pump_streams(
+            lambda: out.read(32768),
+            lambda: err.read(32768),
+            stdout.write,
+            _FrameWriter(conn, STDERR, lock).write,
+        )
+    _, status = os.waitpid(pid, 0)
+    if stdout.connected:
+        send_frame(conn, EXIT, str(_exit_code(status)).encode())
+
+
+def _warm_up() -> None:
+    # The whole point of the daemon, forked protocols inherit the imports
+    import opentrons.simulate  # noqa: F401
+
+    try:
+        import opentrons.execute  # noqa: F401
+    except Exception:  # pragma: no cover
+        # Executing needs the robot hardware, simulating still works
+        traceback.print_exc()
+
+
+def serve(port: int) -> None:
+    """Import the opentrons API and run submitted protocols until killed.
+
+    Parameters
+    ----------
+    port : int
+        Port on localhost to listen on, 0 picks a free port which is
+        printed to stdout once the daemon is ready.
+    """
+    _warm_up()
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", port))
+    server.listen(8)
+    print(f"Listening on port {server.getsockname()[1]}", flush=True)
+    while True:
+        conn, _ = server.accept()
+        with conn:
+            try:
+                _handle(conn, server)
+            except (OSError, ValueError) as e:
+                print(f"Dropping submission: {e}", file=sys.stderr, flush=True)
+
+
+def submit(
+    sock: Any,
+    protocol: Path,
+    stdout: LogWriter,
+    stderr: LogWriter,
+    simulate: bool = False,
+    env: Optional[Dict[str, str]] = None,
+) -> int:
+    """Run a protocol through the daemon and wait for it to finish.
+
+    Parameters
+    ----------
+    sock : Any
+        A connection to the daemon, either a socket or a paramiko channel
+        forwarded with :meth:`RobotConnection.open_tunnel`.
+    protocol : Path
+        Path of the protocol file on the robot.
+    stdout : LogWriter
+        Writer for the standard output of the protocol.
+    stderr : LogWriter
+        Writer for the standard error of the protocol.
+    simulate : bool, optional
+        Whether to simulate the protocol instead of executing it.
+    env : Optional[Dict[str, str]], optional
+        Environment variables to set for the protocol, e.g. the path of
+        its config file.
+
+    Returns
+    -------
+    int
+        The exit code of the protocol.
+    """
+    request = {"protocol": str(protocol), "simulate": simulate, "env": env or {}}
+    send_frame(sock, REQUEST, json.dumps(request).encode())
+    while True:
+        kind, payload = recv_frame(sock)
+        if kind == STDOUT:
+            stdout.write(payload)
+        elif kind == STDERR:
+            stderr.write(payload)
+        elif kind == EXIT:
+            return int(payload)
+        else:
+            raise ValueError(f"Unexpected frame {kind!r}")
+
+
+def main() -> None:
+    """Start the daemon, see :func:`serve`."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    args = parser.parse_args()
+    serve(args.port)
+
+
+if __name__ == "__main__":
+    main()
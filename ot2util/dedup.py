@@ -0,0 +1,337 @@
+"""Reuse the results of equivalent experiments instead of running them again.
+
+Search agents often propose the same or nearly the same experiment more
+than once. A :class:`Deduplicator` in front of :meth:`RobotPool.submit`
+returns the results of an equivalent experiment which already ran, or the
+future of one which is still running. What counts as equivalent is decided
+by an :class:`Equivalence`, e.g. :class:`ToleranceEquivalence` treats
+volumes within a tolerance as equal.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from ot2util.cache import hash_strings
+from ot2util.config import PathLike
+
+if TYPE_CHECKING:
+    from ot2util.experiment import Experiment
+
+logger = logging.getLogger(__name__)
+
+
+class MemoEntry(NamedTuple):
+    """An experiment which ran successfully."""
+
+    name: str
+    """Name of the experiment."""
+    output_dir: Path
+    """Directory holding its results."""
+    args: List[Any]
+    """Arguments it was submitted with."""
+    kwargs: Dict[str, Any]
+    """Keyword arguments it was submitted with."""
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class Equivalence:
+    """Experiments are equivalent if they were submitted with equal arguments."""
+
+    def __init__(self, fields: Optional[Sequence[str]] = None) -> None:
+        """Initialize the equivalence.
+
+        Parameters
+        ----------
+        fields : Optional[Sequence[str]], optional
+            Keyword arguments which affect the protocol, others are
+            ignored. By default all of them.
+        """
+        self.fields = fields
+
+    def relevant(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """The keyword arguments which affect the protocol."""
+        if self.fields is None:
+            return kwargs
+        return {field: kwargs[field] for field in self.fields if field in kwargs}
+
+    def key(self, args: Sequence[Any], kwargs: Dict[str, Any]) -> str:
+        """Canonical hash, equivalent experiments need to have the same key."""
+        return hash_strings(_canonical(list(args)), _canonical(self.relevant(kwargs)))
+
+    def equivalent(
+        self,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        other_args: Sequence[Any],
+        other_kwargs: Dict[str, Any],
+    ) -> bool:
+        """Whether two experiments with the same :meth:`key` are equivalent."""
+        return True
+
+
+def _close(value: Any, other: Any, tolerance: float) -> bool:
+    if isinstance(value, (list, tuple)) and isinstance(other, (list, tuple)):
+        return len(value) == len(other) and all(
+            _close(a, b, tolerance) for a, b in zip(value, other)
+        )
+    try:
+        return abs(float(value) - float(other)) <= tolerance
+    except (TypeError, ValueError):
+        return bool(value == other)
+
+
+class ToleranceEquivalence(Equivalence):
+    """Experiments are equivalent if numeric arguments are within a tolerance.
+
+    For example :code:`ToleranceEquivalence({"source_volumes": 0.5})` treats
+    color mixing experiments as equivalent if their volumes are at most
+    0.5 uL apart, element by element, and all other arguments are equal.
+    """
+
+    def __init__(
+        self, tolerances: Dict[str, float], fields: Optional[Sequence[str]] = None
+    ) -> None:
+        """Initialize the equivalence.
+
+        Parameters
+        ----------
+        tolerances : Dict[str, float]
+            Absolute tolerance of numeric keyword arguments, or lists of them.
+        fields : Optional[Sequence[str]], optional
+            Keyword arguments which affect the protocol, see :class:`Equivalence`.
+        """
+        super().__init__(fields)
+        self.tolerances = tolerances
+
+    def key(self, args: Sequence[Any], kwargs: Dict[str, Any]) -> str:
+        exact = {
+            field: value
+            for field, value in self.relevant(kwargs).items()
+            if field not in self.tolerances
+        }
+        return hash_strings(_canonical(list(args)), _canonical(exact))
+
+    def equivalent(
+        self,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        other_args: Sequence[Any],
+        other_kwargs: Dict[str, Any],
+    ) -> bool:
+        return all(
+            _close(kwargs.get(field), other_kwargs.get(field), tolerance)
+            for field, tolerance in self.tolerances.items()
+        )
+
+
+class _Running(NamedTuple):
+    """An experiment which is running, or queued."""
+
+    args: Sequence[Any]
+    kwargs: Dict[str, Any]
+    future: "Future[Experiment]"
+    """Resolves once the experiment has finished."""
+    waiters: List["Future[Experiment]"]
+    """Futures handed to the equivalent submissions which were not cancelled."""
+
+
+class Deduplicator:
+    """Submit experiments unless an equivalent one ran or is running."""
+
+    def __init__(
+        self, equivalence: Optional[Equivalence] = None, path: Optional[PathLike] = None
+    ) -> None:
+        """Initialize the deduplicator.
+
+        Parameters
+        ----------
+        equivalence : Optional[Equivalence], optional
+            Decides which experiments are equivalent, by default those with
+            equal arguments.
+        path : Optional[PathLike], optional
+            Json lines file storing successful experiments, shared by all
+            workflows using it. By default they are only kept in memory.
+        """
+        self.equivalence = equivalence or Equivalence()
+        self.path = None if path is None else Path(path)
+        self.saved = 0
+        """Number of submissions which did not need to run."""
+        self._done: Dict[str, List[MemoEntry]] = {}
+        self._running: Dict[str, List[_Running]] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    entry = MemoEntry(**json.loads(line))
+                    entry = entry._replace(output_dir=Path(entry.output_dir))
+                    key = self.equivalence.key(entry.args, entry.kwargs)
+                    self._done.setdefault(key, []).append(entry)
+
+    def submit(
+        self,
+        name: str,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        submit: Callable[[], "Future[Experiment]"],
+        load: Callable[[MemoEntry], "Experiment"],
+    ) -> "Future[Experiment]":
+        """Submit an experiment unless an equivalent one ran or is running.
+
+        Parameters
+        ----------
+        name : str
+            Name of the experiment.
+        args : Sequence[Any]
+            Arguments of the experiment.
+        kwargs : Dict[str, Any]
+            Keyword arguments of the experiment.
+        submit : Callable[[], Future[Experiment]]
+            Submits the experiment to run it.
+        load : Callable[[MemoEntry], Experiment]
+            Rebuilds an experiment which already ran from its results.
+
+        Returns
+        -------
+        Future[Experiment]
+            Resolves to the equivalent experiment if there is one, which
+            has a different name, otherwise to the submitted experiment.
+        """
+        from ot2util.experiment import _copy_future
+
+        key = self.equivalence.key(args, kwargs)
+        with self._lock:
+            done = next(
+                (
+                    entry
+                    for entry in self._done.get(key, [])
+                    if self.equivalence.equivalent(
+                        args, kwargs, entry.args, entry.kwargs
+                    )
+                ),
+                None,
+            )
+        if done is not None:
+            try:
+                experiment = load(done)
+            except Exception:
+                # E.g. the results were removed, run the experiment again
+                logger.exception(f"Could not reuse the results of {done.name}")
+                with self._lock:
+                    self._done[key] = [
+                        entry for entry in self._done[key] if entry is not done
+                    ]
+            else:
+                with self._lock:
+                    self.saved += 1
+                    saved = self.saved
+                logger.info(
+                    f"Reusing the results of {done.name} for {name}, "
+                    f"{saved} runs saved"
+                )
+                future: Future[Experiment] = Future()
+                future.set_result(experiment)
+                return future
+
+        future = Future()
+        with self._lock:
+            running = next(
+                (
+                    running
+                    for running in self._running.get(key, [])
+                    if self.equivalence.equivalent(
+                        args, kwargs, running.args, running.kwargs
+                    )
+                ),
+                None,
+            )
+            new = running is None
+            if running is None:
+                # Later equivalent submissions wait for this one
+                running = _Running(args, kwargs, Future(), [])
+                self._running.setdefault(key, []).append(running)
+            else:
+                self.saved += 1
+                saved = self.saved
+            running.waiters.append(future)
+
+        # Each submitter gets its own future, the experiment is only
+        # cancelled once all of them are.
+        running.future.add_done_callback(partial(_copy_future, target=future))
+        future.add_done_callback(partial(self._cancelled, key, running))
+        if not new:
+            logger.info(
+                f"Waiting for an equivalent experiment to finish for {name}, "
+                f"{saved} runs saved"
+            )
+            return future
+
+        # Submitting may block on, or fail futures of, a bounded queue,
+        # which calls back into the deduplicator, so the lock is not held.
+        shared = running.future
+        shared.add_done_callback(partial(self._finished, key, args, kwargs))
+        try:
+            submitted = submit()
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        submitted.add_done_callback(partial(_copy_future, target=shared))
+        # Cancelling the experiment removes it from the queue
+        shared.add_done_callback(lambda f: f.cancelled() and submitted.cancel())
+        return future
+
+    def _cancelled(
+        self, key: str, running: "_Running", future: "Future[Experiment]"
+    ) -> None:
+        if not future.cancelled():
+            return
+        with self._lock:
+            running.waiters.remove(future)
+            if running.waiters:
+                return
+            # Nobody waits for it anymore, later submissions run it again
+            self._running[key] = [
+                other for other in self._running.get(key, []) if other is not running
+            ]
+        running.future.cancel()
+
+    def _finished(
+        self,
+        key: str,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        future: "Future[Experiment]",
+    ) -> None:
+        with self._lock:
+            self._running[key] = [
+                running
+                for running in self._running.get(key, [])
+                if running.future is not future
+            ]
+            # Failed experiments are run again when submitted again
+            if future.cancelled() or future.exception() is not None:
+                return
+            experiment = future.result()
+            entry = MemoEntry(
+                experiment.name, experiment.output_dir, list(args), kwargs
+            )
+            self._done.setdefault(key, []).append(entry)
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(entry._asdict(), default=str) + "\n")
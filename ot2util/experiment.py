@@ -1,27 +1,73 @@
 """Encapsulation of experiments allowing specification of arbitrary protocols to be run on OT2.
 """
 
+import asyncio
 import inspect
+import json
 import logging
+import os
+import re
+import shutil
 import subprocess
-import time
-from concurrent.futures import Future, wait
+import threading
+from concurrent.futures import CancelledError, Future
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Any, Callable, List, Optional, Union
-
-import black
-import pebble
-from fabric import Connection
-from invoke.runners import Result
-from jinja2 import Environment, PackageLoader
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
+from ot2util.batch import BATCH_ENV, RETURNCODE_FILE, read_returncode
+from ot2util.cache import ProtocolCache, ResultCache, hash_strings, link_or_copy
 from ot2util.config import (
+    CONFIG_ENV,
+    BatchConfig,
+    BatchEntryConfig,
     MetaDataConfig,
     OpentronsRobotConfig,
     PathLike,
     ProtocolConfig,
     RobotConnectionConfig,
 )
+from ot2util.dedup import Deduplicator, MemoEntry
+from ot2util.journal import Journal
+from ot2util.logs import (
+    LogWriter,
+    ProtocolCommand,
+    pump_async,
+    pump_streams,
+    read_chunks,
+)
+from ot2util.scheduling import (
+    ExperimentQueue,
+    Requirements,
+    RobotDispatcher,
+    SchedulingPolicy,
+)
+from ot2util.sync import (
+    build_manifest,
+    changed_files,
+    manifest_command,
+    parse_manifest,
+)
+from ot2util.transfer import TAR_COMPRESSIONS, SFTPTransfer, stream_tar
+
+if TYPE_CHECKING:
+    from invoke.runners import Result
+    from jinja2 import Environment
+    from paramiko import Channel
+
+# Heavy dependencies (black, fabric, jinja2, pebble) are imported where they
+# are used so that importing ot2util stays fast, e.g. on the robot.
 
 logger = logging.getLogger(__name__)
 
@@ -40,36 +86,119 @@ def get_function_source_codes(funcs: List[Callable[..., Any]]) -> List[str]:
     return source_codes
 
 
-def to_template(
+@lru_cache(maxsize=None)
+def _get_environment() -> "Environment":
+    from jinja2 import Environment, PackageLoader
+
+    return Environment(
+        loader=PackageLoader("ot2util"),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        autoescape=False,
+    )
+
+
+def _template_context(
     imports: Callable[[], None],
     config_class: ProtocolConfig,
     run_func: Callable[..., None],
     metadata: MetaDataConfig,
     funcs: List[Callable[..., Any]] = [],
-    template_file: str = "protocol.j2",
-) -> str:
+) -> Dict[str, Any]:
     function_codes = get_function_source_codes(funcs + [run_func])
-    context = {
+    return {
         "imports": _getsource(imports),
         "config_code": inspect.getsource(config_class),  # type: ignore[arg-type]
         "metadata": metadata,
         "function_codes": function_codes,
     }
-    env = Environment(
-        loader=PackageLoader("ot2util"),
-        trim_blocks=True,
-        lstrip_blocks=True,
-        autoescape=False,
-    )
-    template = env.get_template(template_file)
+
+
+def _render(context: Dict[str, Any], template_file: str) -> str:
+    template = _get_environment().get_template(template_file)
     return template.render(context)
 
 
-def write_template(filename: Path, *args: Any, **kwargs: Any) -> None:
-    source_code = to_template(*args, **kwargs)
-    source_code = black.format_str(source_code, mode=black.FileMode(line_length=100))
+def _format(source_code: str) -> str:
+    import black
+
+    return black.format_str(source_code, mode=black.FileMode(line_length=100))
+
+
+def _template_key(context: Dict[str, Any], template_file: str) -> str:
+    import black
+
+    template_source, _, _ = _get_environment().loader.get_source(  # type: ignore[union-attr]
+        _get_environment(), template_file
+    )
+    return hash_strings(
+        context["imports"],
+        context["config_code"],
+        context["metadata"].json(),
+        json.dumps(context["function_codes"]),
+        template_file,
+        template_source,
+        black.__version__,
+    )
+
+
+def to_template(
+    imports: Callable[[], None],
+    config_class: ProtocolConfig,
+    run_func: Callable[..., None],
+    metadata: MetaDataConfig,
+    funcs: List[Callable[..., Any]] = [],
+    template_file: str = "protocol.j2",
+) -> str:
+    context = _template_context(imports, config_class, run_func, metadata, funcs)
+    return _render(context, template_file)
+
+
+def write_template(
+    filename: Path,
+    imports: Callable[[], None],
+    config_class: ProtocolConfig,
+    run_func: Callable[..., None],
+    metadata: MetaDataConfig,
+    funcs: List[Callable[..., Any]] = [],
+    template_file: str = "protocol.j2",
+    cache: Optional[ProtocolCache] = None,
+) -> None:
+    context = _template_context(imports, config_class, run_func, metadata, funcs)
+
+    if cache is None:
+        with open(filename, "w") as f:
+            f.write(_format(_render(context, template_file)))
+        return
+
+    # The rendered protocol only depends on the source inputs, so reuse
+    # an already formatted protocol file if one exists in the cache.
+    key = _template_key(context, template_file)
+    cached = cache.get(key)
+    if cached is None:
+        cached = cache.put(key, _format(_render(context, template_file)))
+    # Copy rather than link, the protocol of an experiment may be edited
+    shutil.copyfile(cached, filename)
+
+
+def write_batch_template(filename: Path, protocol: Path) -> None:
+    """Turn a generated protocol into one running a batch of experiments.
+
+    Parameters
+    ----------
+    filename : Path
+        Path to write the batch protocol to.
+    protocol : Path
+        A protocol generated by :func:`write_template`.
+    """
+    # Opentrons only allows a single run function, so rename the one
+    # running a single experiment and let the batch call it.
+    source_code = re.sub(
+        r"^def run\(", "def _experiment_run(", protocol.read_text(), flags=re.M
+    )
+    batch_code = _render({}, "batch.j2")
     with open(filename, "w") as f:
-        f.write(source_code)
+        f.write(source_code.rstrip("\n") + "\n" + batch_code)
 
 
 def _write_log(contents: Union[str, bytes], path: Path) -> None:
@@ -85,7 +214,13 @@ class Experiment:
     Will be executed by experiment manager
     """
 
-    def __init__(self, name: str, output_dir: PathLike, cfg: ProtocolConfig) -> None:
+    def __init__(
+        self,
+        name: str,
+        output_dir: PathLike,
+        cfg: ProtocolConfig,
+        exist_ok: bool = False,
+    ) -> None:
         self.name = name
         self.output_dir = Path(output_dir) / name
         self.protocol = self.output_dir / "protocol.py"
@@ -93,7 +228,7 @@ class Experiment:
         self.cfg = cfg
 
         # Create new experiment directory
-        self.output_dir.mkdir()
+        self.output_dir.mkdir(exist_ok=exist_ok)
 
         self.returncode: int = -1
 
@@ -111,6 +246,10 @@ class RobotConnection:
         port: int = 22,
         key_filename: Optional[str] = None,
         tar_transfer: bool = False,
+        transfer: str = "scp",
+        stream_transfer: bool = False,
+        stream_compression: str = "none",
+        sync_transfer: bool = False,
     ) -> None:
         """Initialize a new connection to a robot.
 
@@ -131,16 +270,43 @@ class RobotConnection:
             Whether or not to tar files before transferring from the
             raspberry pi to local. Note that this will slow down communcation
             but may be necessary if transferring large files, by default, False.
+        transfer : str, optional
+            How to copy files to and from the robot. Either "scp" to run a new
+            scp process for each copy, or "sftp" to reuse the ssh connection,
+            by default "scp". :obj:`sync_transfer` always uses SFTP.
+        stream_transfer : bool, optional
+            Whether to stream a tar archive of the results over the ssh
+            connection and extract it as it arrives, takes precedence over
+            :obj:`tar_transfer`, by default False.
+        stream_compression : str, optional
+            Compression for :obj:`stream_transfer`, one of "none", "gzip"
+            or "zstd", by default "none".
+        sync_transfer : bool, optional
+            Whether to only transfer result files which are new or changed
+            compared to the local copy, see :meth:`sync`, by default False.
         """
+        if transfer not in ("scp", "sftp"):
+            raise ValueError(f"Unknown transfer method: {transfer}")
+        if stream_compression not in TAR_COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {stream_compression}")
+
         self.remote_dir = Path(remote_dir)
         self.host = host
+        self.port = port
         self.key_filename = key_filename
         self.tar_transfer = tar_transfer
+        self.transfer = transfer
+        self.stream_transfer = stream_transfer
+        self.stream_compression = stream_compression
+        self.sync_transfer = sync_transfer
+        self._local = threading.local()
 
         connect_kwargs = {}
         if key_filename is not None:
             connect_kwargs["key_filename"] = [key_filename]
 
+        from fabric import Connection
+
         # TODO: Handle authentication in a better way
         self.conn = Connection(host=host, port=port, connect_kwargs=connect_kwargs)
         # Make staging directory on the Opentrons
@@ -157,7 +323,70 @@ class RobotConnection:
     def _scp(self, src: PathLike, dst: PathLike, recursive: bool = False) -> None:
         r = "-r" if recursive else ""
         identity_file = "" if self.key_filename is None else f"-i {self.key_filename}"
-        subprocess.run(f"scp {identity_file} {r} {src} {dst}", shell=True)
+        subprocess.run(
+            f"scp -P {self.port} {identity_file} {r} {src} {dst}", shell=True
+        )
+
+    def _sftp(self) -> SFTPTransfer:
+        # Results are downloaded while the next experiment is uploaded, so
+        # each thread gets its own SFTP channel over the shared connection.
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None:
+            self.conn.open()
+            sftp = self._local.sftp = SFTPTransfer(self.conn.client.open_sftp())
+        return sftp
+
+    def put(self, local: PathLike, remote: PathLike) -> None:
+        """Upload a file to the robot.
+
+        Parameters
+        ----------
+        local : PathLike
+            Local file to upload.
+        remote : PathLike
+            Path on the robot to copy the file to.
+        """
+        if self.transfer == "sftp":
+            self._sftp().put(local, remote)
+        else:
+            self._scp(local, f"{self.host}:{remote}")
+
+    def get(self, remote: PathLike, local: PathLike) -> None:
+        """Download a file from the robot.
+
+        Parameters
+        ----------
+        remote : PathLike
+            File on the robot to download.
+        local : PathLike
+            Local path to copy the file to.
+        """
+        if self.transfer == "sftp":
+            self._sftp().get(remote, local)
+        else:
+            self._scp(f"{self.host}:{remote}", local)
+
+    def get_dir(
+        self, remote_dir: PathLike, local_dir: PathLike, excludes: Sequence[str] = ()
+    ) -> None:
+        """Recursively download the contents of a directory from the robot.
+
+        Parameters
+        ----------
+        remote_dir : PathLike
+            Directory on the robot to download.
+        local_dir : PathLike
+            Local directory to copy the contents into.
+        excludes : Sequence[str], optional
+            Glob patterns of files to skip, only supported by the "sftp"
+            transfer method.
+        """
+        if self.transfer == "sftp":
+            self._sftp().get_dir(remote_dir, local_dir, excludes)
+        else:
+            self._scp(
+                f"{self.host}:{Path(remote_dir) / '*'}", local_dir, recursive=True
+            )
 
     def _tar_transfer(
         self, experiment: Experiment, workdir: Path, remote_protocol: Path
@@ -168,7 +397,7 @@ class RobotConnection:
         excludes = f'--exclude="{remote_protocol.name}"'
         tar_command = f"tar {excludes} -cvf {remote_tar} {workdir.name}"
         self.conn.run(f"cd {workdir.parent} && {tar_command}")
-        self._scp(f"{self.host}:{remote_tar}", local_tar)
+        self.get(remote_tar, local_tar)
 
         # Clean up the tar on remote
         self.conn.run(f"rm -r {remote_tar}")
@@ -181,34 +410,159 @@ class RobotConnection:
     def _scp_transfer(
         self, experiment: Experiment, workdir: Path, remote_protocol: Path
     ) -> None:
-        # TODO: Try rsync to exclude the remote_protocol files
+        # TODO: Try rsync to exclude the remote_protocol files when using scp
         # https://www.cyberciti.biz/faq/scp-exclude-files-when-using-command-recursively-on-unix-linux/
         # https://stackoverflow.com/questions/1228466/how-to-filter-files-when-using-scp-to-copy-dir-recursively
-        to_copy = f"{self.host}:{workdir / '*'}"
-        self._scp(to_copy, experiment.output_dir, recursive=True)
+        self.get_dir(workdir, experiment.output_dir, excludes=[remote_protocol.name])
+
+    def _stream_transfer(
+        self, experiment: Experiment, workdir: Path, remote_protocol: Path
+    ) -> None:
+        # Fabric reconnects here if the connection was dropped
+        self.conn.open()
+        stream_tar(
+            self.conn.transport,
+            workdir,
+            experiment.output_dir,
+            excludes=[remote_protocol.name],
+            compression=self.stream_compression,
+        )
+
+    def sync(
+        self,
+        remote_dir: PathLike,
+        local_dir: PathLike,
+        includes: Sequence[str] = (),
+        excludes: Sequence[str] = (),
+        hashes: bool = False,
+    ) -> List[str]:
+        """Download the files of a directory which are new or changed.
+
+        The robot lists the sizes and modification times (and optionally
+        hashes) of its files, which are compared with the local copy.
+        Downloaded files keep the modification time of the robot so the
+        next call skips them. Safe to call while an experiment is running.
+        Files are always downloaded over the SFTP channel of the ssh
+        connection, starting an scp process per file would be slow.
+
+        Parameters
+        ----------
+        remote_dir : PathLike
+            Directory on the robot to synchronize from.
+        local_dir : PathLike
+            Local directory to synchronize into.
+        includes : Sequence[str], optional
+            Glob patterns of files to synchronize, all files if empty.
+        excludes : Sequence[str], optional
+            Glob patterns of files to skip.
+        hashes : bool, optional
+            Compare files by their sha256 instead of modification time,
+            by default False.
+
+        Returns
+        -------
+        List[str]
+            Relative paths of the transferred files.
+        """
+        command = manifest_command(remote_dir, includes, excludes, hashes)
+        remote = parse_manifest(self.run(command, hide=True).stdout)
+        local = build_manifest(local_dir, includes, excludes, hashes)
+        changed = changed_files(remote, local)
+        sftp = self._sftp()
+        for path in changed:
+            local_path = Path(local_dir) / path
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            sftp.get(Path(remote_dir) / path, local_path)
+            mtime_ns = remote[path].mtime_ns
+            os.utime(local_path, ns=(mtime_ns, mtime_ns))
+        return changed
+
+    def _sync_transfer(
+        self, experiment: Experiment, workdir: Path, remote_protocol: Path
+    ) -> None:
+        self.sync(workdir, experiment.output_dir, excludes=[remote_protocol.name])
 
     def _transfer(
         self, experiment: Experiment, workdir: Path, remote_protocol: Path
     ) -> None:
-        if self.tar_transfer:
+        if self.stream_transfer:
+            self._stream_transfer(experiment, workdir, remote_protocol)
+        elif self.sync_transfer:
+            self._sync_transfer(experiment, workdir, remote_protocol)
+        elif self.tar_transfer:
             self._tar_transfer(experiment, workdir, remote_protocol)
         else:
             self._scp_transfer(experiment, workdir, remote_protocol)
 
-    def run(self, command: str) -> Result:
+    def run_streaming(self, command: str, stdout: LogWriter, stderr: LogWriter) -> int:
+        """Run command on remote shell, writing its output as it arrives.
+
+        Unlike :meth:`run`, the output is not kept in memory.
+
+        Parameters
+        ----------
+        command : str
+            The command to run.
+        stdout : LogWriter
+            Writer for the standard output of the command.
+        stderr : LogWriter
+            Writer for the standard error of the command.
+
+        Returns
+        -------
+        int
+            The exit code of the command.
+        """
+        self.conn.open()
+        channel = self.conn.transport.open_session()
+        try:
+            channel.exec_command(command)
+            pump_streams(
+                lambda: channel.recv(32768),
+                lambda: channel.recv_stderr(32768),
+                stdout.write,
+                stderr.write,
+            )
+            returncode: int = channel.recv_exit_status()
+        finally:
+            channel.close()
+        return returncode
+
+    def open_tunnel(self, port: int) -> "Channel":
+        """Connect to a port on the localhost of the robot through the ssh connection.
+
+        Parameters
+        ----------
+        port : int
+            Port on the robot.
+
+        Returns
+        -------
+        paramiko.Channel
+            A socket-like channel, close it when done.
+        """
+        self.conn.open()
+        return self.conn.transport.open_channel(
+            "direct-tcpip", ("127.0.0.1", port), ("127.0.0.1", 0)
+        )
+
+    def run(self, command: str, **kwargs: Any) -> "Result":
         """Run command on remote shell.
 
         Parameters
         ----------
         command : str
             The command to run.
+        **kwargs : Any
+            Keyword arguments passed to :meth:`fabric.Connection.run`,
+            e.g. :code:`warn=True` to not raise on a non-zero exit code.
 
         Returns
         -------
         invoke.runners.Result
             A container for information about the result of a command execution.
         """
-        return self.conn.run(command)
+        return self.conn.run(command, **kwargs)
 
 
 class Robot:
@@ -243,12 +597,121 @@ class Robot:
             return self.run_local(experiment)
         return self.run_remote(experiment)
 
+    async def run_experiment_async(self, experiment: Experiment) -> int:
+        """Like :meth:`run_experiment`, without blocking the event loop.
+
+        By default :meth:`run_experiment` runs in the default executor of
+        the loop, override to run experiments with non-blocking I/O.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.run_experiment, experiment)
+
     def run_remote(self, experiment: Experiment) -> int:
         raise NotImplementedError
 
     def run_local(self, experiment: Experiment) -> int:
         raise NotImplementedError
 
+    def run_experiment_batch(self, experiments: List[Experiment]) -> List[int]:
+        """Run several experiments within a single protocol run.
+
+        Batches always run in a new opentrons_execute or opentrons_simulate
+        process, :obj:`OpentronsRobotConfig.daemon_port` is not used. Logs
+        are written once the batch exits, :obj:`OpentronsRobotConfig.stream_logs`
+        is not supported either.
+
+        Parameters
+        ----------
+        experiments : List[Experiment]
+            The experiments to run in order.
+
+        Returns
+        -------
+        List[int]
+            The returncode of each experiment. Experiments which did not
+            run because an earlier one failed have a returncode of -1.
+        """
+        if self._run_local:
+            return self.run_local_batch(experiments)
+        return self.run_remote_batch(experiments)
+
+    def run_remote_batch(self, experiments: List[Experiment]) -> List[int]:
+        raise NotImplementedError
+
+    def run_local_batch(self, experiments: List[Experiment]) -> List[int]:
+        raise NotImplementedError
+
+    def resources(self) -> Dict[str, int]:
+        """Units left of each consumable, e.g. :code:`{"tips": 93, "wells": 95}`.
+
+        Used to schedule experiments, consumables which are not listed are
+        treated as unlimited.
+        """
+        return {}
+
+    def labware(self) -> Set[str]:
+        """Names of the labware and instruments loaded on the deck."""
+        return set()
+
+    def requirements(self, *args: Any, **kwargs: Any) -> Requirements:
+        """What an experiment submitted with these arguments needs from the robot."""
+        return Requirements()
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Json serializable labware state, journaled after each experiment is set up."""
+        return {}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Restore the labware state returned by :meth:`checkpoint`."""
+        return None
+
+    def load_experiment(
+        self, name: str, output_dir: Path, returncode: int
+    ) -> Experiment:
+        """Rebuild an experiment which already ran, e.g. when resuming a workflow.
+
+        Parameters
+        ----------
+        name : str
+            Name of the experiment.
+        output_dir : Path
+            Output directory of the experiment, holding its config.
+        returncode : int
+            The returncode the experiment exited with.
+        """
+        config_class = self.protocol_config_class
+        if isinstance(config_class, ProtocolConfig):
+            config_class = type(config_class)
+        cfg = config_class.from_yaml(output_dir / "config.yaml")
+        experiment = Experiment(name, output_dir.parent, cfg, exist_ok=True)
+        experiment.returncode = returncode
+        return experiment
+
+    def on_command(self, experiment: Experiment, command: ProtocolCommand) -> None:
+        """Called for each command echoed by a running protocol.
+
+        Only called when logs are streamed, override to report progress.
+        """
+        return None
+
+    def finish_experiment(self, experiment: Experiment) -> None:
+        """Transfer results and clean up after :meth:`run_experiment`.
+
+        Does not need the deck, so it runs while the robot executes the
+        next experiment.
+        """
+        return None
+
+    async def finish_experiment_async(self, experiment: Experiment) -> None:
+        """Like :meth:`finish_experiment`, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.finish_experiment, experiment)
+
+    def finish_experiment_batch(self, experiments: List[Experiment]) -> None:
+        """Transfer results and clean up after :meth:`run_experiment_batch`."""
+        for experiment in experiments:
+            self.finish_experiment(experiment)
+
     def run(self, *args: Any, **kwargs: Any) -> None:
         """Implement protocol here."""
         raise NotImplementedError
@@ -265,86 +728,519 @@ class Robot:
         return None
 
 
+def _parse_returncodes(text: str, n: int, default: int) -> List[int]:
+    # One line per experiment, empty if the experiment did not run
+    lines = (text.splitlines() + [""] * n)[:n]
+    return [int(line) if line.strip() else default for line in lines]
+
+
+def _copy_future(source: "Future[Any]", target: "Future[Any]") -> None:
+    """Resolve :obj:`target` like :obj:`source`, once it is done."""
+    if source.cancelled():
+        # A running target can not be cancelled, it fails instead
+        if not target.cancel() and not target.done():
+            target.set_exception(CancelledError())
+        return
+    if target.done():
+        # Cancelled by its submitter
+        return
+    # Once running the target can no longer be cancelled by its submitter
+    if not target.running() and not target.set_running_or_notify_cancel():
+        return
+    exception = source.exception()
+    if exception is not None:
+        target.set_exception(exception)
+    else:
+        target.set_result(source.result())
+
+
 class RobotPool:
     """Class to manage experiments to be run. Will handle distributing
     protocols and running them on any/all OT2's available."""
 
-    def __init__(self, robots: List[Robot]) -> None:
+    def __init__(
+        self,
+        robots: List[Robot],
+        io_workers: Optional[int] = None,
+        policy: Optional[SchedulingPolicy] = None,
+        max_queued: Optional[int] = None,
+        overflow: str = "block",
+        journal: Optional[Journal] = None,
+        dedup: Optional[Deduplicator] = None,
+    ) -> None:
         """Initialize the experiment manager with required environmental information.
 
         Parameters
         ----------
         robots : List[Robots]
             List of robots available.
+        io_workers : Optional[int], optional
+            Number of threads transferring results, cleaning up and post
+            processing finished experiments, by default one per robot.
+        policy : Optional[SchedulingPolicy], optional
+            Decides which robot runs each experiment, by default the one
+            with the most consumables left, see :class:`LabwareAwarePolicy`.
+        max_queued : Optional[int], optional
+            Maximum number of experiments waiting to start, unbounded if None.
+        overflow : str, optional
+            What to do when :obj:`max_queued` experiments are waiting, one of
+            "block", "reject" or "drop_lowest", see :class:`ExperimentQueue`.
+        journal : Optional[Journal], optional
+            Journal recording submissions, labware allocations and
+            completions, see :meth:`resume`. Submissions of experiments it
+            recorded as completed are not run again.
+        dedup : Optional[Deduplicator], optional
+            Returns the results of equivalent experiments which ran or are
+            running instead of submitting an experiment again.
         """
+        import pebble
+
         self.robots = robots
         self.pool = pebble.ThreadPool(max_workers=len(self.robots))
+        # Robots are freed as soon as their protocol exits, the remaining
+        # work of an experiment runs here so the next one can start.
+        self.io_pool = pebble.ThreadPool(max_workers=io_workers or len(self.robots))
+        self.dispatcher = RobotDispatcher(robots, policy)
+        self.queue = ExperimentQueue(max_queued, overflow)
+        self.journal = journal
+        self.dedup = dedup
+        self._resumed: Dict[str, Future[Experiment]] = {}
 
     def __del__(self) -> None:
-        self.pool.close()
-        self.pool.join()
-
-    def submit(self, name: str, *args: Any, **kwargs: Any) -> Future[Experiment]:
-        fut = self.pool.schedule(self._run, args=(name, *args), kwargs=kwargs)
-        if len(self.robots) == 1:
-            # wait returns a named tuple of futures wait().done is
-            # a set of completed futures and since we only have a single
-            # thread in this case, it will have one element so we pop it
-            # from the set and return the Future.
-            return wait([fut]).done.pop()
-        return fut
-
-    @pebble.synchronized
-    def _get_robot(self) -> Robot:
-        while True:
-            for robot in self.robots:
-                if not robot.running:
-                    robot.running = True
-                    return robot
-            if not robot.run_local:
-                time.sleep(10)  # Wait 10 seconds and try again
-
-    def _run(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        for pool in (self.pool, self.io_pool):
+            pool.close()
+            pool.join()
+
+    def _enqueue(
+        self,
+        priority: int,
+        run: Callable[..., Tuple[Any, ...]],
+        finish: Callable[..., Any],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+    ) -> "Future[Any]":
+        future: Future[Any] = Future()
+        self.queue.put((run, finish, args, kwargs, future), future, priority)
+        # Each worker task starts the queued experiment with the highest
+        # priority at the time, not necessarily the one queued here.
+        self.pool.schedule(self._run_next)
+        return future
+
+    def _run_next(self) -> None:
+        item = self.queue.get()
+        if item is None:
+            # Taken by an earlier task after others were cancelled or dropped
+            return
+        run, finish, args, kwargs, future = item
+        try:
+            result = run(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        # Once the robot is free, finish the experiment in the I/O pool
+        finish_future = self.io_pool.schedule(finish, args=result)
+        finish_future.add_done_callback(lambda f: _copy_future(f, future))
+
+    def submit(
+        self, name: str, *args: Any, priority: int = 0, **kwargs: Any
+    ) -> Future[Experiment]:
+        """Queue an experiment to run on the next robot available.
+
+        Parameters
+        ----------
+        name : str
+            Name of the experiment.
+        *args : Any
+            Arguments of the experiment, passed to :meth:`Robot.setup_experiment`.
+        priority : int, optional
+            Queued experiments with higher priorities start first, by default 0.
+        **kwargs : Any
+            Keyword arguments of the experiment.
+
+        Returns
+        -------
+        Future[Experiment]
+            Resolves once the experiment has finished. Cancel it to remove
+            the experiment from the queue if it has not started yet.
+
+        Raises
+        ------
+        QueueFullError
+            If the queue is full and its overflow policy rejects the experiment.
+        """
+        future = self._journaled(name)
+        if future is not None:
+            return future
+        submit = partial(self._submit, name, args, kwargs, priority)
+        if self.dedup is not None:
+            return self.dedup.submit(name, args, kwargs, submit, self._load)
+        return submit()
+
+    def _submit(
+        self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], priority: int
+    ) -> Future[Experiment]:
+        if self.journal is not None:
+            self.journal.submitted(name, args, kwargs, priority)
+        return self._enqueue(priority, self._run, self._finish, (name, *args), kwargs)
+
+    def _load(self, entry: MemoEntry) -> Experiment:
+        # The robots of a pool share their protocol config class
+        return self.robots[0].load_experiment(entry.name, entry.output_dir, 0)
+
+    def _journaled(self, name: str) -> Optional[Future[Experiment]]:
+        # Future of an experiment the journal knows about from a previous run
+        if self.journal is None:
+            return None
+        if name in self._resumed:
+            return self._resumed[name]
+        state = self.journal.state
+        if name not in state.completed:
+            return None
+        returncode = state.completed[name]
+        future: Future[Experiment] = Future()
+        if returncode != 0:
+            future.set_exception(
+                ValueError(f"Experiment {name} exited with returncode: {returncode}")
+            )
+        else:
+            robot, output_dir = state.allocations[name]
+            experiment = self.robots[robot].load_experiment(
+                name, output_dir, returncode
+            )
+            future.set_result(experiment)
+        return future
+
+    def resume(self) -> List[Future[Experiment]]:
+        """Pick up where the journal of a crashed workflow left off.
+
+        Restores the labware state of the robots and resubmits experiments
+        which did not complete, removing the output of interrupted runs.
+        Resubmitting them again returns the same future, and completed
+        experiments are returned without running them.
+
+        Returns
+        -------
+        List[Future[Experiment]]
+            Futures of the resubmitted experiments, in submission order.
+        """
+        if self.journal is None:
+            raise ValueError("Resuming needs a journal")
+        state = self.journal.state
+        for index, robot_state in state.robots.items():
+            self.robots[index].restore(robot_state)
+        futures = []
+        for name in state.pending():
+            if name in self._resumed:
+                continue
+            if name in state.allocations:
+                # The labware of an interrupted run is not reused, the
+                # experiment gets new labware and a fresh output directory.
+                shutil.rmtree(state.allocations[name][1], ignore_errors=True)
+            args, kwargs, priority = state.submissions[name]
+            future = self._enqueue(
+                priority, self._run, self._finish, (name, *args), kwargs
+            )
+            self._resumed[name] = future
+            futures.append(future)
+        return futures
+
+    def _journal_allocation(self, robot: Robot, experiment: Experiment) -> None:
+        if self.journal is not None:
+            self.journal.allocated(
+                experiment.name,
+                self.robots.index(robot),
+                robot.checkpoint(),
+                experiment.output_dir,
+            )
+
+    def _journal_completion(self, experiment: Experiment) -> None:
+        if self.journal is not None:
+            self.journal.completed(experiment.name, experiment.returncode)
+
+    def submit_batch(
+        self, requests: List[Tuple[str, Dict[str, Any]]], priority: int = 0
+    ) -> List[Future[Experiment]]:
+        """Run several experiments on the same robot within a single protocol run.
+
+        Parameters
+        ----------
+        requests : List[Tuple[str, Dict[str, Any]]]
+            The name and keyword arguments of each experiment, as
+            passed to :meth:`submit`.
+        priority : int, optional
+            Queued batches with higher priorities start first, by default 0.
+
+        Returns
+        -------
+        List[Future[Experiment]]
+            A future for each experiment, in the order of :obj:`requests`.
+            The batch is removed from the queue once all of them are cancelled.
+        """
+        journaled = [self._journaled(name) for name, _ in requests]
+        if self.dedup is None:
+            requests = [
+                request
+                for request, future in zip(requests, journaled)
+                if future is None
+            ]
+            submitted = iter(self._submit_batch(requests, priority) if requests else [])
+            return [
+                next(submitted) if future is None else future for future in journaled
+            ]
+
+        # Experiments the deduplicator lets through run together in a batch
+        deferred: List[Tuple[Tuple[str, Dict[str, Any]], Future[Experiment]]] = []
+
+        def defer(request: Tuple[str, Dict[str, Any]]) -> Future[Experiment]:
+            future: Future[Experiment] = Future()
+            deferred.append((request, future))
+            return future
+
+        futures = []
+        for request, future in zip(requests, journaled):
+            name, kwargs = request
+            if future is None:
+                future = self.dedup.submit(
+                    name, (), kwargs, partial(defer, request), self._load
+                )
+            futures.append(future)
+        if deferred:
+            submitted = self._submit_batch(
+                [request for request, _ in deferred], priority
+            )
+            for (_, target), source in zip(deferred, submitted):
+                source.add_done_callback(partial(_copy_future, target=target))
+        return futures
+
+    def _submit_batch(
+        self, requests: List[Tuple[str, Dict[str, Any]]], priority: int
+    ) -> List[Future[Experiment]]:
+        if self.journal is not None:
+            for name, kwargs in requests:
+                self.journal.submitted(name, (), kwargs, priority)
+        futures: List[Future[Experiment]] = [Future() for _ in requests]
+        batch_future = self._enqueue(
+            priority, self._run_batch, self._finish_batch, (requests,), {}
+        )
+
+        def cancel(future: Future[Experiment]) -> None:
+            if all(future.cancelled() for future in futures):
+                batch_future.cancel()
+
+        def resolve(batch_future: Future[List[Experiment]]) -> None:
+            pending = [future for future in futures if not future.done()]
+            if batch_future.cancelled():
+                for future in pending:
+                    future.cancel()
+                return
+            exception = batch_future.exception()
+            if exception is not None:
+                for future in pending:
+                    future.set_exception(exception)
+                return
+            for future, experiment in zip(futures, batch_future.result()):
+                if future.done():
+                    continue
+                if experiment.returncode != 0:
+                    future.set_exception(
+                        ValueError(
+                            f"Experiment {experiment.name} exited with "
+                            f"returncode: {experiment.returncode}"
+                        )
+                    )
+                else:
+                    future.set_result(experiment)
+
+        for future in futures:
+            future.add_done_callback(cancel)
+        batch_future.add_done_callback(resolve)
+        return futures
+
+    def _run(
+        self, name: str, *args: Any, **kwargs: Any
+    ) -> Tuple[Robot, Experiment, Tuple[Any, ...], Dict[str, Any]]:
         """Execute an experiment object.
 
         Will execute an experiment according to the paramters of the experiment.
-        Can determine to run locally or on the OT2.
+        Can determine to run locally or on the OT2. The robot is freed as
+        soon as the protocol exits, see :meth:`_finish` for the rest.
 
         Parameters
         ----------
-        experiment : Experiment
-            Protocol to be run. Contains necesary information to run trial.
+        name : str
+            Name of the experiment to run.
 
         Returns
         -------
-        int
-            Return code of experiment. 0 is success, anything other than 0 is a failure
+        Tuple[Robot, Experiment, Tuple[Any, ...], Dict[str, Any]]
+            The robot the experiment ran on, the experiment and the
+            arguments needed to finish it.
         """
-        # Get a robot if one is available, or block.
-        robot = self._get_robot()
+        # Get a robot able to run the experiment if one is available, or block.
+        robot = self.dispatcher.acquire([(args, kwargs)])
+        try:
+            # Define the experiment to run
+            experiment = robot.setup_experiment(name, *args, **kwargs)
+            self._journal_allocation(robot, experiment)
+
+            # Run any pre-execution steps
+            robot.pre_experiment(experiment, *args, **kwargs)
+
+            # Run the experiment
+            experiment.returncode = robot.run_experiment(experiment)
+        except BaseException:
+            self.dispatcher.done(robot)
+            raise
+        finally:
+            # Free robot for next experiment
+            self.dispatcher.release(robot)
+
+        return robot, experiment, args, kwargs
+
+    def _finish(
+        self,
+        robot: Robot,
+        experiment: Experiment,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+    ) -> Experiment:
+        try:
+            # Transfer results and clean up the robot
+            robot.finish_experiment(experiment)
+            self._journal_completion(experiment)
+
+            # TODO: This should probably be checked elsewhere
+            if experiment.returncode != 0:
+                raise ValueError(
+                    f"Experiment {experiment.name} exited with "
+                    f"returncode: {experiment.returncode}"
+                )
+
+            # If experiment was successful, run post-execution steps
+            robot.post_experiment(experiment, *args, **kwargs)
+        finally:
+            self.dispatcher.done(robot)
 
-        # Define the experiment to run
-        experiment = robot.setup_experiment(name, *args, **kwargs)
+        return experiment
 
-        # Run any pre-execution steps
-        robot.pre_experiment(experiment, *args, **kwargs)
+    def _run_batch(
+        self, requests: List[Tuple[str, Dict[str, Any]]]
+    ) -> Tuple[Robot, List[Experiment], List[Tuple[str, Dict[str, Any]]]]:
+        robot = self.dispatcher.acquire([((), kwargs) for _, kwargs in requests])
+        try:
+            # Labware of earlier experiments is handed back if a later
+            # experiment of the batch can not be set up.
+            state = robot.checkpoint()
+            experiments = []
+            try:
+                for name, kwargs in requests:
+                    experiment = robot.setup_experiment(name, **kwargs)
+                    self._journal_allocation(robot, experiment)
+                    robot.pre_experiment(experiment, **kwargs)
+                    experiments.append(experiment)
+            except BaseException:
+                robot.restore(state)
+                raise
+
+            returncodes = robot.run_experiment_batch(experiments)
+            for experiment, returncode in zip(experiments, returncodes):
+                experiment.returncode = returncode
+        except BaseException:
+            self.dispatcher.done(robot)
+            raise
+        finally:
+            self.dispatcher.release(robot)
+
+        return robot, experiments, requests
+
+    def _finish_batch(
+        self,
+        robot: Robot,
+        experiments: List[Experiment],
+        requests: List[Tuple[str, Dict[str, Any]]],
+    ) -> List[Experiment]:
+        try:
+            robot.finish_experiment_batch(experiments)
+            for experiment in experiments:
+                self._journal_completion(experiment)
+            for experiment, (_, kwargs) in zip(experiments, requests):
+                if experiment.returncode == 0:
+                    robot.post_experiment(experiment, **kwargs)
+        finally:
+            self.dispatcher.done(robot)
+        return experiments
+
+
+class AsyncRobotPool:
+    """Run experiments on a fleet of robots from an asyncio event loop.
+
+    Unlike :class:`RobotPool`, no thread is kept per robot, experiments
+    waiting for a robot are coroutines. Robots run experiments through
+    :meth:`Robot.run_experiment_async` and :meth:`Robot.finish_experiment_async`.
+    """
 
-        # Run the experiment
-        returncode = robot.run_experiment(experiment)
+    def __init__(
+        self, robots: List[Robot], policy: Optional[SchedulingPolicy] = None
+    ) -> None:
+        """Initialize the pool.
 
-        # TODO: This should probably be checked elsewhere
-        if returncode != 0:
-            raise ValueError(
-                f"Experiment {experiment.name} exited with returncode: {returncode}"
-            )
+        Parameters
+        ----------
+        robots : List[Robot]
+            The robots to run experiments on.
+        policy : Optional[SchedulingPolicy], optional
+            Decides which robot runs an experiment, by default the robot
+            with the most consumables left, see :class:`LabwareAwarePolicy`.
+        """
+        self.robots = robots
+        self.dispatcher = RobotDispatcher(robots, policy)
 
-        experiment.returncode = returncode
+    def submit(
+        self, name: str, *args: Any, **kwargs: Any
+    ) -> "asyncio.Future[Experiment]":
+        """Start an experiment on the next robot available.
 
-        # If experiment was successful, run post-execution steps
-        robot.post_experiment(experiment, *args, **kwargs)
+        Must be called with the event loop running.
 
-        # Free robot for next experiment
-        robot.running = False
+        Parameters
+        ----------
+        name : str
+            Name of the experiment.
+        *args : Any
+            Arguments of the experiment, passed to :meth:`Robot.setup_experiment`.
+        **kwargs : Any
+            Keyword arguments of the experiment.
+
+        Returns
+        -------
+        asyncio.Future[Experiment]
+            Resolves once the experiment has finished. Cancel it to withdraw
+            the experiment if it is still waiting for a robot.
+        """
+        return asyncio.ensure_future(self._submit(name, args, kwargs))
+
+    async def _submit(
+        self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]
+    ) -> Experiment:
+        robot = await self.dispatcher.acquire_async([(args, kwargs)])
+        try:
+            try:
+                experiment = robot.setup_experiment(name, *args, **kwargs)
+                robot.pre_experiment(experiment, *args, **kwargs)
+                experiment.returncode = await robot.run_experiment_async(experiment)
+            finally:
+                # Free robot for next experiment before transferring results
+                self.dispatcher.release(robot)
+
+            await robot.finish_experiment_async(experiment)
+            if experiment.returncode != 0:
+                raise ValueError(
+                    f"Experiment {experiment.name} exited with "
+                    f"returncode: {experiment.returncode}"
+                )
+            robot.post_experiment(experiment, *args, **kwargs)
+        finally:
+            self.dispatcher.done(robot)
 
         return experiment
 
@@ -358,6 +1254,20 @@ class OpenTronsRobot(Robot):
             "opentrons_simulate" if config.run_simulation else "opentrons_execute"
         )
         self.exe = Path(config.opentrons_path) / opentrons_exe
+        self.stream_logs = config.stream_logs
+        self.daemon_port = config.daemon_port
+        self.run_simulation = config.run_simulation
+        self.simulation_workers = config.simulation_workers
+        self.protocol_cache: Optional[ProtocolCache] = None
+        if config.protocol_cache_dir is not None:
+            self.protocol_cache = ProtocolCache(
+                config.protocol_cache_dir, config.protocol_cache_size
+            )
+        self.result_cache: Optional[ResultCache] = None
+        if config.result_cache_dir is not None:
+            self.result_cache = ResultCache(
+                config.result_cache_dir, config.result_cache_size
+            )
 
     def imports(self) -> None:
         """Include imports here."""
@@ -377,21 +1287,203 @@ class OpenTronsRobot(Robot):
             metadata=self.metadata,
             funcs=funcs,
             template_file=template_file,
+            cache=self.protocol_cache,
         )
 
     def run_local(self, experiment: Experiment) -> int:
+        self._prepare_local(experiment)
+        if self._restore_result(experiment):
+            return 0
+        returncode = self._execute_local(experiment)
+        self._store_result(experiment, returncode)
+        return returncode
+
+    async def run_experiment_async(self, experiment: Experiment) -> int:
+        if not self._run_local:
+            # paramiko blocks, remote runs use a thread of the executor
+            return await super().run_experiment_async(experiment)
+        self._prepare_local(experiment)
+        if self._restore_result(experiment):
+            return 0
+        returncode = await self._execute_local_async(experiment)
+        self._store_result(experiment, returncode)
+        return returncode
+
+    def _prepare_local(self, experiment: Experiment) -> None:
         # In the case of local runs, set the workdir to the output directory
         experiment.cfg.workdir = experiment.output_dir
         # Write a yaml protocol configuration to local
         experiment.cfg.write_yaml(experiment.yaml)
+
+    def _restore_result(self, experiment: Experiment) -> bool:
+        if self.result_cache is None:
+            return False
+        if not self.result_cache.get(
+            self.result_key(experiment), experiment.output_dir
+        ):
+            return False
+        logger.debug(
+            f"Restored cached results of {experiment.name}, "
+            f"hit rate: {self.result_cache.hit_rate:.2f}"
+        )
+        return True
+
+    def _store_result(self, experiment: Experiment, returncode: int) -> None:
+        if self.result_cache is None or returncode != 0:
+            return
+        # The inputs are written for every experiment anyway
+        excludes = [experiment.protocol.name, experiment.yaml.name]
+        self.result_cache.put(
+            self.result_key(experiment), experiment.output_dir, excludes
+        )
+
+    def result_key(self, experiment: Experiment) -> str:
+        """Hash the inputs of a simulation, i.e. the protocol and its config.
+
+        The workdir is left out of the config since it differs for each
+        experiment without changing the results.
+        """
+        return hash_strings(
+            experiment.protocol.read_text(),
+            experiment.cfg.json(exclude={"workdir"}, sort_keys=True),
+        )
+
+    def _execute_local(self, experiment: Experiment) -> int:
+        if self.simulation_workers > 0:
+            return self._simulate(
+                experiment.protocol,
+                experiment.output_dir,
+                {CONFIG_ENV: str(experiment.yaml)},
+            )
         # The -d option corresponds to the opentrons custom-data-file argument
         # which passes the config file to the protocol.bundled_data field
-        command = f"opentrons_simulate {experiment.protocol} -d {experiment.yaml}"
+        command = f"{self._local_exe} {experiment.protocol} -d {experiment.yaml}"
+        if self.stream_logs:
+            return self._run_local_streaming(experiment, command)
         proc = subprocess.run(command, shell=True, capture_output=True)
         _write_log(proc.stdout, experiment.output_dir / "stdout.log")
         _write_log(proc.stderr, experiment.output_dir / "stderr.log")
         return proc.returncode
 
+    async def _execute_local_async(self, experiment: Experiment) -> int:
+        if self.simulation_workers > 0:
+            return await asyncio.wrap_future(
+                self._schedule_simulation(
+                    experiment.protocol,
+                    experiment.output_dir,
+                    {CONFIG_ENV: str(experiment.yaml)},
+                )
+            )
+        command = f"{self._local_exe} {experiment.protocol} -d {experiment.yaml}"
+        proc = await asyncio.create_subprocess_shell(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        assert proc.stdout is not None and proc.stderr is not None
+        if self.stream_logs:
+            stdout, stderr = self._log_writers(experiment)
+            with stdout, stderr:
+                await asyncio.gather(
+                    pump_async(proc.stdout, stdout.write),
+                    pump_async(proc.stderr, stderr.write),
+                )
+            return await proc.wait()
+        out, err = await proc.communicate()
+        _write_log(out, experiment.output_dir / "stdout.log")
+        _write_log(err, experiment.output_dir / "stderr.log")
+        assert proc.returncode is not None
+        return proc.returncode
+
+    @property
+    def _local_exe(self) -> str:
+        # Local runs are always simulated, like in the worker pool. The
+        # default opentrons_path points to the robot, fall back to the
+        # executable on the local PATH if it does not exist here.
+        exe = self.exe.with_name("opentrons_simulate")
+        return str(exe) if exe.exists() else exe.name
+
+    def _simulate(
+        self,
+        protocol: Path,
+        output_dir: Path,
+        env: Dict[str, str],
+        prefix: str = "",
+    ) -> int:
+        return self._schedule_simulation(protocol, output_dir, env, prefix).result()
+
+    def _schedule_simulation(
+        self,
+        protocol: Path,
+        output_dir: Path,
+        env: Dict[str, str],
+        prefix: str = "",
+    ) -> "Future[int]":
+        from ot2util.simulation import get_simulation_pool
+
+        pool = get_simulation_pool(self.simulation_workers)
+        return pool.schedule(
+            protocol,
+            output_dir / f"{prefix}stdout.log",
+            output_dir / f"{prefix}stderr.log",
+            env,
+        )
+
+    def _log_writers(self, experiment: Experiment) -> Tuple[LogWriter, LogWriter]:
+        def callback(command: ProtocolCommand) -> None:
+            self.on_command(experiment, command)
+
+        return (
+            LogWriter(experiment.output_dir / "stdout.log", callback),
+            LogWriter(experiment.output_dir / "stderr.log"),
+        )
+
+    def _run_local_streaming(self, experiment: Experiment, command: str) -> int:
+        proc = subprocess.Popen(
+            command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        assert proc.stdout is not None and proc.stderr is not None
+        stdout, stderr = self._log_writers(experiment)
+        with stdout, stderr:
+            pump_streams(
+                read_chunks(proc.stdout),
+                read_chunks(proc.stderr),
+                stdout.write,
+                stderr.write,
+            )
+        return proc.wait()
+
+    def sync_results(
+        self,
+        experiment: Experiment,
+        includes: Sequence[str] = (),
+        excludes: Sequence[str] = (),
+    ) -> List[str]:
+        """Pull new or changed result files of an experiment from the robot.
+
+        Can be called while the experiment is running to look at partial
+        results, only files changed since the last call are transferred.
+
+        Parameters
+        ----------
+        experiment : Experiment
+            A remote experiment which has been started.
+        includes : Sequence[str], optional
+            Glob patterns of files to pull, all files if empty.
+        excludes : Sequence[str], optional
+            Glob patterns of files to skip, the protocol is always skipped.
+
+        Returns
+        -------
+        List[str]
+            Relative paths of the transferred files.
+        """
+        if self._ran_locally(experiment):
+            return []
+        assert self.conn is not None
+        excludes = [experiment.protocol.name, *excludes]
+        return self.conn.sync(
+            experiment.cfg.workdir, experiment.output_dir, includes, excludes
+        )
+
     def run_remote(self, experiment: Experiment) -> int:
         assert self.conn is not None
 
@@ -400,32 +1492,175 @@ class OpenTronsRobot(Robot):
         # Write a yaml protocol configuration to local
         experiment.cfg.write_yaml(experiment.yaml)
 
-        # Adjust paths to remote workdir
+        # Adjust paths to remote workdir, each experiment has its own
+        # config so that experiments being cleaned up do not clash.
         remote_protocol = workdir / experiment.protocol.name
-        # TODO: It would be cleaner if remote_yaml was stored in workdir
-        #       but there is a bug in the opentrons code that does not
-        #       propogate the -d argument used to pass the config file
-        #       to the protocol. See protocol.py for more explanation.
-        remote_yaml = workdir.parent / experiment.yaml.name
+        remote_yaml = workdir / experiment.yaml.name
 
         # Transfer protocol file and configuration over to remote
         self.conn.run(f"mkdir -p {workdir}")
-        self.conn._scp(experiment.protocol, f"{self.conn.host}:{remote_protocol}")
-        self.conn._scp(experiment.yaml, f"{self.conn.host}:{remote_yaml}")
-
-        # Execute remote experiment
-        result: Result = self.conn.run(f"{self.exe} {remote_protocol}")
+        self.conn.put(experiment.protocol, remote_protocol)
+        self.conn.put(experiment.yaml, remote_yaml)
+
+        # Execute remote experiment, the -d argument is not passed on by
+        # opentrons_execute so the config path is set in the environment.
+        if self.daemon_port is not None:
+            return self._run_daemon(experiment, remote_protocol, remote_yaml)
+        command = f"{CONFIG_ENV}={remote_yaml} {self.exe} {remote_protocol}"
+        if self.stream_logs:
+            stdout, stderr = self._log_writers(experiment)
+            with stdout, stderr:
+                return self.conn.run_streaming(command, stdout, stderr)
+        result: "Result" = self.conn.run(command, warn=True)
         _write_log(result.stdout, experiment.output_dir / "stdout.log")
         _write_log(result.stderr, experiment.output_dir / "stderr.log")
         returncode: int = result.exited
-        if returncode != 0:
-            # Return early since something went wrong
-            return returncode
+        return returncode
+
+    def _run_daemon(
+        self, experiment: Experiment, remote_protocol: Path, remote_yaml: Path
+    ) -> int:
+        assert self.conn is not None and self.daemon_port is not None
+        from ot2util import daemon
+
+        stdout, stderr = self._log_writers(experiment)
+        with stdout, stderr, self.conn.open_tunnel(self.daemon_port) as channel:
+            return daemon.submit(
+                channel,
+                remote_protocol,
+                stdout,
+                stderr,
+                simulate=self.run_simulation,
+                env={CONFIG_ENV: str(remote_yaml)},
+            )
+
+    def _ran_locally(self, experiment: Experiment) -> bool:
+        # Local runs write their results into the output directory
+        return self.conn is None or experiment.cfg.workdir == experiment.output_dir
+
+    def finish_experiment(self, experiment: Experiment) -> None:
+        if self._ran_locally(experiment):
+            return
+        assert self.conn is not None
+        if experiment.returncode != 0:
+            # Leave the workdir on the robot to debug the failure
+            return
+
+        workdir = experiment.cfg.workdir
+        remote_protocol = workdir / experiment.protocol.name
 
         # Transfer experiment results back to local
         self.conn._transfer(experiment, workdir, remote_protocol)
 
         # Clean up experiment on remote
-        self.conn.run(f"rm -r {workdir} {remote_yaml}")
+        self.conn.run(f"rm -r {workdir}")
 
-        return returncode
+    async def finish_experiment_async(self, experiment: Experiment) -> None:
+        if not self._ran_locally(experiment):
+            await super().finish_experiment_async(experiment)
+
+    def _batch_files(self, experiments: List[Experiment]) -> Tuple[Path, Path]:
+        # The batch protocol and config are stored with the first experiment
+        batch_protocol = experiments[0].output_dir / "batch_protocol.py"
+        batch_yaml = experiments[0].output_dir / "batch.yaml"
+        write_batch_template(batch_protocol, experiments[0].protocol)
+        return batch_protocol, batch_yaml
+
+    def _remote_batch_dir(self, experiments: List[Experiment]) -> Path:
+        assert self.conn is not None
+        # /root/test1/experiment-1-batch
+        return self.conn.remote_dir / f"{experiments[0].name}-batch"
+
+    def run_local_batch(self, experiments: List[Experiment]) -> List[int]:
+        batch_protocol, batch_yaml = self._batch_files(experiments)
+        entries = []
+        for experiment in experiments:
+            experiment.cfg.workdir = experiment.output_dir
+            experiment.cfg.write_yaml(experiment.yaml)
+            entries.append(
+                BatchEntryConfig(config=experiment.yaml, workdir=experiment.output_dir)
+            )
+        BatchConfig(experiments=entries).write_yaml(batch_yaml)
+
+        if self.simulation_workers > 0:
+            output_dir = experiments[0].output_dir
+            returncode = self._simulate(
+                batch_protocol, output_dir, {BATCH_ENV: str(batch_yaml)}, "batch_"
+            )
+            for experiment in experiments[1:]:
+                for log in ("batch_stdout.log", "batch_stderr.log"):
+                    link_or_copy(output_dir / log, experiment.output_dir / log)
+            default = returncode or -1
+            return [read_returncode(e.output_dir, default) for e in experiments]
+
+        env = {**os.environ, BATCH_ENV: str(batch_yaml)}
+        command = f"{self._local_exe} {batch_protocol}"
+        proc = subprocess.run(command, shell=True, capture_output=True, env=env)
+        # Logs of each experiment are written by the batch, keep the
+        # output of the protocol run itself with every experiment.
+        for experiment in experiments:
+            _write_log(proc.stdout, experiment.output_dir / "batch_stdout.log")
+            _write_log(proc.stderr, experiment.output_dir / "batch_stderr.log")
+
+        default = proc.returncode or -1
+        return [read_returncode(e.output_dir, default) for e in experiments]
+
+    def run_remote_batch(self, experiments: List[Experiment]) -> List[int]:
+        assert self.conn is not None
+
+        batch_protocol, batch_yaml = self._batch_files(experiments)
+        batch_dir = self._remote_batch_dir(experiments)
+        remote_protocol = batch_dir / "protocol.py"
+        remote_batch_yaml = batch_dir / batch_yaml.name
+        self.conn.run(f"mkdir -p {batch_dir}")
+
+        entries, workdirs = [], []
+        for experiment in experiments:
+            # /root/test1/experiment-1
+            workdir = experiment.cfg.workdir = self.conn.remote_dir / experiment.name
+            experiment.cfg.write_yaml(experiment.yaml)
+            remote_yaml = workdir / experiment.yaml.name
+            self.conn.run(f"mkdir -p {workdir}")
+            self.conn.put(experiment.yaml, remote_yaml)
+            entries.append(BatchEntryConfig(config=remote_yaml, workdir=workdir))
+            workdirs.append(workdir)
+        BatchConfig(experiments=entries).write_yaml(batch_yaml)
+
+        self.conn.put(batch_protocol, remote_protocol)
+        self.conn.put(batch_yaml, remote_batch_yaml)
+
+        # Execute all experiments within a single protocol run
+        result: "Result" = self.conn.run(
+            f"{BATCH_ENV}={remote_batch_yaml} {self.exe} {remote_protocol}",
+            warn=True,
+        )
+
+        # Returncodes are written to the workdirs on the robot
+        codes = self.conn.run(
+            "; ".join(
+                f"echo $(cat {workdir / RETURNCODE_FILE} 2>/dev/null)"
+                for workdir in workdirs
+            ),
+            warn=True,
+            hide=True,
+        )
+        for experiment in experiments:
+            _write_log(result.stdout, experiment.output_dir / "batch_stdout.log")
+            _write_log(result.stderr, experiment.output_dir / "batch_stderr.log")
+
+        default = result.exited or -1
+        return _parse_returncodes(codes.stdout, len(experiments), default)
+
+    def finish_experiment_batch(self, experiments: List[Experiment]) -> None:
+        if self.conn is None or experiments[0].cfg.workdir == experiments[0].output_dir:
+            return
+
+        # Transfer results of each experiment back to local
+        batch_dir = self._remote_batch_dir(experiments)
+        remote_protocol = batch_dir / "protocol.py"
+        workdirs = [experiment.cfg.workdir for experiment in experiments]
+        for experiment, workdir in zip(experiments, workdirs):
+            self.conn._transfer(experiment, workdir, remote_protocol)
+
+        # Clean up experiments on remote
+        self.conn.run(f"rm -r {batch_dir} {' '.join(map(str, workdirs))}")
@@ -0,0 +1,151 @@
+"""Write-ahead journal of a workflow to resume it after a crash.
+
+Submissions, labware allocations and completions are appended to a json
+lines file and synced to disk before the step they record takes effect.
+Replaying the journal after a crash restores the labware state of each
+robot, which experiments finished and which still need to run, see
+:meth:`RobotPool.resume`.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from ot2util.config import PathLike
+
+
+class JournalState:
+    """What a journal recorded, rebuilt by replaying it."""
+
+    def __init__(self) -> None:
+        self.submissions: Dict[str, Tuple[List[Any], Dict[str, Any], int]] = {}
+        """Arguments and priority of each submitted experiment, in order."""
+        self.robots: Dict[int, Dict[str, Any]] = {}
+        """Labware state of each robot after its last allocation, by index."""
+        self.allocations: Dict[str, Tuple[int, Path]] = {}
+        """Robot index and output directory of each set up experiment."""
+        self.completed: Dict[str, int] = {}
+        """Returncode of each experiment whose results were collected."""
+
+    def apply(self, record: Dict[str, Any]) -> None:
+        """Update the state with a journal record."""
+        name = record["name"]
+        event = record["event"]
+        if event == "submit":
+            self.submissions[name] = (
+                record["args"],
+                record["kwargs"],
+                record["priority"],
+            )
+        elif event == "allocate":
+            self.robots[record["robot"]] = record["state"]
+            self.allocations[name] = (record["robot"], Path(record["output_dir"]))
+        elif event == "complete":
+            self.completed[name] = record["returncode"]
+        else:
+            raise ValueError(f"Unknown journal event: {event}")
+
+    def pending(self) -> List[str]:
+        """Names of submitted experiments which did not complete, in order."""
+        return [name for name in self.submissions if name not in self.completed]
+
+
+class Journal:
+    """Append-only record of the progress of a workflow."""
+
+    def __init__(self, path: PathLike, resume: bool = False) -> None:
+        """Open the journal.
+
+        Parameters
+        ----------
+        path : PathLike
+            The json lines file to write.
+        resume : bool, optional
+            Whether to replay an existing journal into :obj:`state` and
+            keep appending to it, otherwise it is started from scratch.
+        """
+        self.path = Path(path)
+        self.state = JournalState()
+        if resume and self.path.exists():
+            self._replay()
+        self._file = open(self.path, "a" if resume else "w")
+        self._lock = threading.Lock()
+
+    def _replay(self) -> None:
+        valid = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.state.apply(record)
+                valid += len(line)
+        # The last record may have been cut off by the crash, drop it so
+        # that new records start on a line of their own.
+        os.truncate(self.path, valid)
+
+    def close(self) -> None:
+        """Close the journal file."""
+        self._file.close()
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.state.apply(record)
+
+    def submitted(
+        self,
+        name: str,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        priority: int = 0,
+    ) -> None:
+        """Record that an experiment was submitted, its arguments need to be json serializable."""
+        self._append(
+            {
+                "event": "submit",
+                "name": name,
+                "args": list(args),
+                "kwargs": kwargs,
+                "priority": priority,
+            }
+        )
+
+    def allocated(
+        self, name: str, robot: int, state: Dict[str, Any], output_dir: Path
+    ) -> None:
+        """Record that an experiment was set up, taking labware from a robot.
+
+        Parameters
+        ----------
+        name : str
+            Name of the experiment.
+        robot : int
+            Index of the robot in its pool.
+        state : Dict[str, Any]
+            Labware state of the robot after the allocation, see
+            :meth:`Robot.checkpoint`.
+        output_dir : Path
+            Output directory of the experiment.
+        """
+        self._append(
+            {
+                "event": "allocate",
+                "name": name,
+                "robot": robot,
+                "state": state,
+                "output_dir": str(output_dir),
+            }
+        )
+
+    def completed(self, name: str, returncode: int) -> None:
+        """Record that the results of an experiment were collected."""
+        self._append({"event": "complete", "name": name, "returncode": returncode})
@@ -1,40 +1,273 @@
-from typing import List, Optional, Set
-
-
-def next_location(cur_location: str) -> Optional[str]:
-    if cur_location == "init":
-        return "A1"
-    letter = cur_location[0]
-    number = cur_location[1:]
-    if number == "12":
-        number = "1"
-        letter = chr(ord(letter) + 1)
-    else:
-        number = str(int(number) + 1)
-    if letter == "I" and number == "12":
+"""Allocate wells and tips from the plates and racks on a robot's deck.
+
+Each plate or rack is a :class:`LabwareGrid`, a bitmap with one bit per
+free position, so handing out and releasing positions only takes a few
+integer operations. :class:`WellPlate` and :class:`TipRack` fill several
+identical plates or racks one after another, rolling over to the next deck
+slot once one is used up.
+"""
+
+from string import ascii_uppercase
+from typing import Callable, Iterable, List, NamedTuple, Optional, Sequence
+
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+class LabwareGrid:
+    """Free positions of a single plate or tip rack.
+
+    Position :code:`A1` is bit 0, then positions are numbered row by row,
+    which is also the order they are handed out in.
+    """
+
+    def __init__(
+        self, rows: int = 8, columns: int = 12, reserved: Iterable[str] = ()
+    ) -> None:
+        """Initialize an empty grid.
+
+        Parameters
+        ----------
+        rows : int, optional
+            Number of rows, named A, B, ..., by default 8.
+        columns : int, optional
+            Number of columns, numbered from 1, by default 12.
+        reserved : Iterable[str], optional
+            Positions which are never handed out, e.g. wells holding source
+            colors.
+        """
+        if not 0 < rows <= len(ascii_uppercase):
+            raise ValueError(f"Unsupported number of rows: {rows}")
+        self.rows = rows
+        self.columns = columns
+        self.names = [
+            ascii_uppercase[row] + str(column + 1)
+            for row in range(rows)
+            for column in range(columns)
+        ]
+        self._indices = {name: index for index, name in enumerate(self.names)}
+        self._row_masks = [
+            ((1 << columns) - 1) << (row * columns) for row in range(rows)
+        ]
+        self._column_masks = [
+            sum(1 << (row * columns + column) for row in range(rows))
+            for column in range(columns)
+        ]
+        self.full = (1 << (rows * columns)) - 1
+        self.reserved = self.mask(reserved)
+        self.free = self.full & ~self.reserved
+        """Bitmap of the positions which can be handed out."""
+
+    def mask(self, names: Iterable[str]) -> int:
+        """Bitmap of the named positions."""
+        mask = 0
+        for name in names:
+            try:
+                mask |= 1 << self._indices[name]
+            except KeyError:
+                raise ValueError(f"Unknown position: {name}") from None
+        return mask
+
+    def wells(self, mask: int) -> List[str]:
+        """Names of the positions in a bitmap, in order."""
+        names = []
+        while mask:
+            lowest = mask & -mask
+            names.append(self.names[lowest.bit_length() - 1])
+            mask ^= lowest
+        return names
+
+    def remaining(self) -> int:
+        """Number of free positions left."""
+        return _popcount(self.free)
+
+    def allocate(self, n: int = 1) -> Optional[List[str]]:
+        """Take the first :code:`n` free positions, or none if there are fewer."""
+        free = self.free
+        if n == 1 and free:
+            lowest = free & -free
+            self.free = free ^ lowest
+            return [self.names[lowest.bit_length() - 1]]
+        mask = 0
+        for _ in range(n):
+            if not free:
+                return None
+            lowest = free & -free
+            mask |= lowest
+            free ^= lowest
+        self.free = free
+        return self.wells(mask)
+
+    def _allocate_line(self, masks: Sequence[int]) -> Optional[List[str]]:
+        for mask in masks:
+            # Lines with reserved positions are never entirely free
+            if self.free & mask == mask:
+                self.free &= ~mask
+                return self.wells(mask)
         return None
-    return letter + number
 
+    def allocate_row(self) -> Optional[List[str]]:
+        """Take the first row whose positions are all free."""
+        return self._allocate_line(self._row_masks)
+
+    def allocate_column(self) -> Optional[List[str]]:
+        """Take the first column whose positions are all free, e.g. for an 8-channel pipette."""
+        return self._allocate_line(self._column_masks)
+
+    def release(self, names: Iterable[str]) -> None:
+        """Hand positions out again, e.g. the well of an experiment which was never run."""
+        mask = self.mask(names) & ~self.reserved
+        if mask & self.free:
+            raise ValueError(
+                f"Positions are not in use: {self.wells(mask & self.free)}"
+            )
+        self.free |= mask
+
+    def reset(self) -> None:
+        """Free all positions, e.g. after the plate was replaced."""
+        self.free = self.full & ~self.reserved
+
+
+class Allocation(NamedTuple):
+    """Positions handed out from one plate or rack."""
+
+    location: Optional[str]
+    """Deck slot of the plate or rack, None if it was not specified."""
+    wells: List[str]
+    """Names of the positions, e.g. :code:`["A1", "A2"]`."""
+
+
+class _Labware:
+    def __init__(
+        self,
+        locations: Optional[Sequence[str]] = None,
+        reserved: Iterable[str] = (),
+        rows: int = 8,
+        columns: int = 12,
+    ) -> None:
+        reserved = list(reserved)
+        self.locations: List[Optional[str]] = list(locations) if locations else [None]
+        self.grids = [LabwareGrid(rows, columns, reserved) for _ in self.locations]
+        # Grids before this one are full, skipped until positions are released
+        self._first = 0
+
+    def _take(
+        self, take: Callable[[LabwareGrid], Optional[List[str]]]
+    ) -> Optional[Allocation]:
+        for index in range(self._first, len(self.grids)):
+            grid = self.grids[index]
+            wells = take(grid)
+            if wells is not None:
+                return Allocation(self.locations[index], wells)
+            if not grid.free and index == self._first:
+                self._first = index + 1
+        return None
 
-class WellPlate:
-    def __init__(self, reserved: Set[str] = set()) -> None:
-        self.reserved = reserved
-        # The current well
-        self._well: Optional[str] = "init"
+    def allocate(self, n: int = 1) -> Optional[Allocation]:
+        """Take :code:`n` free positions from the first plate or rack having enough of them."""
+        return self._take(lambda grid: grid.allocate(n))
+
+    def allocate_row(self) -> Optional[Allocation]:
+        """Take the first free row, see :meth:`LabwareGrid.allocate_row`."""
+        return self._take(LabwareGrid.allocate_row)
+
+    def allocate_column(self) -> Optional[Allocation]:
+        """Take the first free column, see :meth:`LabwareGrid.allocate_column`."""
+        return self._take(LabwareGrid.allocate_column)
+
+    def release(self, allocation: Allocation) -> None:
+        """Hand out the positions of an allocation again."""
+        index = self.locations.index(allocation.location)
+        self.grids[index].release(allocation.wells)
+        self._first = min(self._first, index)
+
+    def remaining(self) -> int:
+        """Number of free positions left on all plates or racks."""
+        return sum(grid.remaining() for grid in self.grids)
+
+    def most_remaining(self) -> int:
+        """Most free positions left on a single plate or rack.
+
+        :meth:`allocate` takes all positions from the same plate or rack,
+        so this is the most it can take at once.
+        """
+        return max(grid.remaining() for grid in self.grids)
+
+    def reset(self) -> None:
+        """Free all positions, e.g. after the plates or racks were replaced."""
+        for grid in self.grids:
+            grid.reset()
+        self._first = 0
+
+    def checkpoint(self) -> List[int]:
+        """The free positions of each plate or rack, pass them to :meth:`restore` to continue."""
+        return [grid.free for grid in self.grids]
+
+    def restore(self, state: List[int]) -> None:
+        """Restore the free positions returned by :meth:`checkpoint`."""
+        for grid, free in zip(self.grids, state):
+            grid.free = free & grid.full & ~grid.reserved
+        self._first = 0
+
+
+class WellPlate(_Labware):
+    """Wells of identical plates, filled one plate after another."""
+
+    def __init__(
+        self,
+        reserved: Iterable[str] = (),
+        locations: Optional[Sequence[str]] = None,
+        rows: int = 8,
+        columns: int = 12,
+    ) -> None:
+        """Initialize the plates with all wells open.
+
+        Parameters
+        ----------
+        reserved : Iterable[str], optional
+            Wells which are never handed out, on every plate.
+        locations : Optional[Sequence[str]], optional
+            Deck slots of the plates, in the order they are filled.
+            By default a single plate.
+        rows : int, optional
+            Number of rows of a plate, by default 8.
+        columns : int, optional
+            Number of columns of a plate, by default 12.
+        """
+        super().__init__(locations, reserved, rows, columns)
 
     def get_open_well(self) -> Optional[str]:
-        while True:
-            assert self._well is not None
-            self._well = next_location(self._well)
-            if self._well is None:
-                return None
-            if self._well not in self.reserved:
-                return self._well
+        """Take the next open well, None once all plates are full.
+
+        Use :meth:`allocate` to also learn which plate it is on.
+        """
+        allocation = self.allocate()
+        return None if allocation is None else allocation.wells[0]
+
 
+class TipRack(_Labware):
+    """Tips of identical racks, used one rack after another."""
 
-class TipRack:
-    def __init__(self) -> None:
-        self._tip: Optional[str] = "init"
+    def __init__(
+        self,
+        locations: Optional[Sequence[str]] = None,
+        rows: int = 8,
+        columns: int = 12,
+    ) -> None:
+        """Initialize the racks with all tips unused.
+
+        Parameters
+        ----------
+        locations : Optional[Sequence[str]], optional
+            Deck slots of the racks, in the order they are used.
+            By default a single rack.
+        rows : int, optional
+            Number of rows of a rack, by default 8.
+        columns : int, optional
+            Number of columns of a rack, by default 12.
+        """
+        super().__init__(locations, (), rows, columns)
 
     def get_tips(self, n: int = 1) -> Optional[List[str]]:
         """Get a list of unused tip positions.
@@ -47,14 +280,8 @@ class TipRack:
         Returns
         -------
         List[str]
-            The next :code:`n` available tip locations.
+            The next :code:`n` available tip locations, all from the same
+            rack, use :meth:`allocate` to also learn which one.
         """
-        tips: List[str] = []
-        for _ in range(n):
-            assert self._tip is not None
-            self._tip = next_location(self._tip)
-            if self._tip is None:
-                return None
-            tips.append(self._tip)
-
-        return tips
+        allocation = self.allocate(n)
+        return None if allocation is None else allocation.wells
@@ -0,0 +1,186 @@
+"""Write protocol logs to disk while the protocol is running.
+
+The output of a protocol is written to its log file chunk by chunk as it
+arrives instead of being held in memory until the protocol exits. Lines
+echoing opentrons commands, e.g. "Aspirating 10.0 uL from A1 of ...", are
+reported to a progress callback as they are written.
+"""
+
+import re
+import threading
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Callable, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import asyncio
+
+# opentrons_execute prints each command indented by one tab per nesting
+# level, e.g. the aspirate of a transfer, followed by a space. Command
+# texts start with one of these words, e.g. "Picking up tip".
+_COMMAND_VERBS = (
+    "Air gap|Aspirating|Blowing|Calibrating|Closing|Consolidating|Deactivating|"
+    "Delaying|Disengaging|Dispensing|Distributing|Dropping|Engaging|Homing|"
+    "Latching|Mixing|Moving|Opening|Pausing|Picking|Resuming|Returning|Setting|"
+    "Thermocycler starting|Touching|Transferring|Unlatching|Waiting"
+)
+_COMMAND_PATTERN = re.compile(rf"^(\t*) ?((?:{_COMMAND_VERBS})\b.*)$")
+
+
+class ProtocolCommand(NamedTuple):
+    """A command echoed in the output of a protocol."""
+
+    index: int
+    """Number of commands echoed before this one."""
+    depth: int
+    """Nesting level, 0 for commands called by the protocol itself."""
+    text: str
+    """Description of the command, e.g. "Dropping tip into A1 of ..."."""
+
+
+ProgressCallback = Callable[[ProtocolCommand], None]
+
+
+def parse_command(line: str) -> Optional[ProtocolCommand]:
+    """Parse a line of protocol output echoing an opentrons command.
+
+    Parameters
+    ----------
+    line : str
+        A line of output without the trailing newline.
+
+    Returns
+    -------
+    Optional[ProtocolCommand]
+        The command with an index of 0, or None if the line is not a command.
+    """
+    match = _COMMAND_PATTERN.match(line)
+    if match is None:
+        return None
+    return ProtocolCommand(0, len(match.group(1)), match.group(2))
+
+
+class LogWriter:
+    """File-like object writing output to a log file as it arrives.
+
+    Only the last incomplete line is kept in memory, and at most
+    :obj:`max_line_length` bytes of it, so memory use does not grow with
+    the length of the protocol.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        callback: Optional[ProgressCallback] = None,
+        max_line_length: int = 65536,
+    ) -> None:
+        """Open the log file for writing.
+
+        Parameters
+        ----------
+        path : Path
+            Log file to write, overwritten if it exists.
+        callback : Optional[ProgressCallback], optional
+            Called with each command echoed in the output, by default None.
+        max_line_length : int, optional
+            Longer lines are truncated before being parsed, they are
+            always written in full, by default 65536.
+        """
+        self.callback = callback
+        self.max_line_length = max_line_length
+        self.commands = 0
+        self._file = open(path, "wb")
+        self._line = b""
+
+    def write(self, data: bytes) -> None:
+        """Append a chunk of output to the log file."""
+        self._file.write(data)
+        self._file.flush()
+        if self.callback is None:
+            return
+        *lines, rest = (self._line + data).split(b"\n")
+        for line in lines:
+            self._parse(line)
+        self._line = rest[: self.max_line_length]
+
+    def _parse(self, line: bytes) -> None:
+        text = line[: self.max_line_length].decode(errors="replace").rstrip("\r")
+        command = parse_command(text)
+        if command is not None and self.callback is not None:
+            self.callback(command._replace(index=self.commands))
+            self.commands += 1
+
+    def close(self) -> None:
+        """Report a final line without a newline and close the log file."""
+        if self._line:
+            self._parse(self._line)
+            self._line = b""
+        self._file.close()
+
+    def __enter__(self) -> "LogWriter":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+def pump(read: Callable[[], bytes], write: Callable[[bytes], None]) -> None:
+    """Pass chunks returned by :obj:`read` to :obj:`write` until it returns b""."""
+    for chunk in iter(read, b""):
+        write(chunk)
+
+
+async def pump_async(
+    stream: "asyncio.StreamReader", write: Callable[[bytes], None], size: int = 32768
+) -> None:
+    """Pass chunks read from :obj:`stream` to :obj:`write` without blocking the event loop."""
+    while True:
+        chunk = await stream.read(size)
+        if not chunk:
+            return
+        write(chunk)
+
+
+def pump_streams(
+    stdout: Callable[[], bytes],
+    stderr: Callable[[], bytes],
+    write_stdout: Callable[[bytes], None],
+    write_stderr: Callable[[bytes], None],
+) -> None:
+    """Copy stdout and stderr of a process concurrently.
+
+    Both streams need to be drained at the same time, otherwise a process
+    writing a lot to one of them blocks once its pipe is full.
+
+    Parameters
+    ----------
+    stdout : Callable[[], bytes]
+        Reads the next chunk of stdout, b"" once it is closed.
+    stderr : Callable[[], bytes]
+        Reads the next chunk of stderr, b"" once it is closed.
+    write_stdout : Callable[[bytes], None]
+        Handles a chunk of stdout, e.g. :meth:`LogWriter.write`.
+    write_stderr : Callable[[bytes], None]
+        Handles a chunk of stderr.
+    """
+    errors: List[BaseException] = []
+
+    def pump_stderr() -> None:
+        try:
+            pump(stderr, write_stderr)
+        except BaseException as e:  # pragma: no cover
+            errors.append(e)
+
+    thread = threading.Thread(target=pump_stderr, daemon=True)
+    thread.start()
+    pump(stdout, write_stdout)
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def read_chunks(stream: IO[bytes], size: int = 32768) -> Callable[[], bytes]:
+    """Build a reader returning whatever output is available, up to :obj:`size` bytes."""
+    read1 = getattr(stream, "read1", None)
+    if read1 is not None:
+        return lambda: read1(size)  # type: ignore[no-any-return]
+    return lambda: stream.read(size)
@@ -0,0 +1,421 @@
+"""Decide which robot of a fleet runs each experiment.
+
+Robots report the consumables they have left, e.g. tips and wells, and
+the labware loaded on their deck, see :meth:`Robot.resources` and
+:meth:`Robot.labware`. Experiments report what they need with
+:meth:`Robot.requirements`. A :class:`SchedulingPolicy` uses these to
+route experiments so that robots do not run out of tips or wells while
+others still have plenty left.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from ot2util.experiment import Robot
+
+Request = Tuple[Tuple[Any, ...], Dict[str, Any]]
+"""Positional and keyword arguments an experiment is submitted with."""
+
+
+class Requirements(NamedTuple):
+    """What an experiment needs from the robot running it."""
+
+    consumables: Dict[str, int] = {}
+    """Units of each consumable used up, e.g. :code:`{"tips": 3, "wells": 1}`."""
+    labware: FrozenSet[str] = frozenset()
+    """Names of labware and instruments which need to be loaded."""
+
+
+def total_requirements(robot: "Robot", requests: Sequence[Request]) -> Requirements:
+    """Add up the requirements of experiments run one after another on a robot."""
+    consumables: Dict[str, int] = {}
+    labware: FrozenSet[str] = frozenset()
+    for args, kwargs in requests:
+        requirements = robot.requirements(*args, **kwargs)
+        for name, units in requirements.consumables.items():
+            consumables[name] = consumables.get(name, 0) + units
+        labware |= requirements.labware
+    return Requirements(consumables, labware)
+
+
+class SchedulingPolicy:
+    """Run each experiment on the first idle robot."""
+
+    def can_run(self, robot: "Robot", requests: Sequence[Request]) -> bool:
+        """Whether :obj:`robot` is able to run the experiments at all."""
+        return True
+
+    def select(
+        self, robots: List["Robot"], requests: Sequence[Request], load: Dict[int, int]
+    ) -> "Robot":
+        """Pick the robot to run the experiments from the idle robots able to.
+
+        Parameters
+        ----------
+        robots : List[Robot]
+            Idle robots able to run the experiments, in the order they
+            became idle.
+        requests : Sequence[Request]
+            The experiments to run.
+        load : Dict[int, int]
+            Number of unfinished experiments of each robot, keyed by :func:`id`.
+
+        Returns
+        -------
+        Robot
+            One of :obj:`robots`.
+        """
+        return robots[0]
+
+
+class LabwareAwarePolicy(SchedulingPolicy):
+    """Route experiments to the robots with the most consumables to spare.
+
+    Robots missing labware or without enough consumables left are never
+    picked. Among the others, the robot with the most units left of the
+    scarcest consumable after running the experiments is picked, which
+    spreads consumption evenly so that refills are needed as late as
+    possible and all at once. Ties go to the robot with the fewest
+    unfinished experiments.
+    """
+
+    def can_run(self, robot: "Robot", requests: Sequence[Request]) -> bool:
+        requirements = total_requirements(robot, requests)
+        if not requirements.labware <= robot.labware():
+            return False
+        resources = robot.resources()
+        return all(
+            resources.get(name, units) >= units
+            for name, units in requirements.consumables.items()
+        )
+
+    def _spare(self, robot: "Robot", requests: Sequence[Request]) -> float:
+        requirements = total_requirements(robot, requests)
+        resources = robot.resources()
+        spare = [
+            resources[name] - units
+            for name, units in requirements.consumables.items()
+            if name in resources
+        ]
+        return min(spare, default=float("inf"))
+
+    def select(
+        self, robots: List["Robot"], requests: Sequence[Request], load: Dict[int, int]
+    ) -> "Robot":
+        return max(
+            robots,
+            key=lambda robot: (
+                self._spare(robot, requests),
+                -load.get(id(robot), 0),
+            ),
+        )
+
+
+class _Waiter:
+    """Experiments waiting for a robot, woken up by :meth:`RobotDispatcher.release`."""
+
+    __slots__ = ("wake", "requests", "robot", "error")
+
+    def __init__(self, requests: Sequence[Request], wake: Callable[[], None]) -> None:
+        self.wake = wake
+        self.requests = requests
+        self.robot: Optional["Robot"] = None
+        self.error: Optional[Exception] = None
+
+    def claim(self) -> "Robot":
+        if self.error is not None:
+            raise self.error
+        assert self.robot is not None
+        return self.robot
+
+
+def _set_pending_result(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RobotDispatcher:
+    """Hand out idle robots to waiting experiments in first come, first served order.
+
+    A released robot is handed directly to the longest waiting experiment
+    it is able to run, so it never sits idle while such an experiment is
+    waiting and a newcomer can not overtake experiments already waiting.
+    """
+
+    def __init__(
+        self, robots: List["Robot"], policy: Optional[SchedulingPolicy] = None
+    ) -> None:
+        """Initialize the dispatcher with all robots idle.
+
+        Parameters
+        ----------
+        robots : List[Robot]
+            The robots to hand out.
+        policy : Optional[SchedulingPolicy], optional
+            Decides which robot runs an experiment, by default
+            :class:`LabwareAwarePolicy`.
+        """
+        self.robots = robots
+        self.policy = policy or LabwareAwarePolicy()
+        self._idle = deque(robots)
+        self._waiters: "deque[_Waiter]" = deque()
+        self._load: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def load(self, robot: "Robot") -> int:
+        """Number of experiments acquired on :obj:`robot` which are not done."""
+        return self._load.get(id(robot), 0)
+
+    def _assign(self, robot: "Robot") -> "Robot":
+        robot.running = True
+        self._load[id(robot)] = self._load.get(id(robot), 0) + 1
+        return robot
+
+    def acquire(self, requests: Sequence[Request] = (((), {}),)) -> "Robot":
+        """Wait for an idle robot able to run the experiments and mark it as running.
+
+        Parameters
+        ----------
+        requests : Sequence[Request], optional
+            Arguments of the experiments to run on the robot, passed to
+            :meth:`Robot.requirements`. By default a single experiment
+            without arguments.
+
+        Returns
+        -------
+        Robot
+            The robot, release it with :meth:`release`.
+
+        Raises
+        ------
+        ValueError
+            If no robot of the fleet is able to run the experiments, e.g.
+            because all of them need a refill.
+        """
+        event = threading.Event()
+        acquired = self._acquire_or_wait(requests, event.set)
+        if not isinstance(acquired, _Waiter):
+            return acquired
+        event.wait()
+        return acquired.claim()
+
+    async def acquire_async(self, requests: Sequence[Request] = (((), {}),)) -> "Robot":
+        """Like :meth:`acquire`, waiting without blocking the event loop.
+
+        Waiting coroutines and threads are served in the same order, so a
+        dispatcher can be shared by synchronous and asynchronous pools.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        acquired = self._acquire_or_wait(
+            requests, lambda: loop.call_soon_threadsafe(_set_pending_result, future)
+        )
+        if not isinstance(acquired, _Waiter):
+            return acquired
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._withdraw(acquired)
+            raise
+        return acquired.claim()
+
+    def _acquire_or_wait(
+        self, requests: Sequence[Request], wake: Callable[[], None]
+    ) -> Union["Robot", _Waiter]:
+        with self._lock:
+            if not self._runnable(requests):
+                raise self._unrunnable(requests)
+            # Idle robots are not able to run any of the waiting experiments
+            candidates = [
+                robot for robot in self._idle if self.policy.can_run(robot, requests)
+            ]
+            if candidates:
+                robot = self.policy.select(candidates, requests, self._load)
+                self._idle.remove(robot)
+                return self._assign(robot)
+            waiter = _Waiter(requests, wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _withdraw(self, waiter: _Waiter) -> None:
+        # The waiting coroutine was cancelled, give back its robot if it
+        # was handed one in the meantime.
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return
+        if waiter.robot is not None:
+            self.release(waiter.robot)
+            self.done(waiter.robot)
+
+    def _runnable(self, requests: Sequence[Request]) -> bool:
+        return any(self.policy.can_run(robot, requests) for robot in self.robots)
+
+    def _unrunnable(self, requests: Sequence[Request]) -> ValueError:
+        return ValueError(
+            "No robot has the labware or consumables left to run "
+            f"{len(requests)} experiment(s), refill the robots"
+        )
+
+    def release(self, robot: "Robot") -> None:
+        """Hand :obj:`robot` to the next waiting experiment able to use it."""
+        with self._lock:
+            for waiter in self._waiters:
+                if self.policy.can_run(robot, waiter.requests):
+                    self._waiters.remove(waiter)
+                    waiter.robot = self._assign(robot)
+                    waiter.wake()
+                    return
+            robot.running = False
+            self._idle.append(robot)
+            # The robot used up what the remaining waiters needed, fail
+            # those which no robot is able to run instead of waiting forever.
+            for waiter in list(self._waiters):
+                if not self._runnable(waiter.requests):
+                    self._waiters.remove(waiter)
+                    waiter.error = self._unrunnable(waiter.requests)
+                    waiter.wake()
+
+    def done(self, robot: "Robot") -> None:
+        """Record that an experiment acquired on :obj:`robot` has finished."""
+        with self._lock:
+            self._load[id(robot)] -= 1
+
+
+OVERFLOW_POLICIES = ("block", "reject", "drop_lowest")
+"""What :class:`ExperimentQueue` does with a submission when it is full."""
+
+
+class QueueFullError(RuntimeError):
+    """Raised for submissions rejected or dropped by a full :class:`ExperimentQueue`."""
+
+
+class _QueueEntry(NamedTuple):
+    # Higher priorities sort first, ties in submission order
+    key: Tuple[int, int]
+    future: "Future[Any]"
+    item: Any
+
+
+class ExperimentQueue:
+    """Priority queue of submitted experiments which have not started yet.
+
+    Experiments with a higher priority are started first, experiments with
+    the same priority in the order they were submitted. Cancelling the
+    future of a queued experiment removes it from the queue. The queue
+    can be bounded to apply backpressure to submitters.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, overflow: str = "block") -> None:
+        """Initialize an empty queue.
+
+        Parameters
+        ----------
+        max_size : Optional[int], optional
+            Maximum number of queued experiments, unbounded if None.
+        overflow : str, optional
+            What to do with a submission when the queue is full, one of
+            "block" to wait for space, "reject" to raise
+            :class:`QueueFullError`, or "drop_lowest" to drop the queued
+            experiment with the lowest priority if the submission has a
+            higher one and reject the submission otherwise. By default "block".
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.max_size = max_size
+        self.overflow = overflow
+        self._heap: List[_QueueEntry] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _full(self) -> bool:
+        return self.max_size is not None and len(self._heap) >= self.max_size
+
+    def put(self, item: Any, future: "Future[Any]", priority: int = 0) -> None:
+        """Queue an experiment.
+
+        Parameters
+        ----------
+        item : Any
+            The experiment, returned by :meth:`get`.
+        future : Future[Any]
+            Future of the experiment, it is removed from the queue if
+            the future is cancelled.
+        priority : int, optional
+            Experiments with higher priorities are started first, by default 0.
+
+        Raises
+        ------
+        QueueFullError
+            If the queue is full and the submission is rejected.
+        """
+        entry = _QueueEntry((-priority, next(self._seq)), future, item)
+        dropped = None
+        with self._cond:
+            if self._full():
+                if self.overflow == "block":
+                    self._cond.wait_for(lambda: not self._full())
+                elif self.overflow == "drop_lowest" and entry < max(self._heap):
+                    dropped = max(self._heap)
+                    self._heap.remove(dropped)
+                    heapq.heapify(self._heap)
+                else:
+                    raise QueueFullError(
+                        f"{len(self._heap)} experiments are already queued"
+                    )
+            heapq.heappush(self._heap, entry)
+        future.add_done_callback(lambda f: self._discard(entry))
+        if dropped is not None:
+            # Done callbacks may submit again, they run without the lock
+            dropped.future.set_exception(
+                QueueFullError("Dropped for an experiment with a higher priority")
+            )
+
+    def _discard(self, entry: _QueueEntry) -> None:
+        # Cancelled futures are removed right away to free up space
+        with self._cond:
+            try:
+                self._heap.remove(entry)
+            except ValueError:
+                return
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def get(self) -> Optional[Any]:
+        """Take the queued experiment with the highest priority and mark it running.
+
+        Returns
+        -------
+        Optional[Any]
+            The item of the experiment, or None if the queue is empty.
+        """
+        while True:
+            with self._cond:
+                if not self._heap:
+                    return None
+                entry = heapq.heappop(self._heap)
+                self._cond.notify()
+            # False if it was cancelled in the meantime
+            if entry.future.set_running_or_notify_cancel():
+                return entry.item
@@ -0,0 +1,146 @@
+"""Simulate protocols in a pool of long-lived worker processes.
+
+Each :code:`opentrons_simulate` process spends most of its time starting
+python and importing the opentrons API. The workers of the pool import it
+once and then simulate one protocol after another, writing the same
+stdout.log and stderr.log as the command line would.
+"""
+
+import atexit
+import os
+import sys
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional
+
+from ot2util.daemon import run_protocol
+
+
+def _import_opentrons() -> None:
+    import opentrons.simulate  # noqa: F401
+
+
+def _simulate(protocol: Path, env: Dict[str, str], stdout: Path, stderr: Path) -> int:
+    # Runs in a worker, output is redirected at the file descriptor level
+    # so that logs written by opentrons end up in the log files as well.
+    saved_env = {key: os.environ.get(key) for key in env}
+    saved_fds = os.dup(1), os.dup(2)
+    saved_streams = sys.stdout, sys.stderr
+    os.environ.update(env)
+    try:
+        with open(stdout, "wb") as out, open(stderr, "wb") as err:
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+            # The streams of the parent process may have been replaced
+            sys.stdout = open(1, "w", closefd=False)
+            sys.stderr = open(2, "w", closefd=False)
+            try:
+                return run_protocol(protocol, simulate=True)
+            finally:
+                sys.stdout.close()
+                sys.stderr.close()
+    finally:
+        sys.stdout, sys.stderr = saved_streams
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in saved_fds:
+            os.close(fd)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class SimulationPool:
+    """Pool of worker processes with the opentrons API imported."""
+
+    def __init__(self, workers: int) -> None:
+        """Start the worker processes.
+
+        Parameters
+        ----------
+        workers : int
+            Number of protocols to simulate at the same time.
+        """
+        import pebble
+
+        self.workers = workers
+        self.pool = pebble.ProcessPool(
+            max_workers=workers, initializer=_import_opentrons
+        )
+
+    def simulate(
+        self,
+        protocol: Path,
+        stdout: Path,
+        stderr: Path,
+        env: Optional[Dict[str, str]] = None,
+    ) -> int:
+        """Simulate a protocol and wait for it to finish.
+
+        Parameters
+        ----------
+        protocol : Path
+            The protocol file.
+        stdout : Path
+            Log file for the standard output, i.e. the run log.
+        stderr : Path
+            Log file for the standard error.
+        env : Optional[Dict[str, str]], optional
+            Environment variables to set while simulating, e.g. the path
+            of the config file.
+
+        Returns
+        -------
+        int
+            0 if the protocol finished, 1 if it raised.
+        """
+        returncode: int = self.schedule(protocol, stdout, stderr, env).result()
+        return returncode
+
+    def schedule(
+        self,
+        protocol: Path,
+        stdout: Path,
+        stderr: Path,
+        env: Optional[Dict[str, str]] = None,
+    ) -> "Future[int]":
+        """Like :meth:`simulate`, returning a future of the returncode right away."""
+        future: Future[int] = self.pool.schedule(
+            _simulate, args=(protocol, env or {}, stdout, stderr)
+        )
+        return future
+
+    def close(self) -> None:
+        """Stop the worker processes once they are idle."""
+        self.pool.close()
+        self.pool.join()
+
+
+_pools: Dict[int, SimulationPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_simulation_pool(workers: int) -> SimulationPool:
+    """Get a pool shared by all robots simulating with the same number of workers."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = SimulationPool(workers)
+        return pool
+
+
+@atexit.register
+def close_simulation_pools() -> None:
+    """Stop the worker processes of the shared pools.
+
+    Called when the interpreter exits, the pools are started again if
+    robots simulate afterwards.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,179 @@
+"""Incremental synchronization of experiment results from a robot.
+
+The robot lists its files with :code:`python3 -m ot2util.sync <dir>`, the
+listing (manifest) is compared against the local copy and only new or
+changed files are transferred. This can be run in the middle of an
+experiment to pull partial results, e.g. images or time series.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shlex
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from ot2util.config import PathLike
+from ot2util.transfer import matches_any
+
+
+class FileEntry(NamedTuple):
+    """Manifest entry of a single file."""
+
+    size: int
+    """Size of the file in bytes."""
+    mtime_ns: int
+    """Modification time of the file in nanoseconds."""
+    sha256: Optional[str] = None
+    """Hex digest of the file contents if hashes were requested."""
+
+
+Manifest = Dict[str, FileEntry]
+"""Maps file paths, relative to the synchronized directory, to their entry."""
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _selected(
+    rel: PurePosixPath, includes: Sequence[str], excludes: Sequence[str]
+) -> bool:
+    if includes and not matches_any(rel, includes):
+        return False
+    return not matches_any(rel, excludes)
+
+
+def build_manifest(
+    root: PathLike,
+    includes: Sequence[str] = (),
+    excludes: Sequence[str] = (),
+    hashes: bool = False,
+) -> Manifest:
+    """List the files below a directory.
+
+    Parameters
+    ----------
+    root : PathLike
+        Directory to list, an empty manifest is returned if it does not exist.
+    includes : Sequence[str], optional
+        Glob patterns of files to list, all files if empty.
+    excludes : Sequence[str], optional
+        Glob patterns of files to leave out, applied after :obj:`includes`.
+    hashes : bool, optional
+        Whether to compute the sha256 of each file, by default False.
+
+    Returns
+    -------
+    Manifest
+        The entry of each selected file.
+    """
+    root = Path(root)
+    manifest: Manifest = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            rel = PurePosixPath(path.relative_to(root).as_posix())
+            if not _selected(rel, includes, excludes):
+                continue
+            st = path.stat()
+            sha256 = _sha256(path) if hashes else None
+            manifest[str(rel)] = FileEntry(st.st_size, st.st_mtime_ns, sha256)
+    return manifest
+
+
+def manifest_command(
+    remote_dir: PathLike,
+    includes: Sequence[str] = (),
+    excludes: Sequence[str] = (),
+    hashes: bool = False,
+    python: str = "python3",
+) -> str:
+    """Build the shell command printing the manifest of a directory on the robot.
+
+    Parameters
+    ----------
+    remote_dir : PathLike
+        Directory on the robot to list.
+    includes : Sequence[str], optional
+        Glob patterns of files to list, all files if empty.
+    excludes : Sequence[str], optional
+        Glob patterns of files to leave out.
+    hashes : bool, optional
+        Whether to compute the sha256 of each file, by default False.
+    python : str, optional
+        Python interpreter on the robot with ot2util installed.
+
+    Returns
+    -------
+    str
+        The shell command, its output can be read with :func:`parse_manifest`.
+    """
+    args = [python, "-m", "ot2util.sync", str(remote_dir)]
+    args += [f"--include={pattern}" for pattern in includes]
+    args += [f"--exclude={pattern}" for pattern in excludes]
+    if hashes:
+        args.append("--hashes")
+    return " ".join(shlex.quote(arg) for arg in args)
+
+
+def dump_manifest(manifest: Manifest) -> str:
+    """Serialize a manifest to json."""
+    return json.dumps({path: list(entry) for path, entry in manifest.items()})
+
+
+def parse_manifest(text: str) -> Manifest:
+    """Read a manifest serialized by :func:`dump_manifest`."""
+    return {path: FileEntry(*entry) for path, entry in json.loads(text).items()}
+
+
+def changed_files(remote: Manifest, local: Manifest) -> List[str]:
+    """Find the files which are new or changed on the robot.
+
+    Files are compared by their hashes if both manifests have them, and by
+    size and modification time otherwise.
+
+    Parameters
+    ----------
+    remote : Manifest
+        Manifest of the directory on the robot.
+    local : Manifest
+        Manifest of the local copy.
+
+    Returns
+    -------
+    List[str]
+        Sorted relative paths of the files to transfer.
+    """
+    changed = []
+    for path, entry in remote.items():
+        other = local.get(path)
+        if other is None or other.size != entry.size:
+            changed.append(path)
+        elif entry.sha256 is not None and other.sha256 is not None:
+            if entry.sha256 != other.sha256:
+                changed.append(path)
+        elif entry.mtime_ns != other.mtime_ns:
+            changed.append(path)
+    return sorted(changed)
+
+
+def main() -> None:
+    """Print the manifest of a directory, run on the robot by :func:`manifest_command`."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", help="Directory to list")
+    parser.add_argument("--include", action="append", default=[])
+    parser.add_argument("--exclude", action="append", default=[])
+    parser.add_argument("--hashes", action="store_true")
+    args = parser.parse_args()
+    manifest = build_manifest(args.root, args.include, args.exclude, args.hashes)
+    print(dump_manifest(manifest))
+
+
+if __name__ == "__main__":
+    main()
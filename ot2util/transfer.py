@@ -0,0 +1,266 @@
+"""Backends for copying files between the local machine and a robot.
+"""
+
+import fnmatch
+import shlex
+import stat
+import tarfile
+from pathlib import Path, PurePosixPath
+from typing import IO, TYPE_CHECKING, Optional, Sequence
+
+from ot2util.config import PathLike
+
+if TYPE_CHECKING:
+    from paramiko import SFTPClient, Transport
+
+TAR_COMPRESSIONS = ("none", "gzip", "zstd")
+"""Compressions supported when streaming tar archives."""
+
+
+def matches_any(path: PurePosixPath, patterns: Sequence[str]) -> bool:
+    """Check whether a relative path matches any of the glob patterns.
+
+    Parameters
+    ----------
+    path : PurePosixPath
+        Path relative to the root of the copy.
+    patterns : Sequence[str]
+        Glob patterns, e.g. :code:`"protocol.py"` or :code:`"*.tmp"`. A
+        pattern matches either the file name or the whole relative path.
+
+    Returns
+    -------
+    bool
+        True if the path matches any of the patterns.
+    """
+    return any(
+        fnmatch.fnmatch(path.name, pattern) or fnmatch.fnmatch(str(path), pattern)
+        for pattern in patterns
+    )
+
+
+class SFTPTransfer:
+    """Copy files over the SFTP channel of an open ssh connection.
+
+    Unlike forking :code:`scp` for each file, all copies share the ssh
+    transport of the connection so no new handshake is needed per file.
+    """
+
+    def __init__(self, sftp: "SFTPClient") -> None:
+        """Initialize the transfer backend.
+
+        Parameters
+        ----------
+        sftp : paramiko.SFTPClient
+            An open SFTP client, e.g. from :meth:`fabric.Connection.sftp`.
+        """
+        self.sftp = sftp
+
+    def put(self, local: PathLike, remote: PathLike) -> None:
+        """Upload the file :obj:`local` to the path :obj:`remote`."""
+        self.sftp.put(str(local), str(remote))
+
+    def get(self, remote: PathLike, local: PathLike) -> None:
+        """Download the file :obj:`remote` to the path :obj:`local`."""
+        self.sftp.get(str(remote), str(local))
+
+    def _remote_mkdir(self, remote_dir: PurePosixPath) -> None:
+        try:
+            self.sftp.stat(str(remote_dir))
+        except FileNotFoundError:
+            self.sftp.mkdir(str(remote_dir))
+
+    def put_dir(
+        self, local_dir: PathLike, remote_dir: PathLike, excludes: Sequence[str] = ()
+    ) -> None:
+        """Recursively upload the contents of :obj:`local_dir` into :obj:`remote_dir`.
+
+        Parameters
+        ----------
+        local_dir : PathLike
+            Local directory to copy from.
+        remote_dir : PathLike
+            Remote directory to copy into, created if it does not exist.
+        excludes : Sequence[str], optional
+            Glob patterns of files and directories to skip, see :func:`matches_any`.
+        """
+        local_root, remote_root = Path(local_dir), PurePosixPath(remote_dir)
+        self._remote_mkdir(remote_root)
+        for path in sorted(local_root.rglob("*")):
+            rel = PurePosixPath(path.relative_to(local_root).as_posix())
+            if any(matches_any(p, excludes) for p in [rel, *rel.parents][:-1]):
+                continue
+            if path.is_dir():
+                self._remote_mkdir(remote_root / rel)
+            else:
+                self.put(path, remote_root / rel)
+
+    def get_dir(
+        self, remote_dir: PathLike, local_dir: PathLike, excludes: Sequence[str] = ()
+    ) -> None:
+        """Recursively download the contents of :obj:`remote_dir` into :obj:`local_dir`.
+
+        Parameters
+        ----------
+        remote_dir : PathLike
+            Remote directory to copy from.
+        local_dir : PathLike
+            Local directory to copy into, created if it does not exist.
+        excludes : Sequence[str], optional
+            Glob patterns of files and directories to skip, see :func:`matches_any`.
+        """
+        self._get_dir(
+            PurePosixPath(remote_dir), Path(local_dir), PurePosixPath(), excludes
+        )
+
+    def _get_dir(
+        self,
+        remote_root: PurePosixPath,
+        local_root: Path,
+        rel: PurePosixPath,
+        excludes: Sequence[str],
+    ) -> None:
+        (local_root / rel).mkdir(parents=True, exist_ok=True)
+        for attr in self.sftp.listdir_attr(str(remote_root / rel)):
+            child = rel / attr.filename
+            if matches_any(child, excludes):
+                continue
+            if attr.st_mode is not None and stat.S_ISDIR(attr.st_mode):
+                self._get_dir(remote_root, local_root, child, excludes)
+            else:
+                self.get(remote_root / child, local_root / child)
+
+
+def _check_compression(compression: str) -> None:
+    if compression not in TAR_COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "zstd compression requires the zstandard package, "
+                "install it with: pip install zstandard"
+            ) from e
+
+
+def tar_command(
+    remote_dir: PathLike, excludes: Sequence[str] = (), compression: str = "none"
+) -> str:
+    """Build a shell command writing a tar archive of a directory to stdout.
+
+    Parameters
+    ----------
+    remote_dir : PathLike
+        Directory to archive, its contents are stored relative to it.
+    excludes : Sequence[str], optional
+        Glob patterns of files to leave out of the archive.
+    compression : str, optional
+        One of "none", "gzip" or "zstd", by default "none".
+
+    Returns
+    -------
+    str
+        The shell command.
+    """
+    if compression not in TAR_COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    exclude_args = " ".join(f"--exclude={shlex.quote(e)}" for e in excludes)
+    command = f"tar -C {shlex.quote(str(remote_dir))} {exclude_args} -cf - ."
+    if compression == "none":
+        return command
+    compress = "gzip -c" if compression == "gzip" else "zstd -q -c"
+    # A pipeline exits with the status of the compressor. Pass on the
+    # status of tar through fd 3, "set -o pipefail" is not supported by
+    # every sh. The archive goes to the original stdout through fd 4.
+    return (
+        f"{{ {{ {{ {command}; echo $? >&3; }} | {compress} >&4; }} 3>&1 "
+        "| { read status; exit $status; }; } 4>&1"
+    )
+
+
+def extract_tar_stream(
+    fileobj: IO[bytes], local_dir: PathLike, compression: str = "none"
+) -> None:
+    """Extract a tar archive while it is being read from a stream.
+
+    Parameters
+    ----------
+    fileobj : IO[bytes]
+        Readable stream of the archive, e.g. the stdout of :func:`tar_command`.
+    local_dir : PathLike
+        Directory to extract the archive into.
+    compression : str, optional
+        One of "none", "gzip" or "zstd", by default "none". Decompressing
+        zstd requires the :code:`zstandard` package.
+    """
+    _check_compression(compression)
+    mode = "r|gz" if compression == "gzip" else "r|"
+    if compression == "zstd":
+        import zstandard
+
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        if hasattr(tarfile, "data_filter"):
+            # Refuse absolute paths and links escaping the output directory
+            tar.extractall(local_dir, filter="data")
+        else:
+            tar.extractall(local_dir)
+
+
+def stream_tar(
+    transport: "Transport",
+    remote_dir: PathLike,
+    local_dir: PathLike,
+    excludes: Sequence[str] = (),
+    compression: str = "none",
+) -> None:
+    """Copy a remote directory by extracting :code:`tar` output as it arrives.
+
+    Nothing is written to the disk of the remote and no intermediate
+    archive is stored locally.
+
+    Parameters
+    ----------
+    transport : paramiko.Transport
+        Transport of an open ssh connection.
+    remote_dir : PathLike
+        Remote directory to copy.
+    local_dir : PathLike
+        Local directory to extract the contents of :obj:`remote_dir` into.
+    excludes : Sequence[str], optional
+        Glob patterns of files to skip.
+    compression : str, optional
+        One of "none", "gzip" or "zstd", by default "none".
+
+    Raises
+    ------
+    RuntimeError
+        If the remote tar command fails.
+    """
+    # Fail before starting the remote command if we cannot decompress
+    _check_compression(compression)
+    channel = transport.open_session()
+    try:
+        channel.exec_command(tar_command(remote_dir, excludes, compression))
+        error: Optional[tarfile.TarError] = None
+        with channel.makefile("rb") as stdout:
+            try:
+                extract_tar_stream(stdout, local_dir, compression)
+            except tarfile.TarError as e:
+                # A failed tar leaves an empty archive, report why it failed
+                error = e
+            # Drain the end of archive padding so the remote command can exit
+            while stdout.read(65536):
+                pass
+        status = channel.recv_exit_status()
+        if status != 0:
+            stderr = channel.makefile_stderr("rb").read().decode(errors="replace")
+            raise RuntimeError(
+                f"Streaming {remote_dir} failed with exit code {status}: {stderr}"
+            ) from error
+        if error is not None:
+            raise error
+    finally:
+        channel.close()
@@ -1,5 +1,6 @@
 """Workflow module to abstract specific experimental protocols from the search agent."""
 from ot2util.workflow.color_mixing import (
+    AsyncColorMixingWorkflow,  # noqa
     ColorMixingWorkflow,  # noqa
     ColorMixingWorkflowConfig,
 )
@@ -1,9 +1,7 @@
 """A workflow for color mixing protocols."""
 import logging
 from pathlib import Path
-from typing import List
-
-from opentrons.protocol_api import ProtocolContext
+from typing import TYPE_CHECKING, Any, Dict, List, Set
 
 from ot2util.config import (
     InstrumentConfig,
@@ -12,9 +10,23 @@ from ot2util.config import (
     ProtocolConfig,
     WorkflowConfig,
 )
-from ot2util.experiment import Experiment, OpenTronsRobot, RobotPool
+from ot2util.dedup import Deduplicator, ToleranceEquivalence
+from ot2util.experiment import (
+    AsyncRobotPool,
+    Experiment,
+    OpenTronsRobot,
+    RobotPool,
+)
+from ot2util.journal import Journal
 from ot2util.labware import TipRack, WellPlate
-from ot2util.workflow.workflow import Workflow
+from ot2util.scheduling import Requirements
+from ot2util.workflow.workflow import AsyncWorkflow, ExperimentBatcher, Workflow
+
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Future
+
+    from opentrons.protocol_api import ProtocolContext
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +57,12 @@ class ColorMixingRobotConfig(OpentronsRobotConfig):
     sourceplate: LabwareConfig = LabwareConfig(
         name="corning_6_wellplate_16.8ml_flat", location="3"
     )
+    extra_wellplates: List[str] = []
+    """Deck slots of further wellplates like :obj:`wellplate`, filled in
+    order once it is full."""
+    extra_tipracks: List[str] = []
+    """Deck slots of further tipracks like :obj:`tiprack`, used in order
+    once it is empty."""
     # TODO: Add camera config
 
 
@@ -59,8 +77,12 @@ class ColorMixingRobot(OpenTronsRobot):
         super().__init__(config)
         self.config = config
         self.output_dir = output_dir
-        self.wellplate = WellPlate()
-        self.tiprack = TipRack()
+        self.wellplate = WellPlate(
+            locations=[config.wellplate.location, *config.extra_wellplates]
+        )
+        self.tiprack = TipRack(
+            locations=[config.tiprack.location, *config.extra_tipracks]
+        )
         # TODO: Implement the camera
         self.camera = None
 
@@ -68,22 +90,26 @@ class ColorMixingRobot(OpenTronsRobot):
         self, name: str, source_wells: List[str], source_volumes: List[str]
     ) -> Experiment:
 
-        target_well = self.wellplate.get_open_well()
-        tips = self.tiprack.get_tips(n=3)
+        # Rolls over to the next plate or rack once one is used up
+        target = self.wellplate.allocate()
+        tips = self.tiprack.allocate(n=len(source_wells))
 
         # TODO: Perhaps allow user to interact at this point
-        if target_well is None:
+        if target is None:
+            if tips is not None:
+                self.tiprack.release(tips)
             raise ValueError("wellplate full")
         if tips is None:
+            self.wellplate.release(target)
             raise ValueError("no tips available")
 
         config = ColorMixingProtocolConfig(
             source_wells=source_wells,
             source_volumes=source_volumes,
-            tips=tips,
-            target_well=target_well,
-            wellplate=self.config.wellplate,
-            tiprack=self.config.tiprack,
+            tips=tips.wells,
+            target_well=target.wells[0],
+            wellplate=self.config.wellplate.copy(update={"location": target.location}),
+            tiprack=self.config.tiprack.copy(update={"location": tips.location}),
             pipette=self.config.pipette,
             sourceplate=self.config.sourceplate,
         )
@@ -95,6 +121,37 @@ class ColorMixingRobot(OpenTronsRobot):
         self.generate_template(experiment.protocol)
         return experiment
 
+    def resources(self) -> Dict[str, int]:
+        # The tips of an experiment all come from the same rack
+        return {
+            "tips": self.tiprack.most_remaining(),
+            "wells": self.wellplate.remaining(),
+        }
+
+    def checkpoint(self) -> Dict[str, Any]:
+        return {
+            "wellplate": self.wellplate.checkpoint(),
+            "tiprack": self.tiprack.checkpoint(),
+        }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        self.wellplate.restore(state["wellplate"])
+        self.tiprack.restore(state["tiprack"])
+
+    def labware(self) -> Set[str]:
+        return {
+            self.config.wellplate.name,
+            self.config.tiprack.name,
+            self.config.sourceplate.name,
+            self.config.pipette.name,
+        }
+
+    def requirements(
+        self, source_wells: List[str], source_volumes: List[str]
+    ) -> Requirements:
+        # One tip per source well, mixed into a single target well
+        return Requirements(consumables={"tips": len(source_wells), "wells": 1})
+
     def post_experiment(
         self, experiment: Experiment, source_wells: List[str], source_volumes: List[str]
     ) -> None:
@@ -111,7 +168,7 @@ class ColorMixingRobot(OpenTronsRobot):
         from ot2util.config import LabwareConfig  # noqa
         from ot2util.config import ProtocolConfig  # noqa
 
-    def run(protocol: ProtocolContext) -> None:  # type: ignore[misc]
+    def run(protocol: "ProtocolContext") -> None:  # type: ignore[misc]
 
         # Load the protocol configuration
         cfg = ColorMixingProtocolConfig.get_config(protocol)
@@ -144,22 +201,83 @@ class ColorMixingWorkflow(Workflow):
         self.robots = [
             ColorMixingRobot(robot, config.output_dir) for robot in config.robots
         ]
-        self.robot_pool = RobotPool(self.robots)  # type: ignore[arg-type]
-
-    def action(self, name: str, colors: List[str], volumes: List[str]) -> None:
+        journal = None
+        if config.journal is not None:
+            journal = Journal(config.journal, resume=config.resume)
+        dedup = None
+        if config.deduplicate:
+            dedup = Deduplicator(
+                ToleranceEquivalence(config.dedup_tolerances), config.dedup_store
+            )
+        self.robot_pool = RobotPool(
+            self.robots,  # type: ignore[arg-type]
+            max_queued=config.max_queued,
+            overflow=config.queue_overflow,
+            journal=journal,
+            dedup=dedup,
+        )
+        if config.resume:
+            self.futures.update(self.robot_pool.resume())
+        if config.batch_size > 1:
+            self.batcher = ExperimentBatcher(
+                self.robot_pool.submit_batch, config.batch_size, config.batch_window
+            )
+
+    def action(
+        self, name: str, colors: List[str], volumes: List[str]
+    ) -> "Future[Experiment]":
         # TODO: Color is probably a data type with name and location (Namedtuple).
         #       Suppose for now they are location names e.g. "A1"
 
+        logger.info(f"Launching experiment: {name}")
+        if self.batcher is not None:
+            future = self.batcher.add(name, source_wells=colors, source_volumes=volumes)
+        else:
+            future = self.robot_pool.submit(
+                name=name, source_wells=colors, source_volumes=volumes
+            )
+        self.futures.add(future)
+        return future
+
+    def state(self) -> None:  # noqa
+        # TODO: Retrieve camera values
+        return None
+
+
+class AsyncColorMixingWorkflow(AsyncWorkflow):
+    """Color mixing workflow for agents running an asyncio event loop.
+
+    Experiments are not batched, :obj:`batch_size` is ignored. Queue
+    limits, journaling and deduplication are not supported.
+    """
+
+    _UNSUPPORTED = ("max_queued", "queue_overflow", "journal", "resume", "deduplicate")
+
+    def __init__(self, config: ColorMixingWorkflowConfig) -> None:
+        unsupported = [
+            field
+            for field in self._UNSUPPORTED
+            if getattr(config, field) != config.__fields__[field].default
+        ]
+        if unsupported:
+            raise ValueError(
+                f"Not supported by the asyncio workflow: {', '.join(unsupported)}"
+            )
+        super().__init__()
+        self.robots = [
+            ColorMixingRobot(robot, config.output_dir) for robot in config.robots
+        ]
+        self.robot_pool = AsyncRobotPool(self.robots)  # type: ignore[arg-type]
+
+    def action(
+        self, name: str, colors: List[str], volumes: List[str]
+    ) -> "asyncio.Future[Experiment]":
         logger.info(f"Launching experiment: {name}")
         future = self.robot_pool.submit(
             name=name, source_wells=colors, source_volumes=volumes
         )
         self.futures.add(future)
-        # TODO: Implement automatic batching
-
-        # experiment = future.result()
-        # logger.info(f"Experiment {name} finished with returncode: {returncode}")
+        return future
 
     def state(self) -> None:  # noqa
-        # TODO: Retrieve camera values
         return None
@@ -1,9 +1,120 @@
 """Define Workflow interface."""
 
-from concurrent.futures import Future
-from typing import Any, List, Set
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError, wait
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from ot2util.experiment import Experiment
+from ot2util.experiment import Experiment, _copy_future
+
+BatchRequest = Tuple[str, Dict[str, Any]]
+
+
+class ExperimentBatcher:
+    """Collect experiment submissions and launch them in batches.
+
+    A batch is launched once it holds :obj:`batch_size` experiments or
+    :obj:`batch_window` seconds after its first experiment was added,
+    whichever comes first.
+    """
+
+    def __init__(
+        self,
+        submit_batch: Callable[[List[BatchRequest]], List["Future[Experiment]"]],
+        batch_size: int,
+        batch_window: float,
+    ) -> None:
+        """Initialize the batcher.
+
+        Parameters
+        ----------
+        submit_batch : Callable[[List[BatchRequest]], List[Future[Experiment]]]
+            Launches a batch of experiments, e.g. :meth:`RobotPool.submit_batch`.
+        batch_size : int
+            Maximum number of experiments in a batch.
+        batch_window : float
+            Seconds to wait for a batch to fill up, if 0 a partial batch is
+            only launched by calling :meth:`flush`.
+        """
+        self.submit_batch = submit_batch
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._pending: List[Tuple[str, Dict[str, Any], "Future[Experiment]"]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, **kwargs: Any) -> "Future[Experiment]":
+        """Add an experiment to the current batch.
+
+        Parameters
+        ----------
+        name : str
+            Name of the experiment.
+        **kwargs : Any
+            Keyword arguments of the experiment.
+
+        Returns
+        -------
+        Future[Experiment]
+            Future resolving once the experiment has finished.
+        """
+        future: Future[Experiment] = Future()
+        with self._lock:
+            self._pending.append((name, kwargs, future))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            elif self._timer is None and self.batch_window > 0:
+                self._timer = threading.Timer(self.batch_window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def flush(self) -> None:
+        """Launch the current batch even if it is not full."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        # Experiments cancelled while waiting for the batch are left out
+        pending = [entry for entry in self._pending if not entry[2].cancelled()]
+        self._pending = []
+        if not pending:
+            return
+        futures = self.submit_batch([(name, kwargs) for name, kwargs, _ in pending])
+        for (_, _, target), source in zip(pending, futures):
+            source.add_done_callback(partial(_copy_future, target=target))
+            # Cancelling the experiment removes it from the queued batch
+            target.add_done_callback(partial(_cancel_source, source))
+
+
+def _cancel_source(source: "Future[Experiment]", target: "Future[Experiment]") -> None:
+    if target.cancelled():
+        source.cancel()
+
+
+def _deadline(timeout: Optional[float]) -> Optional[float]:
+    return None if timeout is None else time.monotonic() + timeout
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
 
 
 class Workflow:
@@ -11,24 +122,156 @@ class Workflow:
 
     def __init__(self) -> None:
         """Initialize the workflow base class."""
-        self.futures: Set[Future[int]] = set()
+        self.futures: Set[Future[Experiment]] = set()
+        self.batcher: Optional[ExperimentBatcher] = None
 
-    def wait(self) -> List[Experiment]:
+    def wait(
+        self, min_count: Optional[int] = None, timeout: Optional[float] = None
+    ) -> List[Experiment]:
         """Wait for running experiments to finish.
 
+        Parameters
+        ----------
+        min_count : Optional[int], optional
+            Return once this many experiments have finished, by default
+            once all of them have.
+        timeout : Optional[float], optional
+            Return after this many seconds even if fewer experiments have
+            finished, by default no timeout.
+
         Returns
         -------
         List[Experiment]
-            List of finished :obj:`Experiment`.
+            List of finished :obj:`Experiment`. Experiments still running
+            are left in :obj:`futures`.
         """
-        experiments = [future.result() for future in self.futures]
-        self.futures = set()
-        return experiments
+        # Launch any partially filled batch before waiting on it
+        if self.batcher is not None:
+            self.batcher.flush()
+        if min_count is None:
+            min_count = len(self.futures)
+        done = self._wait(min_count, _deadline(timeout))
+        self.futures.difference_update(done)
+        return [future.result() for future in done]
+
+    def as_completed(self, timeout: Optional[float] = None) -> Iterator[Experiment]:
+        """Yield running experiments as soon as each of them finishes.
+
+        Experiments submitted while iterating are yielded as well, so an
+        agent can submit its next proposal for each finished experiment.
+
+        Parameters
+        ----------
+        timeout : Optional[float], optional
+            Seconds to wait for all experiments, by default no timeout.
 
-    def action(self, *args: Any, **kwargs: Any) -> None:
+        Yields
+        ------
+        Experiment
+            The next finished :obj:`Experiment`.
+
+        Raises
+        ------
+        concurrent.futures.TimeoutError
+            If experiments are still running after :obj:`timeout` seconds.
+        """
+        deadline = _deadline(timeout)
+        while self.futures:
+            if self.batcher is not None:
+                self.batcher.flush()
+            done = self._wait(1, deadline)
+            if not done:
+                raise TimeoutError(f"{len(self.futures)} experiments still running")
+            for future in done:
+                self.futures.discard(future)
+                yield future.result()
+
+    def _wait(
+        self, min_count: int, deadline: Optional[float]
+    ) -> List["Future[Experiment]"]:
+        done = [future for future in self.futures if future.done()]
+        pending = self.futures.difference(done)
+        while len(done) < min_count and pending:
+            timeout = _remaining(deadline)
+            if timeout == 0:
+                break
+            finished, pending = wait(pending, timeout, FIRST_COMPLETED)
+            done.extend(finished)
+        return done
+
+    def action(self, *args: Any, **kwargs: Any) -> "Future[Experiment]":
+        """Child class should implement, returning the future of the experiment."""
+        raise NotImplementedError
+
+    def state(self, *args: Any, **kwargs: Any) -> None:
         """Child class should implement."""
         raise NotImplementedError
 
+
+class AsyncWorkflow:
+    """Workflow base class for agents running an asyncio event loop."""
+
+    def __init__(self) -> None:
+        """Initialize the workflow base class."""
+        self.futures: Set["asyncio.Future[Experiment]"] = set()
+
+    async def wait(
+        self, min_count: Optional[int] = None, timeout: Optional[float] = None
+    ) -> List[Experiment]:
+        """Wait for running experiments to finish, see :meth:`Workflow.wait`.
+
+        Returns
+        -------
+        List[Experiment]
+            List of finished :obj:`Experiment`. Experiments still running
+            are left in :obj:`futures`.
+        """
+        if min_count is None:
+            min_count = len(self.futures)
+        done = await self._wait(min_count, _deadline(timeout))
+        self.futures.difference_update(done)
+        return [future.result() for future in done]
+
+    async def as_completed(
+        self, timeout: Optional[float] = None
+    ) -> AsyncIterator[Experiment]:
+        """Yield running experiments as they finish, see :meth:`Workflow.as_completed`.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            If experiments are still running after :obj:`timeout` seconds.
+        """
+        deadline = _deadline(timeout)
+        while self.futures:
+            done = await self._wait(1, deadline)
+            if not done:
+                raise asyncio.TimeoutError(
+                    f"{len(self.futures)} experiments still running"
+                )
+            for future in done:
+                self.futures.discard(future)
+                yield future.result()
+
+    async def _wait(
+        self, min_count: int, deadline: Optional[float]
+    ) -> List["asyncio.Future[Experiment]"]:
+        done = [future for future in self.futures if future.done()]
+        pending = self.futures.difference(done)
+        while len(done) < min_count and pending:
+            timeout = _remaining(deadline)
+            if timeout == 0:
+                break
+            finished, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            done.extend(finished)
+        return done
+
+    def action(self, *args: Any, **kwargs: Any) -> "asyncio.Future[Experiment]":
+        """Child class should implement, returning the future of the experiment."""
+        raise NotImplementedError
+
     def state(self, *args: Any, **kwargs: Any) -> None:
         """Child class should implement."""
         raise NotImplementedError
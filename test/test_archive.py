@@ -0,0 +1,62 @@
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ot2util.archive import ArchivedFrame, FrameArchive
+from ot2util.camera import FiducialCalibration
+
+
+def _calibration(frame: np.ndarray) -> FiducialCalibration:
+    corners = np.array(
+        [[[x, 10], [x + 20, 10], [x + 20, 30], [x, 30]] for x in (10, 60)]
+    )
+    geometry = (
+        np.array([520.0, 380.0]),
+        np.array([100, 80]),
+        np.array([60.0, 0.0]),
+        np.array([0.0, 27.0]),
+    )
+    return FiducialCalibration.from_frame(frame[..., 0], [0, 1], corners, geometry)
+
+
+@pytest.mark.parametrize("format", ["jpg", "png", "mjpeg"])
+def test_archive_frames(tmp_path: Path, format: str) -> None:
+    frame = np.zeros((960, 1280, 3), dtype=np.uint8)
+    archive = FrameArchive(format)
+    archive.submit(frame, tmp_path, "A1", {"rgb": [1, 2, 3]}, _calibration(frame))
+    archive.submit(frame, tmp_path, "plate", {"rgb": [[[1, 2, 3]]]})
+    archive.close()
+
+    with open(tmp_path / "frames.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["label"] for r in records] == ["A1", "plate"]
+    assert records[0]["measurement"] == {"rgb": [1, 2, 3]}
+    if format == "mjpeg":
+        data = (tmp_path / "frames.mjpeg").read_bytes()
+        assert data[records[1]["offset"] :].startswith(b"\xff\xd8")
+    else:
+        assert records[1]["file"] == f"frames/00001-plate.{format}"
+        assert (tmp_path / records[1]["file"]).stat().st_size > 0
+
+
+def test_drop_when_full(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    written = threading.Event()
+    writing = threading.Event()
+
+    def write(self: FrameArchive, archived: ArchivedFrame) -> None:
+        writing.set()
+        written.wait()
+
+    monkeypatch.setattr(FrameArchive, "_write", write)
+    archive = FrameArchive(max_queued=1)
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    assert archive.submit(frame, tmp_path, "A1", {})
+    writing.wait(timeout=5)
+    assert archive.submit(frame, tmp_path, "A2", {})
+    assert not archive.submit(frame, tmp_path, "A3", {})
+    assert archive.dropped == 1
+    written.set()
+    archive.close()
@@ -0,0 +1,91 @@
+class _FakeProtocol:
+    def __init__(self):
+        self.loads = 0
+
+    def is_simulating(self):
+        return False
+
+    def load_labware(self, name, location):
+        self.loads += 1
+        return object()
+
+    def load_instrument(self, name, mount, tip_racks=None):
+        self.loads += 1
+        pipette = _FakePipette()
+        pipette.tip_racks = list(tip_racks or [])
+        return pipette
+
+
+class _FakePipette:
+    tip_racks = []
+
+
+def _write_batch(tmp_path, n):
+    from ot2util.config import BatchConfig, BatchEntryConfig
+
+    entries = []
+    for i in range(n):
+        config = tmp_path / f"config-{i}.yaml"
+        config.write_text(f"index: {i}\n")
+        entries.append(BatchEntryConfig(config=config, workdir=tmp_path / str(i)))
+    batch_yaml = tmp_path / "batch.yaml"
+    BatchConfig(experiments=entries).write_yaml(batch_yaml)
+    return batch_yaml
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    import os
+
+    from ot2util.batch import BATCH_ENV, read_returncode, run_batch
+    from ot2util.config import CONFIG_ENV
+
+    monkeypatch.setenv(BATCH_ENV, str(_write_batch(tmp_path, 3)))
+    protocol = _FakeProtocol()
+
+    def run(ctx):
+        labware = ctx.load_labware("plate", "1")
+        assert labware is ctx.load_labware("plate", "1")
+        with open(os.environ[CONFIG_ENV]) as f:
+            print(f.read())
+
+    run_batch(protocol, run)
+
+    assert protocol.loads == 1
+    for i in range(3):
+        assert read_returncode(tmp_path / str(i)) == 0
+        assert (tmp_path / str(i) / "stdout.log").read_text() == f"index: {i}\n\n"
+
+
+def test_run_batch_stops_on_failure(tmp_path, monkeypatch):
+    from ot2util.batch import BATCH_ENV, read_returncode, run_batch
+
+    monkeypatch.setenv(BATCH_ENV, str(_write_batch(tmp_path, 3)))
+    calls = []
+
+    def run(ctx):
+        calls.append(ctx)
+        if len(calls) == 2:
+            raise RuntimeError("pipette crashed")
+
+    run_batch(_FakeProtocol(), run)
+
+    assert len(calls) == 2
+    assert read_returncode(tmp_path / "0") == 0
+    assert read_returncode(tmp_path / "1") == 1
+    assert read_returncode(tmp_path / "2") == -1
+    assert "pipette crashed" in (tmp_path / "1" / "stderr.log").read_text()
+
+
+def test_batch_loads_by_location():
+    from ot2util.batch import _BatchProtocolContext
+
+    protocol = _FakeProtocol()
+    ctx = _BatchProtocolContext(protocol)
+    first, second = ctx.load_labware("tips", "1"), ctx.load_labware("tips", "4")
+    pipette = ctx.load_instrument("p300_single", "right", tip_racks=[first])
+    # A later experiment rolled over to the next rack
+    again = ctx.load_instrument("p300_single", mount="right", tip_racks=[second])
+    assert again is pipette
+    assert pipette.tip_racks == [first, second]
+    assert ctx.load_labware("tips", location="4") is second
+    assert protocol.loads == 3
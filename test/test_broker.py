@@ -0,0 +1,124 @@
+import json
+import socket
+import threading
+from concurrent.futures import CancelledError, Future
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from ot2util.broker import Broker, BrokerClient, BrokerServer, QuotaExceededError
+from ot2util.config import ClientQuotaConfig, ProtocolConfig
+from ot2util.daemon import REQUEST, recv_frame, send_frame
+from ot2util.experiment import Experiment, Robot, RobotPool
+
+
+class _SimulatedRobot(Robot):
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.gate = threading.Event()
+        self.executed: List[str] = []
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    def run_local(self, experiment: Experiment) -> int:
+        assert self.gate.wait(timeout=10)
+        self.executed.append(experiment.name)
+        return int(experiment.name.endswith("fail"))
+
+
+def test_fair_share(tmp_path: Path) -> None:
+    robot = _SimulatedRobot(tmp_path)
+    broker = Broker(
+        RobotPool([robot]), quotas={"greedy": ClientQuotaConfig(max_queued=3)}
+    )
+    futures = [broker.submit("greedy", f"g{i}") for i in range(4)]
+    # g0 is running, the other three are queued
+    with pytest.raises(QuotaExceededError):
+        broker.submit("greedy", "g4")
+    futures += [broker.submit("polite", f"p{i}") for i in range(2)]
+
+    robot.gate.set()
+    for future in futures:
+        future.result(timeout=10)
+    # The first experiment of greedy was started before polite submitted
+    assert robot.executed == [
+        "greedy-g0",
+        "polite-p0",
+        "greedy-g1",
+        "polite-p1",
+        "greedy-g2",
+        "greedy-g3",
+    ]
+
+
+class _ResolvedPool:
+    """Resolves all but the first submission right away, like a journal."""
+
+    def __init__(self) -> None:
+        self.robots = [None]
+        self.futures: List[Future] = []
+
+    def submit(self, name: str) -> Future:
+        future: Future = Future()
+        if self.futures:
+            future.set_result(name)
+        self.futures.append(future)
+        return future
+
+
+def test_dispatch_resolved(tmp_path: Path) -> None:
+    pool = _ResolvedPool()
+    broker = Broker(pool)  # type: ignore[arg-type]
+    futures = [broker.submit("agent", f"e{i}") for i in range(5000)]
+    # The backlog is dispatched once the first experiment is done
+    pool.futures[0].set_result("agent-e0")
+    assert [future.result(timeout=0) for future in futures[-2:]] == [
+        "agent-e4998",
+        "agent-e4999",
+    ]
+
+    # Cancelled experiments of the pool give back their slot
+    pool.futures = []
+    cancelled, queued = broker.submit("agent", "c0"), broker.submit("agent", "c1")
+    pool.futures[0].cancel()
+    with pytest.raises(CancelledError):
+        cancelled.result(timeout=0)
+    assert queued.result(timeout=0) == "agent-c1"
+    assert broker.running("agent") == 0
+
+
+def test_broker_server(tmp_path: Path) -> None:
+    robot = _SimulatedRobot(tmp_path)
+    robot.gate.set()
+    broker = Broker(RobotPool([robot]), default_quota=ClientQuotaConfig(max_queued=0))
+    broker.quotas["agent"] = ClientQuotaConfig()
+    with BrokerServer(broker) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        with BrokerClient("agent", server.port) as client:
+            result = client.submit("e0").result(timeout=10)
+            assert result.name == "agent-e0"
+            assert result.returncode == 0
+            assert result.output_dir == tmp_path / "agent-e0"
+            with pytest.raises(Exception, match="returncode"):
+                client.submit("fail").result(timeout=10)
+        with socket.create_connection(("127.0.0.1", server.port)) as sock:
+            send_frame(sock, REQUEST, json.dumps({"id": 7, "client": 1}).encode())
+            response = json.loads(recv_frame(sock)[1])
+            assert response["id"] == 7
+            assert "Malformed request" in response["error"]
+            # The connection is still served
+            send_frame(sock, REQUEST, b"[")
+            assert "Malformed" in json.loads(recv_frame(sock)[1])["error"]
+        with pytest.raises(ValueError):
+            BrokerClient("a-b", server.port)
+        with socket.create_connection(("127.0.0.1", server.port)) as sock:
+            request = {"id": 0, "client": "a-b", "name": "c"}
+            send_frame(sock, REQUEST, json.dumps(request).encode())
+            assert '"-"' in json.loads(recv_frame(sock)[1])["error"]
+        with BrokerClient("other", server.port) as client:
+            with pytest.raises(QuotaExceededError):
+                client.submit("e0").result(timeout=10)
+        server.shutdown()
@@ -0,0 +1,115 @@
+from ot2util.config import MetaDataConfig, ProtocolConfig
+
+
+class _TestProtocolConfig(ProtocolConfig):
+    volume: int = 10
+
+
+def _imports():
+    """Test protocol."""
+    from ot2util.config import ProtocolConfig  # noqa
+
+
+def _run(protocol):
+    cfg = _TestProtocolConfig.get_config(protocol)  # noqa
+
+
+def _write(filename, cache=None, metadata=MetaDataConfig()):
+    from ot2util.experiment import write_template
+
+    write_template(
+        filename,
+        imports=_imports,
+        config_class=_TestProtocolConfig,
+        run_func=_run,
+        metadata=metadata,
+        cache=cache,
+    )
+
+
+def test_protocol_cache_hit(tmp_path):
+    from ot2util.cache import ProtocolCache
+
+    cache = ProtocolCache(tmp_path / "cache")
+    _write(tmp_path / "uncached.py")
+    _write(tmp_path / "first.py", cache)
+    _write(tmp_path / "second.py", cache)
+
+    assert cache.misses == 1
+    assert cache.hits == 1
+    expected = (tmp_path / "uncached.py").read_text()
+    assert (tmp_path / "first.py").read_text() == expected
+    assert (tmp_path / "second.py").read_text() == expected
+
+    # Editing the protocol of one experiment leaves the cached file alone
+    (tmp_path / "first.py").write_text("edited")
+    _write(tmp_path / "third.py", cache)
+    assert (tmp_path / "third.py").read_text() == expected
+
+
+def test_protocol_cache_evicts_least_recently_used(tmp_path):
+    import os
+
+    from ot2util.cache import ProtocolCache
+
+    cache = ProtocolCache(tmp_path / "cache", max_entries=2)
+    for i, key in enumerate(["a", "b"]):
+        path = cache.put(key, key)
+        os.utime(path, (i, i))
+    assert cache.get("a") is not None
+    cache.put("c", "c")
+
+    assert sorted(p.stem for p in cache.cache_dir.glob("*.py")) == ["a", "c"]
+
+
+def test_protocol_cache_key_includes_metadata(tmp_path):
+    from ot2util.cache import ProtocolCache
+
+    cache = ProtocolCache(tmp_path / "cache")
+    _write(tmp_path / "first.py", cache)
+    _write(tmp_path / "second.py", cache, MetaDataConfig(author="Other"))
+
+    assert cache.misses == 2
+    assert "Other" in (tmp_path / "second.py").read_text()
+
+
+def test_result_cache_restore(tmp_path):
+    from ot2util.cache import ResultCache
+
+    cache = ResultCache(tmp_path / "cache")
+    run = tmp_path / "run"
+    (run / "images").mkdir(parents=True)
+    (run / "stdout.log").write_text("Picking up tip")
+    (run / "images" / "plate.jpg").write_bytes(b"jpg")
+    (run / "protocol.py").write_text("protocol")
+
+    assert not cache.get("key", tmp_path / "miss")
+    cache.put("key", run, excludes=["protocol.py"])
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    assert cache.get("key", restored)
+
+    assert (restored / "stdout.log").read_text() == "Picking up tip"
+    assert (restored / "images" / "plate.jpg").read_bytes() == b"jpg"
+    assert not (restored / "protocol.py").exists()
+    assert cache.hit_rate == 0.5
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    import os
+
+    from ot2util.cache import ResultCache
+
+    cache = ResultCache(tmp_path / "cache", max_bytes=250)
+    run = tmp_path / "run"
+    run.mkdir()
+    (run / "result.dat").write_bytes(b"x" * 100)
+    for i, key in enumerate(["a", "b"]):
+        cache.put(key, run)
+        os.utime(cache.cache_dir / key, (i, i))
+
+    # Using "a" makes "b" the least recently used entry
+    assert cache.get("a", tmp_path / "a")
+    cache.put("c", run)
+
+    assert sorted(p.name for p in cache.cache_dir.iterdir()) == ["a", "c"]
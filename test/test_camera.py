@@ -0,0 +1,95 @@
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pytest
+
+from ot2util.camera import Camera, FiducialCalibration, Geometry
+
+
+def test_measure_plate_matches_wells() -> None:
+    rng = np.random.default_rng(0)
+    # A gradient with noise, so that every well has a different color
+    gradient = np.linspace(0, 200, 960 * 1280 * 3).reshape(960, 1280, 3)
+    frame = (gradient + rng.integers(0, 50, gradient.shape)).astype(np.uint8)
+    center_origin = np.array([40, 30])
+    diameter_x = np.array([70.2, 0.4])
+    diameter_y = np.array([0.6, 36.3])
+    center_br = center_origin + 11 * diameter_y + 7 * diameter_x + [1.3, -0.8]
+
+    centers = Camera._well_centers(center_br, center_origin, diameter_x, diameter_y)
+    rgb, hsv = Camera._colors_at(frame, centers, diameter_x[0] // 3)
+    assert rgb.shape == hsv.shape == (8, 12, 3)
+    camera = Camera.__new__(Camera)
+    for row, letter in enumerate("ABCDEFGH"):
+        for column in range(12):
+            well = f"{letter}{column + 1}"
+            _, well_rgb, well_hsv = camera._get_color(
+                frame,
+                center_br,
+                center_origin,
+                diameter_x,
+                diameter_y,
+                camera._convert_coordinate(well),
+            )
+            assert tuple(rgb[row, column]) == well_rgb
+            assert tuple(hsv[row, column]) == well_hsv
+
+
+def _marker_frame(shift: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(1)
+    frame = np.full((480, 640), 128, dtype=np.uint8)
+    corners = []
+    for x, y in [(40, 40), (560, 40), (40, 400), (560, 400)]:
+        frame[y : y + 40, x : x + 40] = rng.integers(0, 256, (40, 40))
+        corners.append([[x, y], [x + 39, y], [x + 39, y + 39], [x, y + 39]])
+    return np.roll(frame, shift, axis=1), np.array(corners, dtype=float) + [shift, 0]
+
+
+def _geometry() -> Geometry:
+    return (
+        np.array([520.0, 380.0]),
+        np.array([100, 80]),
+        np.array([60.0, 0.0]),
+        np.array([0.0, 27.0]),
+    )
+
+
+def test_calibration_drift(tmp_path: Path) -> None:
+    frame, corners = _marker_frame()
+    calibration = FiducialCalibration.from_frame(
+        frame, [0, 1, 2, 3], corners, _geometry()
+    )
+    assert not calibration.drifted(frame)
+    # The pipette head hides a marker
+    blocked = frame.copy()
+    blocked[30:90, 30:90] = 0
+    assert not calibration.drifted(blocked)
+    assert calibration.drifted(_marker_frame(shift=15)[0])
+
+    calibration.save(tmp_path / "calibration.npz")
+    loaded = FiducialCalibration.load(tmp_path / "calibration.npz")
+    assert np.array_equal(loaded.centers, calibration.centers)
+    assert not loaded.drifted(frame)
+
+
+def test_follow_visible_markers(monkeypatch: pytest.MonkeyPatch) -> None:
+    frame, corners = _marker_frame()
+    camera = Camera.__new__(Camera)
+    camera.drift_threshold = 0.8
+    camera.calibration = FiducialCalibration.from_frame(
+        frame, [0, 1, 2, 3], corners, _geometry()
+    )
+
+    # The camera moved and one marker is hidden
+    moved, moved_corners = _marker_frame(shift=15)
+    monkeypatch.setattr(
+        Camera,
+        "_detect_markers",
+        staticmethod(lambda gray: (list(moved_corners[1:]), [1, 2, 3])),
+    )
+    calibration = camera._calibrated(moved)
+    assert calibration is camera.calibration
+    old = Camera._well_centers(*_geometry())
+    assert np.abs(calibration.centers - old - [15, 0]).max() <= 1
+    assert not calibration.drifted(moved)
@@ -0,0 +1,132 @@
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+import pytest
+
+from ot2util.camera import Camera
+from ot2util.capture import (
+    FrameGrabber,
+    ImageDirectorySource,
+    SyntheticPlateSource,
+    VideoSource,
+)
+
+
+class _FakeCapture:
+    """Frames filled with their sequence number, at most :obj:`limit` of them."""
+
+    def __init__(self, limit: int = 1000) -> None:
+        self.limit = limit
+        self.count = 0
+        self.allowed = threading.Semaphore(0)
+        self.free_running = False
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, np.ndarray]:
+        if not self.free_running:
+            self.allowed.acquire()
+        if self.count == self.limit:
+            return False, None
+        if image is None:
+            image = np.empty((4, 6, 3), dtype=np.uint8)
+        image[...] = self.count
+        self.count += 1
+        return True, image
+
+    def release(self) -> None:
+        pass
+
+
+def test_ring_buffer() -> None:
+    cap = _FakeCapture()
+    with FrameGrabber(cap, size=4) as grabber:
+        with pytest.raises(TimeoutError):
+            grabber.latest_frame(timeout=0.05)
+        start = time.monotonic()
+        for _ in range(6):
+            cap.allowed.release()
+        frame = grabber.latest_frame(newer_than=start, timeout=5)
+        while frame.sequence < 5:
+            frame = grabber.latest_frame(newer_than=frame.timestamp, timeout=5)
+        assert (frame.image == 5).all()
+        assert not frame.image.flags.writeable
+
+        # The slot of the oldest frame may be written next, it is left out
+        frames = grabber.frames_since(start)
+        assert [f.sequence for f in frames] == [3, 4, 5]
+        assert all((f.image == f.sequence).all() for f in frames)
+        assert [f.sequence for f in grabber.frames_since(frames[1].timestamp)] == [5]
+        # Zero-copy views into the ring buffer
+        assert np.shares_memory(frames[-1].image, frame.image)
+
+        cap.allowed.release()
+        grabber.latest_frame(newer_than=frame.timestamp, timeout=5)
+        assert not grabber.valid(frames[0])
+        assert grabber.valid(frames[1])
+        cap.free_running = True
+        cap.allowed.release()
+
+
+def test_device_stops() -> None:
+    cap = _FakeCapture(limit=1)
+    for _ in range(2):
+        cap.allowed.release()
+    grabber = FrameGrabber(cap)
+    first = grabber.latest_frame(timeout=5)
+    with pytest.raises(RuntimeError):
+        grabber.latest_frame(newer_than=first.timestamp, timeout=5)
+    grabber.close()
+
+
+def test_camera_read_copies() -> None:
+    cap = _FakeCapture()
+    camera = Camera(source=cap, buffered_frames=2)
+    cap.allowed.release()
+    image = camera.read()
+    # Both slots of the ring buffer are written again in the meantime
+    for _ in range(4):
+        cap.allowed.release()
+    grabber = camera.grabber
+    assert grabber is not None
+    frame = grabber.latest_frame()
+    while frame.sequence < 4:
+        frame = grabber.latest_frame(newer_than=frame.timestamp, timeout=5)
+    assert (image == 0).all()
+    cap.free_running = True
+    cap.allowed.release()
+    camera.close()
+
+
+def test_synthetic_plate() -> None:
+    source = SyntheticPlateSource(seed=3)
+    camera = Camera(source=source, marker_order=[0, 1, 2, 3], buffered_frames=2)
+    rgb, hsv = camera.measure_plate()
+    camera.close()
+    expected = cv2.cvtColor(source.colors.reshape(96, 1, 3), cv2.COLOR_BGR2HSV)
+    assert np.allclose(hsv, expected.reshape(8, 12, 3) / [179, 255, 255])
+
+
+def test_replay(tmp_path: Path) -> None:
+    frames = [np.full((48, 64, 3), 40 * i, dtype=np.uint8) for i in range(3)]
+    for i, frame in enumerate(frames):
+        cv2.imwrite(str(tmp_path / f"{i:02d}.png"), frame)
+    source = ImageDirectorySource(tmp_path, loop=True)
+    replayed = [source.read()[1] for _ in range(4)]
+    assert all((a == b).all() for a, b in zip(replayed, frames + frames[:1]))
+    # Read into a buffer in place, like the frame grabber does
+    image = np.empty_like(frames[0])
+    assert source.read(image)[1] is image
+
+    writer = cv2.VideoWriter(
+        str(tmp_path / "video.avi"), cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48)
+    )
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    source = VideoSource(tmp_path / "video.avi")
+    means = [source.read()[1].mean() for _ in range(3)]
+    assert np.allclose(means, [0, 40, 80], atol=2)
+    assert source.read() == (False, None)
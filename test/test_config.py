@@ -0,0 +1,38 @@
+import subprocess
+import sys
+import time
+
+# Budget in seconds for importing ot2util.config on top of starting python,
+# generated protocols import it on the robot for every experiment.
+IMPORT_BUDGET = 1.0
+
+HEAVY_MODULES = {"black", "cv2", "fabric", "jinja2", "opentrons", "paramiko", "pebble"}
+
+
+def _time_command(code):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    return time.perf_counter() - start, proc.stdout
+
+
+def test_import_config_is_light():
+    code = (
+        f"import sys, ot2util.config; print(sorted(set(sys.modules) & {HEAVY_MODULES}))"
+    )
+    _, stdout = _time_command(code)
+    assert stdout.strip() == "[]"
+
+
+def test_import_workflow_is_light():
+    code = f"import sys, ot2util.workflow; print(sorted(set(sys.modules) & {HEAVY_MODULES}))"
+    _, stdout = _time_command(code)
+    assert stdout.strip() == "[]"
+
+
+def test_import_config_time():
+    # Take the best of a few runs to reduce noise from the machine
+    baseline = min(_time_command("pass")[0] for _ in range(3))
+    elapsed = min(_time_command("import ot2util.config")[0] for _ in range(3))
+    assert elapsed - baseline < IMPORT_BUDGET
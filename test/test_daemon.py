@@ -0,0 +1,53 @@
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+from ot2util import daemon
+from ot2util.logs import LogWriter
+
+PROTOCOL = """
+metadata = {"apiLevel": "2.12"}
+
+
+def run(protocol):
+    import os
+
+    tiprack = protocol.load_labware("opentrons_96_tiprack_300ul", "1")
+    pipette = protocol.load_instrument("p300_single_gen2", "right", [tiprack])
+    pipette.pick_up_tip()
+    pipette.drop_tip()
+    if os.environ.get("FAIL"):
+        raise RuntimeError("failed on purpose")
+"""
+
+
+def _submit(port: int, tmp_path: Path, name: str, **env: str) -> int:
+    protocol = tmp_path / "protocol.py"
+    protocol.write_text(PROTOCOL)
+    with socket.create_connection(("127.0.0.1", port)) as sock, LogWriter(
+        tmp_path / f"{name}.out"
+    ) as stdout, LogWriter(tmp_path / f"{name}.err") as stderr:
+        return daemon.submit(sock, protocol, stdout, stderr, simulate=True, env=env)
+
+
+def test_daemon_simulate(tmp_path: Path) -> None:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "ot2util.daemon", "--port", "0"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert proc.stdout is not None
+        port = int(proc.stdout.readline().split()[-1])
+
+        assert _submit(port, tmp_path, "ok") == 0
+        assert "Picking up tip" in (tmp_path / "ok.out").read_text()
+
+        # The daemon keeps serving after a failed protocol
+        assert _submit(port, tmp_path, "fail", FAIL="1") == 1
+        assert "failed on purpose" in (tmp_path / "fail.err").read_text()
+        assert _submit(port, tmp_path, "again") == 0
+    finally:
+        proc.kill()
+        proc.wait()
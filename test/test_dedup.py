@@ -0,0 +1,126 @@
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from ot2util.config import ProtocolConfig
+from ot2util.dedup import Deduplicator, ToleranceEquivalence
+from ot2util.experiment import Experiment, Robot, RobotPool
+from ot2util.scheduling import QueueFullError
+
+
+class _RecordingRobot(Robot):
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.gate = threading.Event()
+        self.executed: List[str] = []
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    def run_local(self, experiment: Experiment) -> int:
+        assert self.gate.wait(timeout=10)
+        experiment.cfg.write_yaml(experiment.yaml)
+        self.executed.append(experiment.name)
+        return 0
+
+    def run_local_batch(self, experiments: List[Experiment]) -> List[int]:
+        return [self.run_local(experiment) for experiment in experiments]
+
+
+def test_tolerance_dedup(tmp_path: Path) -> None:
+    robot = _RecordingRobot(tmp_path)
+    store = tmp_path / "dedup.jsonl"
+    dedup = Deduplicator(ToleranceEquivalence({"volumes": 0.5}), store)
+    pool = RobotPool([robot], dedup=dedup)
+
+    first = pool.submit("e0", wells=["A1"], volumes=[10.0])
+    # Waits for e0 instead of running
+    close = pool.submit("e1", wells=["A1"], volumes=[10.4])
+    far = pool.submit("e2", wells=["A1"], volumes=[11.0])
+    other = pool.submit_batch([("e3", {"wells": ["A2"], "volumes": [10.0]})])[0]
+    robot.gate.set()
+    assert close.result(timeout=10).name == "e0"
+    assert far.result(timeout=10).name == "e2"
+    assert other.result(timeout=10).name == "e3"
+    assert first.result(timeout=10).name == "e0"
+    assert robot.executed == ["e0", "e2", "e3"]
+    assert dedup.saved == 1
+
+    # Results stored by another workflow are reused without running
+    pool = RobotPool([robot], dedup=Deduplicator(path=store))
+    experiment = pool.submit("e4", wells=["A1"], volumes=[11.0]).result(timeout=10)
+    assert experiment.name == "e2"
+    assert experiment.output_dir == tmp_path / "e2"
+    assert pool.dedup.saved == 1  # type: ignore[union-attr]
+    assert robot.executed == ["e0", "e2", "e3"]
+
+
+def test_dedup_with_dropping_queue(tmp_path: Path) -> None:
+    robot = _RecordingRobot(tmp_path)
+    pool = RobotPool(
+        [robot], max_queued=1, overflow="drop_lowest", dedup=Deduplicator()
+    )
+    running = pool.submit("e0", volumes=[10.0])
+    while len(pool.queue):
+        time.sleep(0.01)
+    low = pool.submit("e1", volumes=[11.0])
+
+    # Dropping e1 fails its future while e2 is being submitted
+    submitter = threading.Thread(
+        target=lambda: pool.submit("e2", volumes=[12.0], priority=1), daemon=True
+    )
+    submitter.start()
+    submitter.join(timeout=10)
+    assert not submitter.is_alive()
+    with pytest.raises(QueueFullError):
+        low.result(timeout=10)
+
+    robot.gate.set()
+    assert running.result(timeout=10).name == "e0"
+    # Dropped experiments are not reused and run when submitted again
+    assert pool.submit("e3", volumes=[11.0]).result(timeout=10).name == "e3"
+    assert robot.executed == ["e0", "e2", "e3"]
+
+
+def test_dedup_cancel_waiters(tmp_path: Path) -> None:
+    robot = _RecordingRobot(tmp_path)
+    pool = RobotPool([robot], dedup=Deduplicator())
+    blocker = pool.submit("e0", volumes=[1.0])
+    first = pool.submit("e1", volumes=[10.0])
+    waiter = pool.submit("e2", volumes=[10.0])
+    # The equivalent waiter still gets the results of e1
+    assert first.cancel()
+    assert not waiter.cancelled()
+
+    other = pool.submit("e3", volumes=[20.0])
+    other_waiter = pool.submit("e4", volumes=[20.0])
+    # Nobody waits for e3 anymore, it is removed from the queue
+    assert other.cancel() and other_waiter.cancel()
+
+    robot.gate.set()
+    assert blocker.result(timeout=10).name == "e0"
+    assert waiter.result(timeout=10).name == "e1"
+    assert pool.submit("e5", volumes=[20.0]).result(timeout=10).name == "e5"
+    assert robot.executed == ["e0", "e1", "e5"]
+
+
+def test_dedup_load_fails(tmp_path: Path) -> None:
+    robot = _RecordingRobot(tmp_path)
+    dedup = Deduplicator()
+    pool = RobotPool([robot], dedup=dedup)
+    robot.gate.set()
+    assert pool.submit("e0", volumes=[10.0]).result(timeout=10).name == "e0"
+
+    def load(entry: Any) -> Experiment:
+        raise FileNotFoundError(entry.name)
+
+    # The results of e0 can not be loaded, so e1 runs
+    submit = partial(RobotPool([robot]).submit, "e1", volumes=[10.0])
+    future = dedup.submit("e1", (), {"volumes": [10.0]}, submit, load)
+    assert future.result(timeout=10).name == "e1"
+    assert dedup.saved == 0
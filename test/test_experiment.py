@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from ot2util.config import OpentronsRobotConfig, ProtocolConfig
+from ot2util.experiment import (
+    AsyncRobotPool,
+    Experiment,
+    OpenTronsRobot,
+    Robot,
+    RobotPool,
+)
+from ot2util.scheduling import RobotDispatcher
+
+
+class _SlowTransferRobot(Robot):
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.release = threading.Event()
+        self.executed: List[str] = []
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    def run_local(self, experiment: Experiment) -> int:
+        self.executed.append(experiment.name)
+        return 0
+
+    def finish_experiment(self, experiment: Experiment) -> None:
+        assert self.release.wait(timeout=10)
+
+
+def test_robot_released_before_transfer(tmp_path: Path) -> None:
+    robot = _SlowTransferRobot(tmp_path)
+    pool = RobotPool([robot])
+
+    # The second experiment runs while the first is still transferring
+    first = pool.submit("e0")
+    second = pool.submit("e1")
+    deadline = time.monotonic() + 10
+    while len(robot.executed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert robot.executed == ["e0", "e1"]
+    assert not first.done()
+
+    robot.release.set()
+    assert first.result(timeout=10).name == "e0"
+    assert second.result(timeout=10).name == "e1"
+
+
+def test_dispatcher_fifo() -> None:
+    robot = Robot(run_local=True)
+    dispatcher = RobotDispatcher([robot])
+    assert dispatcher.acquire() is robot
+
+    order: List[int] = []
+
+    def wait_for_robot(i: int) -> None:
+        acquired = dispatcher.acquire()
+        order.append(i)
+        dispatcher.release(acquired)
+
+    threads = []
+    for i in range(3):
+        threads.append(threading.Thread(target=wait_for_robot, args=(i,)))
+        threads[-1].start()
+        # Wait until the thread is queued before starting the next one
+        while len(dispatcher._waiters) <= i:
+            time.sleep(0.001)
+    dispatcher.release(robot)
+    for thread in threads:
+        thread.join(timeout=10)
+    assert order == [0, 1, 2]
+    assert not robot.running
+
+
+class _GatedAsyncRobot(Robot):
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.gate = asyncio.Event()
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    async def run_experiment_async(self, experiment: Experiment) -> int:
+        await self.gate.wait()
+        return int(experiment.name == "fail")
+
+
+def test_async_robot_pool(tmp_path: Path) -> None:
+    async def main() -> None:
+        robot = _GatedAsyncRobot(tmp_path)
+        pool = AsyncRobotPool([robot])
+        first = pool.submit("e0")
+        cancelled = pool.submit("e1")
+        failing = pool.submit("fail")
+        # Let the experiments start or queue up for the robot
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        robot.gate.set()
+        assert (await first).name == "e0"
+        with pytest.raises(ValueError, match="returncode"):
+            await failing
+        assert cancelled.cancelled()
+        assert not robot.running
+        assert pool.dispatcher.load(robot) == 0
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+class _WellRobot(Robot):
+    """Takes a well for each experiment, experiments named "bad" can not be set up."""
+
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.wells = 4
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        if name == "bad":
+            raise ValueError("No wells available")
+        self.wells -= 1
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    def run_local_batch(self, experiments: List[Experiment]) -> List[int]:
+        return [0] * len(experiments)
+
+    def checkpoint(self) -> Dict[str, Any]:
+        return {"wells": self.wells}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        self.wells = state["wells"]
+
+
+def test_failed_batch_setup_releases_labware(tmp_path: Path) -> None:
+    robot = _WellRobot(tmp_path)
+    pool = RobotPool([robot])
+    futures = pool.submit_batch([("e0", {}), ("e1", {}), ("bad", {})])
+    with pytest.raises(ValueError):
+        futures[0].result(timeout=10)
+    assert robot.wells == 4
+
+
+def test_local_runs_simulate(tmp_path: Path) -> None:
+    config = OpentronsRobotConfig(run_local=True, opentrons_path=tmp_path)
+    robot = OpenTronsRobot(config)
+    # Local runs never drive hardware, even without run_simulation
+    assert robot._local_exe == "opentrons_simulate"
+    (tmp_path / "opentrons_simulate").touch()
+    assert robot._local_exe == str(tmp_path / "opentrons_simulate")
@@ -0,0 +1,56 @@
+from pathlib import Path
+from typing import Any, Dict, List
+
+from ot2util.config import ProtocolConfig
+from ot2util.experiment import Experiment, Robot, RobotPool
+from ot2util.journal import Journal
+
+
+class _CountingRobot(Robot):
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.used = 0
+        self.executed: List[str] = []
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        self.used += kwargs.get("tips", 1)
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    def run_local(self, experiment: Experiment) -> int:
+        experiment.cfg.write_yaml(experiment.yaml)
+        self.executed.append(experiment.name)
+        return 0
+
+    def checkpoint(self) -> Dict[str, Any]:
+        return {"used": self.used}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        self.used = state["used"]
+
+
+def test_resume(tmp_path: Path) -> None:
+    path = tmp_path / "journal.jsonl"
+    robot = _CountingRobot(tmp_path)
+    pool = RobotPool([robot], journal=Journal(path))
+    pool.submit("e0", tips=2).result(timeout=10)
+    # Crash after setting up e1, leaving a partial output directory behind
+    pool.journal.submitted("e1", (), {"tips": 3})  # type: ignore[union-attr]
+    pool.journal.allocated("e1", 0, {"used": 5}, tmp_path / "e1")  # type: ignore
+    (tmp_path / "e1").mkdir()
+    with open(path, "a") as f:
+        f.write('{"event": "submit", "na')
+
+    robot = _CountingRobot(tmp_path)
+    pool = RobotPool([robot], journal=Journal(path, resume=True))
+    resumed = pool.resume()
+    assert pool.submit("e1", tips=3) is resumed[0]
+    assert resumed[0].result(timeout=10).name == "e1"
+    # The tips of the interrupted run are not reused
+    assert robot.used == 8
+
+    experiment = pool.submit("e0", tips=2).result(timeout=10)
+    assert experiment.output_dir == tmp_path / "e0"
+    assert experiment.returncode == 0
+    assert robot.executed == ["e1"]
+    assert Journal(path, resume=True).state.completed == {"e0": 0, "e1": 0}
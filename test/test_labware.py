@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import pytest
+
+from ot2util.labware import Allocation, LabwareGrid, TipRack, WellPlate
+from ot2util.scheduling import LabwareAwarePolicy
+from ot2util.workflow.color_mixing import ColorMixingRobot, ColorMixingRobotConfig
+
+
+def test_allocate_and_release() -> None:
+    plate = WellPlate(reserved={"A2"})
+    assert plate.get_open_well() == "A1"
+    assert plate.get_open_well() == "A3"
+    plate.release(Allocation(None, ["A1"]))
+    assert plate.get_open_well() == "A1"
+    assert plate.remaining() == 96 - 3
+    with pytest.raises(ValueError):
+        plate.release(Allocation(None, ["B1"]))
+
+
+def test_rows_and_columns() -> None:
+    grid = LabwareGrid(reserved={"A2"})
+    assert grid.allocate_column() == [row + "1" for row in "ABCDEFGH"]
+    # The second column holds a reserved well
+    assert grid.allocate_column() == [row + "3" for row in "ABCDEFGH"]
+    assert grid.allocate(2) == ["A4", "A5"]
+    # Every row has a well in use
+    assert grid.allocate_row() is None
+    assert LabwareGrid().allocate_row() == [f"A{column}" for column in range(1, 13)]
+    assert LabwareGrid(rows=16, columns=24).allocate_column()[-1] == "P1"
+
+
+def test_rollover() -> None:
+    tiprack = TipRack(locations=["1", "4"])
+    for _ in range(31):
+        assert tiprack.allocate(3).location == "1"  # type: ignore[union-attr]
+    # Three tips left on the first rack, more go to the next one
+    assert tiprack.allocate(4) == Allocation("4", ["A1", "A2", "A3", "A4"])
+    assert tiprack.allocate(3) == Allocation("1", ["H10", "H11", "H12"])
+    assert tiprack.get_tips(1) == ["A5"]
+    assert tiprack.remaining() == 96 - 5
+
+    restored = TipRack(locations=["1", "4"])
+    restored.restore(tiprack.checkpoint())
+    assert restored.get_tips(1) == ["A6"]
+
+
+def test_partly_used_racks(tmp_path: Path) -> None:
+    config = ColorMixingRobotConfig(run_local=True, extra_tipracks=["4"])
+    robot = ColorMixingRobot(config, tmp_path)
+    for location in ["1", "4"]:
+        # Leave two tips on each rack
+        assert robot.tiprack.allocate(94).location == location  # type: ignore[union-attr]
+    assert robot.tiprack.remaining() == 4
+    assert robot.resources()["tips"] == 2
+
+    policy = LabwareAwarePolicy()
+    volumes = {"source_volumes": [1, 1, 1]}
+    assert not policy.can_run(robot, [((), {"source_wells": ["A1"] * 3, **volumes})])
+    assert policy.can_run(robot, [((), {"source_wells": ["A1"] * 2, **volumes})])
@@ -0,0 +1,33 @@
+from pathlib import Path
+from typing import List
+
+from ot2util.logs import LogWriter, ProtocolCommand, parse_command
+
+
+def test_parse_command() -> None:
+    assert parse_command("Picking up tip from A1 of rack on 1") == ProtocolCommand(
+        0, 0, "Picking up tip from A1 of rack on 1"
+    )
+    # opentrons_execute indents nested commands with tabs and a space
+    assert parse_command("\t\t Aspirating 10.0 uL from A1") == ProtocolCommand(
+        0, 2, "Aspirating 10.0 uL from A1"
+    )
+    assert parse_command("Air gap") is not None
+    assert parse_command("Warning: labware definition is deprecated") is None
+    assert parse_command("Traceback (most recent call last):") is None
+    assert parse_command("  File protocol.py, line 1") is None
+
+
+def test_log_writer_chunks(tmp_path: Path) -> None:
+    commands: List[ProtocolCommand] = []
+    output = b"Homing\nsome print\nDispensing 10.0 uL\n\t Dropping tip"
+    with LogWriter(tmp_path / "stdout.log", commands.append, 12) as writer:
+        # Lines are split across chunks and longer than the line limit
+        for i in range(0, len(output), 5):
+            writer.write(output[i : i + 5])
+    assert (tmp_path / "stdout.log").read_bytes() == output
+    assert commands == [
+        ProtocolCommand(0, 0, "Homing"),
+        ProtocolCommand(1, 0, "Dispensing 1"),
+        ProtocolCommand(2, 1, "Dropping t"),
+    ]
@@ -0,0 +1,140 @@
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+import pytest
+
+from ot2util.config import ProtocolConfig
+from ot2util.experiment import Experiment, Robot, RobotPool
+from ot2util.scheduling import (
+    ExperimentQueue,
+    QueueFullError,
+    Requirements,
+    RobotDispatcher,
+)
+
+
+class _LabwareRobot(Robot):
+    def __init__(self, tips: int, labware: Set[str] = {"tiprack"}) -> None:
+        super().__init__(run_local=True)
+        self.tips = tips
+        self._labware = labware
+
+    def resources(self) -> Dict[str, int]:
+        return {"tips": self.tips}
+
+    def labware(self) -> Set[str]:
+        return self._labware
+
+    def requirements(self, tips: int = 1, **kwargs: Any) -> Requirements:
+        return Requirements({"tips": tips}, frozenset(kwargs.get("labware", [])))
+
+
+def _run(dispatcher: RobotDispatcher, **kwargs: Any) -> Robot:
+    robot = dispatcher.acquire([((), kwargs)])
+    robot.tips -= kwargs.get("tips", 1)  # type: ignore[attr-defined]
+    dispatcher.release(robot)
+    dispatcher.done(robot)
+    return robot
+
+
+def test_balances_consumption() -> None:
+    low, high = _LabwareRobot(tips=10), _LabwareRobot(tips=16)
+    dispatcher = RobotDispatcher([low, high])
+
+    # Experiments go to the robot with the most tips until both are even
+    assert [_run(dispatcher, tips=3) for _ in range(2)] == [high, high]
+    assert low.tips == high.tips == 10
+    for _ in range(6):
+        _run(dispatcher, tips=3)
+    assert abs(low.tips - high.tips) <= 3
+
+
+def test_routes_by_labware_and_capacity() -> None:
+    plain = _LabwareRobot(tips=96)
+    camera = _LabwareRobot(tips=3, labware={"tiprack", "camera"})
+    dispatcher = RobotDispatcher([plain, camera])
+
+    assert _run(dispatcher, tips=3, labware=["camera"]) is camera
+    # The camera robot needs a refill, no other robot can run the experiment
+    with pytest.raises(ValueError, match="refill"):
+        dispatcher.acquire([((), {"labware": ["camera"]})])
+    assert _run(dispatcher, tips=3) is plain
+
+
+class _GatedRobot(Robot):
+    def __init__(self, output_dir: Path) -> None:
+        super().__init__(run_local=True)
+        self.output_dir = output_dir
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.executed: List[str] = []
+
+    def setup_experiment(self, name: str, *args: Any, **kwargs: Any) -> Experiment:
+        return Experiment(name, self.output_dir, ProtocolConfig())
+
+    def run_local(self, experiment: Experiment) -> int:
+        self.started.set()
+        assert self.gate.wait(timeout=10)
+        self.executed.append(experiment.name)
+        return 0
+
+
+def test_priority_and_cancellation(tmp_path: Path) -> None:
+    robot = _GatedRobot(tmp_path)
+    pool = RobotPool([robot])
+    busy = pool.submit("busy")
+    assert robot.started.wait(timeout=10)
+
+    low = pool.submit("low")
+    cancelled = pool.submit("cancelled", priority=10)
+    high = pool.submit("high", priority=5)
+    assert len(pool.queue) == 3
+    assert cancelled.cancel()
+    assert len(pool.queue) == 2
+
+    robot.gate.set()
+    for future in (busy, low, high):
+        future.result(timeout=10)
+    assert robot.executed == ["busy", "high", "low"]
+
+
+def test_queue_overflow() -> None:
+    rejecting = ExperimentQueue(max_size=1, overflow="reject")
+    rejecting.put("a", Future())
+    with pytest.raises(QueueFullError):
+        rejecting.put("b", Future(), priority=1)
+
+    dropping = ExperimentQueue(max_size=2, overflow="drop_lowest")
+    low: Future[Any] = Future()
+    dropping.put("low", low)
+    dropping.put("mid", Future(), priority=1)
+    with pytest.raises(QueueFullError):
+        dropping.put("lower", Future(), priority=-1)
+    dropping.put("high", Future(), priority=2)
+    assert isinstance(low.exception(timeout=0), QueueFullError)
+    assert [dropping.get(), dropping.get(), dropping.get()] == ["high", "mid", None]
+
+
+def test_dropped_callback_submits() -> None:
+    queue = ExperimentQueue(max_size=1, overflow="drop_lowest")
+    low: Future[Any] = Future()
+    queue.put("low", low)
+    resubmitted: Future[Any] = Future()
+    blocked = []
+
+    def resubmit(future: Future) -> None:
+        # Resubmitted from another thread, e.g. by an agent
+        thread = threading.Thread(
+            target=queue.put, args=("retry", resubmitted, 3), daemon=True
+        )
+        thread.start()
+        thread.join(timeout=1)
+        blocked.append(thread.is_alive())
+
+    low.add_done_callback(resubmit)
+    queue.put("high", Future(), priority=2)
+    assert isinstance(low.exception(timeout=0), QueueFullError)
+    assert blocked == [False]
+    assert queue.get() == "retry"
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from ot2util.config import CONFIG_ENV
+from ot2util.simulation import (
+    SimulationPool,
+    close_simulation_pools,
+    get_simulation_pool,
+)
+
+PROTOCOL = """
+import os
+
+metadata = {"apiLevel": "2.12"}
+
+
+def run(protocol):
+    tiprack = protocol.load_labware("opentrons_96_tiprack_300ul", "1")
+    pipette = protocol.load_instrument("p300_single_gen2", "right", [tiprack])
+    pipette.pick_up_tip(tiprack[os.environ["OT2UTIL_CONFIG"]])
+    pipette.drop_tip()
+"""
+
+
+def test_simulation_pool(tmp_path: Path) -> None:
+    protocol = tmp_path / "protocol.py"
+    protocol.write_text(PROTOCOL)
+    pool = SimulationPool(1)
+    try:
+        # The same worker runs both protocols with their own environment
+        for well in ["A1", "B2"]:
+            stdout, stderr = tmp_path / f"{well}.out", tmp_path / f"{well}.err"
+            assert pool.simulate(protocol, stdout, stderr, {CONFIG_ENV: well}) == 0
+            assert f"Picking up tip from {well}" in stdout.read_text()
+
+        # A failing protocol is reported in its own logs
+        stdout, stderr = tmp_path / "fail.out", tmp_path / "fail.err"
+        assert pool.simulate(protocol, stdout, stderr, {CONFIG_ENV: "Z9"}) == 1
+        assert "Traceback" in stderr.read_text()
+    finally:
+        pool.close()
+
+
+def test_shared_pools_close() -> None:
+    pool = get_simulation_pool(1)
+    assert get_simulation_pool(1) is pool
+    close_simulation_pools()
+    assert not pool.pool.active
+    # Started again when needed
+    other = get_simulation_pool(1)
+    assert other is not pool
+    close_simulation_pools()
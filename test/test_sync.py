@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+
+def test_changed_files(tmp_path):
+    from ot2util.sync import build_manifest, changed_files
+
+    remote, local = tmp_path / "remote", tmp_path / "local"
+    (remote / "images").mkdir(parents=True)
+    local.mkdir()
+    (remote / "same.log").write_text("same")
+    (remote / "grown.log").write_text("grown")
+    (remote / "images" / "new.png").write_text("new")
+    (local / "same.log").write_text("same")
+    (local / "grown.log").write_text("grow")
+    st = (remote / "same.log").stat()
+    os.utime(local / "same.log", ns=(st.st_mtime_ns, st.st_mtime_ns))
+
+    changed = changed_files(build_manifest(remote), build_manifest(local))
+    assert changed == ["grown.log", "images/new.png"]
+
+    # Same size and contents but a different modification time
+    os.utime(local / "same.log", ns=(0, 0))
+    changed = changed_files(build_manifest(remote), build_manifest(local))
+    assert "same.log" in changed
+    changed = changed_files(
+        build_manifest(remote, hashes=True), build_manifest(local, hashes=True)
+    )
+    assert "same.log" not in changed
+
+
+def test_manifest_command(tmp_path):
+    from ot2util.sync import build_manifest, manifest_command, parse_manifest
+
+    (tmp_path / "images").mkdir()
+    (tmp_path / "protocol.py").write_text("protocol")
+    (tmp_path / "stdout.log").write_text("log")
+    (tmp_path / "images" / "a.png").write_text("a")
+
+    command = manifest_command(
+        tmp_path, includes=["*.log", "*.png"], hashes=True, python=sys.executable
+    )
+    stdout = subprocess.run(command, shell=True, check=True, capture_output=True).stdout
+    manifest = parse_manifest(stdout.decode())
+    assert manifest == build_manifest(tmp_path, excludes=["protocol.py"], hashes=True)
+
+
+def test_sync_over_sftp(tmp_path):
+    import shutil
+    from types import SimpleNamespace
+
+    from ot2util.experiment import RobotConnection
+    from ot2util.sync import build_manifest, dump_manifest
+
+    remote, local = tmp_path / "remote", tmp_path / "local"
+    (remote / "images").mkdir(parents=True)
+    (remote / "stdout.log").write_text("log")
+    (remote / "images" / "a.png").write_text("a")
+    downloaded = []
+
+    conn = RobotConnection.__new__(RobotConnection)
+    conn.conn = SimpleNamespace(close=lambda: None)
+    conn.transfer = "scp"
+    conn.run = lambda command, hide: SimpleNamespace(
+        stdout=dump_manifest(build_manifest(remote))
+    )
+    conn._sftp = lambda: SimpleNamespace(
+        get=lambda src, dst: downloaded.append(shutil.copyfile(src, dst))
+    )
+    conn._scp = None  # One scp process per file is not used
+
+    assert conn.sync(remote, local) == ["images/a.png", "stdout.log"]
+    assert (local / "images" / "a.png").read_text() == "a"
+    assert conn.sync(remote, local) == []
+    assert len(downloaded) == 2
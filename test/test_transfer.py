@@ -0,0 +1,96 @@
+import os
+import shutil
+
+
+class _LocalSFTPClient:
+    """Mimics paramiko.SFTPClient on the local filesystem."""
+
+    class _Attr:
+        def __init__(self, path):
+            self.filename = path.name
+            self.st_mode = os.stat(path).st_mode
+
+    def put(self, local, remote):
+        shutil.copyfile(local, remote)
+
+    def get(self, remote, local):
+        shutil.copyfile(remote, local)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def listdir_attr(self, path):
+        from pathlib import Path
+
+        return [self._Attr(p) for p in Path(path).iterdir()]
+
+
+def _make_tree(root):
+    (root / "images").mkdir(parents=True)
+    (root / "protocol.py").write_text("protocol")
+    (root / "stdout.log").write_text("log")
+    (root / "images" / "a.png").write_text("a")
+    (root / "images" / "a.tmp").write_text("tmp")
+
+
+def test_sftp_get_dir_excludes(tmp_path):
+    from ot2util.transfer import SFTPTransfer
+
+    _make_tree(tmp_path / "remote")
+    transfer = SFTPTransfer(_LocalSFTPClient())
+    transfer.get_dir(tmp_path / "remote", tmp_path / "local", ["protocol.py", "*.tmp"])
+
+    copied = sorted(
+        p.relative_to(tmp_path / "local").as_posix()
+        for p in (tmp_path / "local").rglob("*")
+    )
+    assert copied == ["images", "images/a.png", "stdout.log"]
+
+
+def test_sftp_put_dir_excludes(tmp_path):
+    from ot2util.transfer import SFTPTransfer
+
+    _make_tree(tmp_path / "local")
+    transfer = SFTPTransfer(_LocalSFTPClient())
+    transfer.put_dir(tmp_path / "local", tmp_path / "remote", ["images"])
+
+    copied = sorted(p.name for p in (tmp_path / "remote").rglob("*"))
+    assert copied == ["protocol.py", "stdout.log"]
+
+
+def _stream(tmp_path, compression):
+    import subprocess
+
+    from ot2util.transfer import extract_tar_stream, tar_command
+
+    command = tar_command(tmp_path / "remote", ["protocol.py"], compression)
+    proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+    extract_tar_stream(proc.stdout, tmp_path / "local", compression)
+    assert proc.wait() == 0
+
+
+def test_extract_tar_stream(tmp_path):
+    _make_tree(tmp_path / "remote")
+    for compression in ["none", "gzip"]:
+        _stream(tmp_path, compression)
+        copied = sorted(
+            p.relative_to(tmp_path / "local").as_posix()
+            for p in (tmp_path / "local").rglob("*")
+        )
+        assert copied == ["images", "images/a.png", "images/a.tmp", "stdout.log"]
+
+
+def test_tar_command_fails_for_missing_path(tmp_path):
+    import subprocess
+
+    from ot2util.transfer import tar_command
+
+    for compression in ["none", "gzip"]:
+        command = tar_command(tmp_path / "missing", compression=compression)
+        proc = subprocess.run(command, shell=True, capture_output=True)
+        # Not the exit status of the compressor
+        assert proc.returncode != 0
+        assert b"missing" in proc.stderr
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from ot2util.config import ProtocolConfig
+from ot2util.experiment import Experiment
+from ot2util.workflow.workflow import AsyncWorkflow, ExperimentBatcher, Workflow
+
+
+def _finish_later(
+    future: "Future[Experiment]", output_dir: Path, name: str, delay: float
+) -> None:
+    experiment = Experiment(name, output_dir, ProtocolConfig())
+    timer = threading.Timer(delay, future.set_result, args=(experiment,))
+    timer.start()
+
+
+def test_wait_min_count_and_as_completed(tmp_path: Path) -> None:
+    workflow = Workflow()
+    futures: List[Future[Experiment]] = [Future() for _ in range(3)]
+    workflow.futures.update(futures)
+    _finish_later(futures[0], tmp_path, "fast", 0.01)
+    _finish_later(futures[1], tmp_path, "slow", 0.2)
+
+    # Only the fast experiment, the others are left running
+    assert [e.name for e in workflow.wait(min_count=1)] == ["fast"]
+    assert len(workflow.futures) == 2
+    assert workflow.wait(timeout=0) == []
+
+    with pytest.raises(TimeoutError):
+        for experiment in workflow.as_completed(timeout=0.5):
+            assert experiment.name == "slow"
+    assert workflow.futures == {futures[2]}
+
+
+def test_batcher_cancellation(tmp_path: Path) -> None:
+    submitted: List[List[str]] = []
+    sources: List[Future[Experiment]] = [Future() for _ in range(3)]
+
+    def submit_batch(requests: List[Tuple[str, Dict[str, Any]]]) -> List[Future]:
+        submitted.append([name for name, _ in requests])
+        return sources[: len(requests)]
+
+    batcher = ExperimentBatcher(submit_batch, batch_size=5, batch_window=0)
+    targets = [batcher.add(f"experiment-{i}") for i in range(4)]
+    # Cancelled before the batch was launched, it is not submitted
+    targets[3].cancel()
+    batcher.flush()
+    assert submitted == [["experiment-0", "experiment-1", "experiment-2"]]
+
+    # Cancelling a launched experiment reaches the queued batch
+    targets[1].cancel()
+    assert sources[1].cancelled()
+    sources[0].cancel()
+    sources[2].set_exception(RuntimeError("robot failed"))
+    assert targets[0].cancelled()
+    with pytest.raises(RuntimeError):
+        targets[2].result(timeout=0)
+
+
+def test_async_as_completed(tmp_path: Path) -> None:
+    async def main() -> List[str]:
+        workflow = AsyncWorkflow()
+        for name, delay in [("slow", 0.05), ("fast", 0.01)]:
+            workflow.futures.add(
+                asyncio.ensure_future(_experiment_after(tmp_path, name, delay))
+            )
+        return [experiment.name async for experiment in workflow.as_completed()]
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) == ["fast", "slow"]
+    finally:
+        loop.close()
+
+
+async def _experiment_after(output_dir: Path, name: str, delay: float) -> Experiment:
+    await asyncio.sleep(delay)
+    return Experiment(name, output_dir, ProtocolConfig())
+
+
+def test_async_workflow_unsupported(tmp_path: Path) -> None:
+    from ot2util.workflow import AsyncColorMixingWorkflow, ColorMixingWorkflowConfig
+
+    config = ColorMixingWorkflowConfig(output_dir=tmp_path, max_queued=4)
+    with pytest.raises(ValueError, match="max_queued"):
+        AsyncColorMixingWorkflow(config)
+    AsyncColorMixingWorkflow(ColorMixingWorkflowConfig(output_dir=tmp_path))